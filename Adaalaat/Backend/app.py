@@ -3,8 +3,14 @@ from flask_cors import CORS
 from config import Config
 
 
-def create_app():
-    """Application factory — creates and configures the Flask app."""
+def create_app(warm_up=None):
+    """
+    Application factory — creates and configures the Flask app.
+
+    Args:
+        warm_up: Start the background warm-up (see utils/warmup.py);
+                 None follows config.json warmup.enabled
+    """
 
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -32,6 +38,21 @@ def create_app():
     def health():
         return jsonify({"status": "ok", "service": "adaalat-backend"}), 200
 
+    # ── Readiness (503 until this worker is warm) ───────────────
+    @app.route("/api/ready", methods=["GET"])
+    def ready():
+        from utils.warmup import get_warmup
+
+        status = get_warmup().readiness()
+        return jsonify(status), 200 if status["ready"] else 503
+
+    # ── Metrics (this worker's RAG pipeline instruments) ────────
+    @app.route("/api/metrics", methods=["GET"])
+    def metrics():
+        from rag.metrics import snapshot
+
+        return jsonify(snapshot()), 200
+
     # ── Error Handlers ──────────────────────────────────────────
     @app.errorhandler(400)
     def bad_request(e):
@@ -45,6 +66,13 @@ def create_app():
     def internal_error(e):
         return jsonify({"error": "Internal server error"}), 500
 
+    # ── Warm-up (index, clients, priming query) ─────────────────
+    from config import load_json_config
+    from utils.warmup import get_warmup
+
+    if load_json_config().get("warmup", {}).get("enabled", False) if warm_up is None else warm_up:
+        get_warmup().start()
+
     return app
 
 
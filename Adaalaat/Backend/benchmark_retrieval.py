@@ -0,0 +1,131 @@
+import os
+import sys
+import time
+import argparse
+import logging
+
+import numpy as np
+
+# Add the Backend directory to the Python path so we can import rag modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from rag.ann_index import ExactIndex, IVFFlatIndex
+from rag.quantization import QuantizedMatrix, QuantizedExactIndex
+
+logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (matrix / norms).astype(np.float32)
+
+
+def load_corpus(synthetic=0, dim=384, seed=0):
+    """
+    Return the embedding matrix to benchmark against and its live mask.
+
+    Uses the stored legal document index by default, whose tombstoned
+    rows are masked out of every search (None = all rows live);
+    --synthetic N generates a clustered corpus of N vectors to simulate
+    a larger one.
+    """
+    if not synthetic:
+        from rag import local_pdf_retriever
+
+        local_pdf_retriever._ensure_loaded()
+        alive = local_pdf_retriever._cached_alive
+        return np.asarray(local_pdf_retriever._cached_embeddings), None if alive is None else np.asarray(alive)
+
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((max(8, synthetic // 200), dim))
+    members = rng.integers(0, len(topics), synthetic)
+    return _normalize(topics[members] + 0.6 * rng.standard_normal((synthetic, dim))), None
+
+
+def make_queries(embeddings, alive, num_queries, noise=0.05, seed=1):
+    """Perturbed copies of random live chunks — realistic neighbours, no API calls."""
+    rng = np.random.default_rng(seed)
+    live_ids = np.arange(embeddings.shape[0]) if alive is None else np.flatnonzero(alive)
+    picks = rng.choice(live_ids, num_queries, replace=len(live_ids) < num_queries)
+    base = np.asarray(embeddings[picks])
+    return _normalize(base + noise * rng.standard_normal(base.shape))
+
+
+def _timed_search(index, queries, k, **kwargs):
+    start = time.perf_counter()
+    indices, _ = index.search(queries, k, **kwargs)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return indices, elapsed_ms / len(queries)
+
+
+def recall_at_k(approx, exact, alive=None):
+    """Share of the live exact neighbours found; dead rows count on neither side."""
+    hits = []
+    for a, e in zip(approx, exact):
+        a = a[a >= 0]
+        if alive is not None:
+            a, e = a[alive[a]], e[alive[e]]
+        if len(e):
+            hits.append(len(np.intersect1d(a, e)) / len(e))
+    return float(np.mean(hits)) if hits else 0.0
+
+
+def run_ann_benchmark(embeddings, alive, queries, k, nlist, nprobes):
+    exact_indices, exact_ms = _timed_search(ExactIndex(embeddings, alive), queries, k)
+    logger.info(f"exact        recall@{k}=1.0000  {exact_ms:.3f} ms/query")
+
+    start = time.perf_counter()
+    ivf = IVFFlatIndex.build(embeddings, nlist=nlist, alive=alive)
+    logger.info(f"IVF build: {time.perf_counter() - start:.2f}s ({ivf.nlist} lists)")
+
+    for nprobe in nprobes:
+        approx, ivf_ms = _timed_search(ivf, queries, k, nprobe=nprobe)
+        logger.info(
+            f"ivf nprobe={nprobe:<4} recall@{k}={recall_at_k(approx, exact_indices, alive):.4f}  "
+            f"{ivf_ms:.3f} ms/query"
+        )
+
+
+def run_quantization_benchmark(embeddings, alive, queries, k, rescore_candidates):
+    """Recall and latency of float16 / int8 storage, with and without float32 rescoring."""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    exact_indices, exact_ms = _timed_search(ExactIndex(embeddings, alive), queries, k)
+    logger.info(
+        f"float32                 recall@{k}=1.0000  {exact_ms:.3f} ms/query  "
+        f"{embeddings.nbytes / 1e6:.1f} MB"
+    )
+
+    for storage in ("float16", "int8"):
+        matrix = QuantizedMatrix.quantize(embeddings, storage)
+        index = QuantizedExactIndex(embeddings, matrix, alive)
+        for candidates in (0, rescore_candidates):
+            approx, ms = _timed_search(index, queries, k, rescore_candidates=candidates)
+            label = f"{storage} rescore={candidates}"
+            logger.info(
+                f"{label:<23} recall@{k}={recall_at_k(approx, exact_indices, alive):.4f}  {ms:.3f} ms/query  "
+                f"{matrix.nbytes / 1e6:.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark local retrieval against exact search")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the stored index")
+    parser.add_argument("--queries", type=int, default=200, help="Number of benchmark queries")
+    parser.add_argument("--k", type=int, default=8, help="Results per query")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(N))")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32], help="nprobe values to sweep")
+    parser.add_argument("--rescore", type=int, default=64, help="Candidates rescored in float32 after a quantized pass")
+    parser.add_argument("--only", choices=["ann", "quantization"], default=None, help="Run just one benchmark")
+    args = parser.parse_args()
+
+    corpus, live_mask = load_corpus(args.synthetic)
+    num_live = corpus.shape[0] if live_mask is None else int(live_mask.sum())
+    logger.info(f"Corpus: {corpus.shape[0]} vectors, {num_live} live (dim={corpus.shape[1]})")
+    benchmark_queries = make_queries(corpus, live_mask, args.queries)
+
+    if args.only != "quantization":
+        run_ann_benchmark(corpus, live_mask, benchmark_queries, args.k, args.nlist, args.nprobe)
+    if args.only != "ann":
+        run_quantization_benchmark(corpus, live_mask, benchmark_queries, args.k, args.rescore)
@@ -1,4 +1,5 @@
 import os
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -20,3 +21,24 @@ class Config:
 
     # LLM Model
     LLM_MODEL = os.getenv("LLM_MODEL", "meta-llama/Llama-3.1-8B-Instruct")
+
+    # Case store (defaults to Backend/uploads/cases.json); point test runs elsewhere
+    CASES_FILE = os.getenv("CASES_FILE", "")
+
+
+# ── Model / RAG settings (config.json) ──────────────────────────
+CONFIG_JSON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+
+def load_json_config(config_path=None):
+    """
+    Load the model and RAG settings from Backend/config.json.
+
+    Returns an empty dict if the file is missing so callers can fall
+    back to their own defaults.
+    """
+    try:
+        with open(config_path or CONFIG_JSON_PATH, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
@@ -24,9 +24,23 @@ Supabase Tables Required:
     └─────────────────┘
 """
 
+import os
+import threading
+
 from config import Config
 
 _supabase_client = None
+_supabase_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The client's HTTP connections belong to the parent process
+    global _supabase_client, _supabase_lock
+    _supabase_client = None
+    _supabase_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def get_supabase_client():
@@ -41,14 +55,18 @@ def get_supabase_client():
     """
     global _supabase_client
 
-    if _supabase_client is None:
-        if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
-            raise ValueError(
-                "SUPABASE_URL and SUPABASE_KEY must be set in .env. "
-                "Get these from your Supabase project dashboard."
-            )
+    if _supabase_client is not None:
+        return _supabase_client
+
+    with _supabase_lock:
+        if _supabase_client is None:
+            if not Config.SUPABASE_URL or not Config.SUPABASE_KEY:
+                raise ValueError(
+                    "SUPABASE_URL and SUPABASE_KEY must be set in .env. "
+                    "Get these from your Supabase project dashboard."
+                )
 
-        from supabase import create_client
-        _supabase_client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
+            from supabase import create_client
+            _supabase_client = create_client(Config.SUPABASE_URL, Config.SUPABASE_KEY)
 
-    return _supabase_client
+        return _supabase_client
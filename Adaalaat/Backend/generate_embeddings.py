@@ -32,7 +32,7 @@ def generate_embeddings_excel():
         return
         
     logger.info("Step 2: Chunking text...")
-    chunks = _chunk_pages(pages, chunk_size=512, overlap=50)
+    chunks = _chunk_pages(pages)
     
     logger.info("Step 3: Generating vector embeddings...")
     # This calls the HF Inference API through get_shared_embedding_model()
@@ -27,7 +27,7 @@ def generate_local_embeddings_excel():
         return
         
     logger.info("Step 2: Chunking text...")
-    chunks = _chunk_pages(pages, chunk_size=512, overlap=50)
+    chunks = _chunk_pages(pages)
     texts = [c["text"] for c in chunks]
     
     logger.info(f"Step 3: Loading local embedding model (BAAI/bge-small-en-v1.5) ...")
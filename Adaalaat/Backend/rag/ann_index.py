@@ -0,0 +1,275 @@
+"""
+Nearest-Neighbour Indexes
+
+Pluggable search backends for the local retriever. All of them work on
+L2-normalized float32 embeddings, so inner product == cosine similarity.
+
+    ExactIndex    brute-force matrix multiply over every chunk
+    IVFFlatIndex  inverted-file index: spherical k-means centroids, and
+                  at query time only the `nprobe` closest lists are
+                  scanned. Raising nprobe trades latency for recall.
+
+Rows tombstoned by the index store (see index_store.py) are passed in as
+an `alive` mask and never returned.
+
+Pure NumPy, CPU-only and offline. The IVF structure is persisted next
+to the embedding matrix (ivf.npz) and rebuilt when the index key changes.
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IVF_FILE = "ivf.npz"
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row-wise indices of the k highest scores, best first.
+
+    np.argpartition selects the top k in O(N); only those k are sorted.
+    """
+    num_rows, num_cols = scores.shape
+    k = min(k, num_cols)
+    if k <= 0:
+        return np.empty((num_rows, 0), dtype=np.int64)
+
+    if k < num_cols:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(num_cols), (num_rows, num_cols))
+
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class ExactIndex:
+    """Brute-force cosine search over the full embedding matrix."""
+
+    def __init__(self, embeddings: np.ndarray, alive: Optional[np.ndarray] = None):
+        self.embeddings = embeddings
+        self.dead = None if alive is None or alive.all() else ~alive
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            queries: (num_queries, dim) normalized query embeddings
+            k: Results per query
+
+        Returns:
+            (indices, scores), both of shape (num_queries, k)
+        """
+        similarities = queries @ self.embeddings.T
+        if self.dead is not None:
+            similarities[:, self.dead] = -np.inf
+        indices = top_k_indices(similarities, k)
+        return indices, np.take_along_axis(similarities, indices, axis=1)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with exact scoring inside the probed lists.
+
+    Chunk ids are stored grouped by centroid (CSR layout: `list_offsets`
+    into `list_ids`), so probing a list is a contiguous slice.
+    """
+
+    def __init__(self, embeddings: np.ndarray, centroids: np.ndarray,
+                 list_offsets: np.ndarray, list_ids: np.ndarray, nprobe: int = 8):
+        self.embeddings = embeddings
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, nlist: Optional[int] = None, nprobe: int = 8,
+              kmeans_iters: int = 20, seed: int = 0,
+              alive: Optional[np.ndarray] = None) -> "IVFFlatIndex":
+        """
+        Cluster the live embeddings with spherical k-means and bucket them.
+
+        Args:
+            embeddings: (num_chunks, dim) normalized embeddings
+            alive: Optional bool mask; dead rows are left out of every list
+            nlist: Number of lists; defaults to ~4 * sqrt(num_chunks)
+            nprobe: Lists scanned per query
+            kmeans_iters: Lloyd iterations
+            seed: RNG seed, for reproducible builds
+        """
+        live_ids = np.arange(embeddings.shape[0]) if alive is None else np.flatnonzero(alive)
+        live = embeddings if alive is None else embeddings[live_ids]
+        num_chunks = live.shape[0]
+        nlist = nlist or max(1, int(round(4 * np.sqrt(num_chunks))))
+        nlist = max(1, min(nlist, num_chunks))
+
+        centroids = _spherical_kmeans(live, nlist, kmeans_iters, seed)
+        assignments = _assign(live, centroids)
+
+        list_ids = live_ids[np.argsort(assignments, kind="stable")].astype(np.int64)
+        counts = np.bincount(assignments, minlength=nlist)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+        logger.info(
+            f"Built IVF index: {num_chunks} chunks in {nlist} lists "
+            f"(largest list: {counts.max()})"
+        )
+        return cls(embeddings, centroids, list_offsets, list_ids, nprobe=nprobe)
+
+    def search(self, queries: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            queries: (num_queries, dim) normalized query embeddings
+            k: Results per query
+            nprobe: Override the number of lists scanned
+
+        Returns:
+            (indices, scores), both of shape (num_queries, k). Rows with
+            fewer than k candidates are padded with index -1 / score -inf.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k_indices(queries @ self.centroids.T, nprobe)
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        for row, lists in enumerate(probes):
+            # Sorted ids keep the gather from the (memory-mapped) matrix sequential
+            candidates = np.sort(np.concatenate([
+                self.list_ids[self.list_offsets[l]:self.list_offsets[l + 1]] for l in lists
+            ]))
+            if candidates.size == 0:
+                continue
+            candidate_scores = self.embeddings[candidates] @ queries[row]
+            best = top_k_indices(candidate_scores[np.newaxis, :], k)[0]
+            indices[row, :best.size] = candidates[best]
+            scores[row, :best.size] = candidate_scores[best]
+
+        return indices, scores
+
+    def save(self, path: str, key: Dict):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_ids=self.list_ids,
+            key=np.array(json.dumps(key, sort_keys=True)),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, key: Dict, embeddings: np.ndarray, nprobe: int = 8) -> Optional["IVFFlatIndex"]:
+        """Load a stored IVF index, or None if it is missing or built for another key."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["key"]) != json.dumps(key, sort_keys=True):
+                    return None
+                return cls(
+                    embeddings,
+                    data["centroids"],
+                    data["list_offsets"],
+                    data["list_ids"],
+                    nprobe=nprobe,
+                )
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+
+def _assign(embeddings: np.ndarray, centroids: np.ndarray, block: int = 65536) -> np.ndarray:
+    """Nearest centroid per row, in blocks to bound the (rows, nlist) score matrix."""
+    assignments = np.empty(embeddings.shape[0], dtype=np.int64)
+    for start in range(0, embeddings.shape[0], block):
+        scores = embeddings[start:start + block] @ centroids.T
+        assignments[start:start + block] = scores.argmax(axis=1)
+    return assignments
+
+
+def _spherical_kmeans(embeddings: np.ndarray, nlist: int, iters: int, seed: int,
+                      max_train_per_list: int = 256) -> np.ndarray:
+    """k-means on the unit sphere (cosine), trained on a sample of the rows."""
+    rng = np.random.default_rng(seed)
+    num_chunks = embeddings.shape[0]
+
+    sample_size = min(num_chunks, nlist * max_train_per_list)
+    sample = np.asarray(embeddings[np.sort(rng.choice(num_chunks, sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iters):
+        assignments = _assign(sample, centroids)
+        counts = np.bincount(assignments, minlength=nlist)
+        order = np.argsort(assignments, kind="stable")
+        nonempty = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+
+        # Re-seed empty lists with random sample points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        centroids = (sums / norms).astype(np.float32)
+
+    return centroids
+
+
+def build_ann_index(settings: Dict, embeddings: np.ndarray, index_dir: str, key: Dict,
+                    alive: Optional[np.ndarray] = None):
+    """
+    Create the search backend selected in config.json (rag_agent.ann).
+
+    For "ivf", a stored ivf.npz built for the same index key (which
+    includes the index version) and IVF parameters is reused; otherwise
+    it is built and saved. For "exact", `storage` ("float16" / "int8")
+    selects a quantized first pass with float32 rescoring (see
+    quantization.py).
+    """
+    ann_type = settings.get("type", "exact")
+    storage = settings.get("storage", "float32")
+    if embeddings.shape[0] == 0:
+        return ExactIndex(embeddings, alive)
+    if ann_type == "exact":
+        if storage == "float32":
+            return ExactIndex(embeddings, alive)
+        from rag.quantization import build_quantized_index
+
+        return build_quantized_index(settings, embeddings, index_dir, key, alive)
+    if ann_type != "ivf":
+        raise ValueError(f"Unknown ANN index type: {ann_type!r} (expected 'exact' or 'ivf')")
+
+    ivf_key = {
+        "index": key,
+        "nlist": settings.get("nlist"),
+        "kmeans_iters": settings.get("kmeans_iters", 20),
+        "seed": settings.get("seed", 0),
+    }
+    path = os.path.join(index_dir, IVF_FILE)
+    nprobe = settings.get("nprobe", 8)
+    if storage != "float32":
+        logger.warning(f"ann.storage={storage!r} is only used by the exact index — IVF scans float32")
+
+    index = IVFFlatIndex.load(path, ivf_key, embeddings, nprobe=nprobe)
+    if index is None:
+        index = IVFFlatIndex.build(
+            embeddings,
+            nlist=ivf_key["nlist"],
+            nprobe=nprobe,
+            kmeans_iters=ivf_key["kmeans_iters"],
+            seed=ivf_key["seed"],
+            alive=alive,
+        )
+        index.save(path, ivf_key)
+    return index
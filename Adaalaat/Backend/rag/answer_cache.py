@@ -0,0 +1,148 @@
+"""
+Semantic Answer Cache
+
+Caches finished orchestrator answers (answer + sources) by query
+meaning rather than exact text: a lookup embeds the query and returns
+the stored answer whose query embedding has the highest cosine
+similarity, if it clears `threshold`. "Landlord wants me out without
+notice" and "my landlord is evicting me with no notice" share an entry.
+
+Entries are scoped to the conversation: an answer given with some chat
+history is only reused for the same history (empty history is its own
+scope). Entries expire after `ttl_seconds`, the least recently used
+are evicted beyond `max_size`, and everything is dropped when the
+legal index version changes, since answers cite its chunks.
+
+Embeddings live in one preallocated matrix, so a lookup is a single
+matrix-vector product over at most `max_size` rows.
+"""
+
+import time
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from rag.metrics import get_counter, get_histogram
+
+logger = logging.getLogger(__name__)
+
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.92, 0.94, 0.96, 0.98, 1.0)
+
+
+def history_scope(history: Sequence) -> str:
+    """Key identifying a chat history ('' for none)."""
+    if not history:
+        return ""
+    turns = [
+        (str(getattr(m, "role", "")).split(".")[-1], " ".join(str(getattr(m, "content", "")).split()))
+        for m in history
+    ]
+    return hashlib.sha256(json.dumps(turns).encode("utf-8")).hexdigest()
+
+
+class SemanticAnswerCache:
+    """Thread-safe LRU + TTL cache keyed by query embedding similarity."""
+
+    def __init__(self, threshold: float = 0.92, max_size: int = 512, ttl_seconds: float = 3600):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()  # slot -> entry, LRU order
+        self._matrix: Optional[np.ndarray] = None
+        self._free_slots = list(range(max_size - 1, -1, -1))
+        self._index_version = None
+
+        self._hits = get_counter("answer_cache.hits")
+        self._misses = get_counter("answer_cache.misses")
+        self._invalidations = get_counter("answer_cache.invalidations")
+        self._similarity = get_histogram("answer_cache.best_similarity", SIMILARITY_BUCKETS)
+
+    def _check_index_version(self, index_version):
+        """Drop every entry if the legal index changed since they were stored."""
+        if index_version != self._index_version:
+            if self._entries:
+                logger.info(
+                    f"[ANSWER CACHE] Index version {self._index_version} → {index_version}, "
+                    f"dropping {len(self._entries)} answers"
+                )
+                self._invalidations.inc()
+            self._clear()
+            self._index_version = index_version
+
+    def _clear(self):
+        self._entries.clear()
+        self._free_slots = list(range(self.max_size - 1, -1, -1))
+
+    def _evict(self, slot: int):
+        del self._entries[slot]
+        self._free_slots.append(slot)
+
+    def lookup(self, embedding: np.ndarray, history: Sequence = (), index_version=None) -> Optional[Dict]:
+        """
+        Return the cached result for the most similar query in the same
+        history scope, or None.
+        """
+        scope = history_scope(history)
+        now = time.monotonic()
+        with self._lock:
+            self._check_index_version(index_version)
+
+            for slot in [s for s, e in self._entries.items() if e["expires_at"] <= now]:
+                self._evict(slot)
+
+            slots = [s for s, e in self._entries.items() if e["scope"] == scope]
+            best_slot, best_similarity = None, 0.0
+            if slots:
+                similarities = self._matrix[slots] @ embedding
+                best = int(np.argmax(similarities))
+                best_slot, best_similarity = slots[best], float(similarities[best])
+                self._similarity.observe(best_similarity)
+
+            if best_slot is None or best_similarity < self.threshold:
+                self._misses.inc()
+                return None
+
+            self._entries.move_to_end(best_slot)
+            self._hits.inc()
+            entry = self._entries[best_slot]
+
+        logger.info(
+            f"[ANSWER CACHE] Hit (similarity {best_similarity:.3f}) — "
+            f"reusing answer to '{entry['query'][:50]}'"
+        )
+        return entry["result"]
+
+    def store(self, query: str, embedding: np.ndarray, result: Dict, history: Sequence = (),
+              index_version=None):
+        """Cache a finished result, evicting the least recently used entry if full."""
+        with self._lock:
+            self._check_index_version(index_version)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_size, embedding.shape[0]), dtype=np.float32)
+            if not self._free_slots:
+                self._evict(next(iter(self._entries)))
+
+            slot = self._free_slots.pop()
+            self._matrix[slot] = embedding
+            self._entries[slot] = {
+                "query": query,
+                "scope": history_scope(history),
+                "result": result,
+                "expires_at": time.monotonic() + self.ttl_seconds,
+            }
+
+    def stats(self) -> Dict:
+        hits, misses = self._hits.value, self._misses.value
+        return {
+            "entries": len(self._entries),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "invalidations": self._invalidations.value,
+        }
@@ -0,0 +1,189 @@
+"""
+BM25 Lexical Index
+
+In-process inverted index over the retriever's chunks, scored with
+Okapi BM25. Exact-term matching catches statute lookups ("Section 106
+Transfer of Property Act") that dense embeddings tend to blur, and it
+needs no API call, so it doubles as the fallback when the embedding
+endpoint is slow or down.
+
+Posting lists are stored CSR-style in flat NumPy arrays:
+    offsets[t]:offsets[t+1]  slice of doc_ids / tfs for term id t
+and persisted next to the embedding matrix (bm25.npz).
+"""
+
+import os
+import re
+import json
+import logging
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from rag.ann_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+BM25_FILE = "bm25.npz"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Only the most frequent function words — legal terms like "act", "notice"
+# or "section" must stay searchable
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it of on or that the this to was were with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case alphanumeric terms; numbers are kept (section numbers matter)."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of documents (chunks)."""
+
+    def __init__(self, terms: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray, k1: float = 1.5, b: float = 0.75):
+        self.terms = terms
+        self.vocab = {term: i for i, term in enumerate(terms.tolist())}
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.k1 = k1
+        self.b = b
+
+        # Tombstoned documents have length 0 and take no part in the statistics
+        self.num_live = int((doc_lengths > 0).sum())
+        doc_freq = np.diff(offsets)
+        self.idf = np.log(1 + (max(self.num_live, 1) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        avg_length = doc_lengths[doc_lengths > 0].mean() if self.num_live else 1.0
+        # Per-document length normalization, precomputed once
+        self.length_norm = (k1 * (1 - b + b * doc_lengths / avg_length)).astype(np.float32)
+
+    @classmethod
+    def build(cls, texts: List[str], alive: Optional[np.ndarray] = None,
+              k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """Tokenize every live text and pack the postings."""
+        vocab: Dict[str, int] = {}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+
+        for doc_id, text in enumerate(texts):
+            if alive is not None and not alive[doc_id]:
+                continue
+            tokens = tokenize(text)
+            doc_lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocab)), out=offsets[1:])
+
+        terms = np.array(sorted(vocab, key=vocab.get), dtype=str)
+        logger.info(f"Built BM25 index: {len(vocab)} terms, {len(doc_ids)} postings")
+        return cls(
+            terms,
+            offsets,
+            np.asarray(doc_ids, dtype=np.int32)[order],
+            np.asarray(tfs, dtype=np.float32)[order],
+            doc_lengths,
+            k1=k1,
+            b=b,
+        )
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document for one query."""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, tf = self.doc_ids[start:end], self.tfs[start:end]
+            # Each doc appears once per term, so a fancy-indexed add is safe
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + self.length_norm[docs])
+        return scores
+
+    def search(self, queries: List[str], k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            (indices, scores), both (num_queries, k); documents with no
+            matching term have score 0. No columns if no document is live.
+        """
+        if not self.num_live:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        scores = np.stack([self.scores(q) for q in queries]) if queries else np.zeros((0, 0))
+        indices = top_k_indices(scores, k)
+        return indices, np.take_along_axis(scores, indices, axis=1)
+
+    def save(self, path: str, key: Dict):
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            terms=self.terms,
+            offsets=self.offsets,
+            doc_ids=self.doc_ids,
+            tfs=self.tfs,
+            doc_lengths=self.doc_lengths,
+            key=np.array(json.dumps(key, sort_keys=True)),
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, key: Dict, k1: float = 1.5, b: float = 0.75) -> Optional["BM25Index"]:
+        """Load a stored index, or None if it is missing or built for another key."""
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["key"]) != json.dumps(key, sort_keys=True):
+                    return None
+                return cls(
+                    data["terms"], data["offsets"], data["doc_ids"], data["tfs"],
+                    data["doc_lengths"], k1=k1, b=b,
+                )
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+
+def build_bm25_index(settings: Dict, chunks: List[Dict], alive: np.ndarray,
+                     index_dir: str, key: Dict) -> BM25Index:
+    """Load bm25.npz if it was built for this index version, else build and save it."""
+    k1, b = settings.get("k1", 1.5), settings.get("b", 0.75)
+    path = os.path.join(index_dir, BM25_FILE)
+
+    index = BM25Index.load(path, key, k1=k1, b=b)
+    if index is None:
+        index = BM25Index.build([c["text"] for c in chunks], alive, k1=k1, b=b)
+        index.save(path, key)
+    return index
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int = 60) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuse ranked id lists: score(d) = sum over lists of 1 / (rrf_k + rank).
+
+    Args:
+        rankings: 1-D arrays of document ids, best first (-1 entries ignored)
+        k: Number of fused results
+        rrf_k: Damping constant (60 in the original RRF paper)
+
+    Returns:
+        (ids, fused_scores), best first
+    """
+    ids = np.concatenate([r[r >= 0] for r in rankings])
+    contributions = np.concatenate([
+        1.0 / (rrf_k + 1 + np.flatnonzero(r >= 0)) for r in rankings
+    ])
+    if ids.size == 0:
+        return ids.astype(np.int64), contributions
+
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions)
+    best = top_k_indices(fused[np.newaxis, :], k)[0]
+    return unique_ids[best], fused[best]
@@ -0,0 +1,225 @@
+"""
+Caches
+
+Small, thread-safe caches shared by the RAG pipeline:
+
+    LRUCache     in-process, bounded, with optional TTL
+    SQLiteCache  on-disk tier (bytes values) that survives restarts and
+                 is shared by every worker on the host
+
+Both keep hit/miss/eviction counters, exposed through stats().
+A forked child gets new locks and opens its own SQLite connections.
+"""
+
+import os
+import time
+import sqlite3
+import weakref
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+_caches: "weakref.WeakSet" = weakref.WeakSet()
+
+
+class LRUCache:
+    """Bounded least-recently-used cache with an optional time-to-live."""
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the cached value (refreshing its recency) or `default`."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Insert or replace a value, evicting the least recently used entries."""
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SQLiteCache:
+    """
+    Key/value cache of bytes stored in a SQLite file.
+
+    Uses WAL mode so several gunicorn workers can read and write the
+    same file. Each thread gets its own connection. When the table grows
+    past `max_entries`, the least recently used rows are pruned.
+    """
+
+    def __init__(self, path: str, ttl_seconds: Optional[float] = None, max_entries: int = 100_000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        _caches.add(self)
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+        conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+
+            value, created_at = row
+            now = time.time()
+            if self.ttl_seconds and created_at + self.ttl_seconds <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                conn.commit()
+                self._count("misses")
+                return None
+
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self._count("hits")
+            return value
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache read failed ({self.path}): {e}")
+            return None
+
+    def set(self, key: str, value: bytes):
+        try:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), now, now),
+            )
+            conn.commit()
+            self._maybe_prune(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache write failed ({self.path}): {e}")
+
+    def clear(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM cache")
+        conn.commit()
+
+    def _maybe_prune(self, conn: sqlite3.Connection):
+        # Counting rows on every write is wasteful — check every 100 writes
+        with self._lock:
+            self._writes_since_prune += 1
+            if self._writes_since_prune < 100:
+                return
+            self._writes_since_prune = 0
+
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+            self._count("evictions", excess)
+
+    def _count(self, counter: str, amount: int = 1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def _reset_after_fork():
+    # SQLite connections must not cross fork(); each cache reconnects lazily
+    for cache in list(_caches):
+        cache._lock = threading.Lock()
+        if isinstance(cache, SQLiteCache):
+            cache._local = threading.local()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,135 @@
+"""
+Chunking
+
+Streaming, token-aware chunker for legal text.
+
+Pages are split into sentences, and sentences are packed into chunks
+up to `max_tokens` as counted by the embedding model's tokenizer. A
+"Section N" heading starts a new chunk (unless the current one is still
+nearly empty), so statutes are not cut mid-provision. Consecutive chunks
+share up to `overlap_tokens` of whole trailing sentences. A single
+sentence longer than the limit is cut on token boundaries.
+
+Chunks are yielded lazily — nothing is built per page or per document.
+"""
+
+import re
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from rag.tokenization import TokenCounter
+
+# Bump when the chunking rules change, so stored indexes are rebuilt
+CHUNKER_VERSION = "sentence-token-1"
+
+# Line-leading headings like "Section 106.", "SECTION 4A", "Sec. 12", or "106. Duration of ..."
+SECTION_RE = re.compile(
+    r"^[ \t]*(?:(?:Section|SECTION|Sec\.)\s+\d+[A-Z]?\b|\d+[A-Z]?\.\s+[A-Z])",
+    re.MULTILINE,
+)
+
+# Sentence ends: terminal punctuation followed by whitespace and an upper-case
+# letter/opening bracket/quote, or a blank line
+SENTENCE_END_RE = re.compile(r"(?<=[.!?;:])\s+(?=[A-Z(\"'\[])|\n\s*\n")
+
+
+def split_sentences(text: str) -> Iterator[Tuple[int, str, bool]]:
+    """
+    Yield (char_start, sentence, starts_section) for each sentence.
+
+    The text is first cut at section headings, then each section into
+    sentences; the first sentence of each section has starts_section=True.
+    """
+    bounds = [m.start() for m in SECTION_RE.finditer(text)]
+    if not bounds or bounds[0] != 0:
+        bounds.insert(0, 0)
+    bounds.append(len(text))
+
+    for section_index, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        first = section_index > 0 or SECTION_RE.match(text) is not None
+        cursor = start
+        for match in list(SENTENCE_END_RE.finditer(text, start, end)) + [None]:
+            piece_end = match.start() if match else end
+            piece = text[cursor:piece_end]
+            stripped = piece.strip()
+            if stripped:
+                yield cursor + len(piece) - len(piece.lstrip()), stripped, first
+                first = False
+            if match:
+                cursor = match.end()
+
+
+def iter_chunks(pages: Iterable[Dict], counter: TokenCounter, max_tokens: int = 480,
+                overlap_tokens: int = 48) -> Iterator[Dict]:
+    """
+    Pack page sentences into token-bounded chunks.
+
+    Args:
+        pages: Iterable of {"text", "page"} dicts (may be a generator)
+        counter: Token counter for the embedding model
+        max_tokens: Upper bound on tokens per chunk (leave room for [CLS]/[SEP])
+        overlap_tokens: Tokens of trailing whole sentences repeated in the next chunk
+
+    Yields:
+        {"text", "page", "char_start", "num_tokens"}
+    """
+    min_tokens = max_tokens // 4
+
+    for page in pages:
+        page_num = page["page"]
+        current: List[Tuple[int, str, int]] = []  # (char_start, sentence, tokens)
+        current_tokens = 0
+
+        for char_start, sentence, starts_section in split_sentences(page["text"]):
+            pieces = _fit_sentence(char_start, sentence, counter, max_tokens)
+            for piece_index, (piece_start, piece, tokens) in enumerate(pieces):
+                is_heading = starts_section and piece_index == 0
+
+                if current and (current_tokens + tokens > max_tokens
+                                or (is_heading and current_tokens >= min_tokens)):
+                    yield _make_chunk(current, current_tokens, page_num)
+                    # Overlap with the previous chunk, but never across a section boundary
+                    current = [] if is_heading else _overlap_tail(current, overlap_tokens, max_tokens - tokens)
+                    current_tokens = sum(t for _, _, t in current)
+
+                current.append((piece_start, piece, tokens))
+                current_tokens += tokens
+
+        if current:
+            yield _make_chunk(current, current_tokens, page_num)
+
+
+def _fit_sentence(char_start: int, sentence: str, counter: TokenCounter,
+                  max_tokens: int) -> Iterator[Tuple[int, str, int]]:
+    """Yield the sentence whole, or cut into max_tokens pieces on token boundaries."""
+    offsets = counter.offsets(sentence)
+    if len(offsets) <= max_tokens:
+        yield char_start, sentence, len(offsets)
+        return
+
+    for i in range(0, len(offsets), max_tokens):
+        window = offsets[i:i + max_tokens]
+        piece_start = window[0][0]
+        yield char_start + piece_start, sentence[piece_start:window[-1][1]], len(window)
+
+
+def _overlap_tail(sentences: List[Tuple[int, str, int]], overlap_tokens: int,
+                  room: int) -> List[Tuple[int, str, int]]:
+    """The longest run of trailing sentences within the overlap budget (and the room left)."""
+    budget = min(overlap_tokens, room)
+    tail, used = [], 0
+    for sentence in reversed(sentences):
+        if used + sentence[2] > budget:
+            break
+        tail.insert(0, sentence)
+        used += sentence[2]
+    # Never carry the whole chunk over — that would repeat it
+    return tail if len(tail) < len(sentences) else []
+
+
+def _make_chunk(sentences: List[Tuple[int, str, int]], num_tokens: int, page_num: int) -> Dict:
+    return {
+        "text": " ".join(s for _, s, _ in sentences),
+        "page": page_num,
+        "char_start": sentences[0][0],
+        "num_tokens": num_tokens,
+    }
@@ -0,0 +1,195 @@
+"""
+Context Packer
+
+Fits a chat prompt into the LLM's context window. Token counts come from
+the model's own tokenizer (see tokenization.py; estimated when it
+cannot be loaded).
+
+Budget = context_window - max output tokens - safety margin. The system
+prompt and the current query always go in; what is left is shared by:
+
+    retrieved chunks  kept in the retriever's ranked order (fusion order
+                      for hybrid search); the first one that does not
+                      fit is truncated (if enough room is left), the rest
+                      are dropped
+    chat history      kept newest turn first; older turns are dropped
+                      once the budget runs out
+
+History may use up to `history_share` of the shared budget when there
+are chunks to include, plus whatever the chunks leave unused. Everything
+that was cut is logged.
+"""
+
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from rag.tokenization import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SEPARATOR = "\n\n---\n\n"
+
+
+def format_chunk(chunk: Dict) -> str:
+    """Render one retrieved chunk for the synthesizer prompt."""
+    return f"[Source: {chunk['source']}]\n{chunk['text']}"
+
+
+@dataclass
+class PackedContext:
+    """Result of ContextPacker.pack()."""
+
+    history: list
+    chunks: List[Dict]
+    context: str
+    prompt_tokens: int
+    budget: int
+    dropped_chunks: List[Dict] = field(default_factory=list)
+    truncated_chunks: int = 0
+    dropped_turns: int = 0
+
+
+class ContextPacker:
+    """Allocates a token budget across system prompt, history and retrieved chunks."""
+
+    def __init__(self, counter: TokenCounter, context_window: int = 4096,
+                 max_output_tokens: int = 1024, safety_margin: int = 64,
+                 per_message_overhead: int = 8, history_share: float = 0.3,
+                 min_chunk_tokens: int = 64):
+        self.counter = counter
+        self.context_window = context_window
+        self.max_output_tokens = max_output_tokens
+        self.safety_margin = safety_margin
+        self.per_message_overhead = per_message_overhead
+        self.history_share = history_share
+        self.min_chunk_tokens = min_chunk_tokens
+
+    @property
+    def budget(self) -> int:
+        """Prompt tokens available once the completion is reserved."""
+        return self.context_window - self.max_output_tokens - self.safety_margin
+
+    def _message_tokens(self, content: str) -> int:
+        return self.counter.count(content or "") + self.per_message_overhead
+
+    def pack(self, system_prompt: str, query: str, history: Sequence = (),
+             chunks: Sequence[Dict] = (), formatter: Callable[[Dict], str] = format_chunk,
+             context_header: str = "") -> PackedContext:
+        """
+        Choose which chunks and history turns fit.
+
+        Args:
+            system_prompt: Always included in full
+            query: The current user message, always included in full
+            history: Prior messages, oldest first (objects with .content)
+            chunks: Retrieved chunks, best first (the order is not re-sorted)
+            formatter: Renders a chunk as prompt text
+            context_header: Text placed before the chunks (counted once if any are kept)
+
+        Returns:
+            PackedContext — kept history (oldest first), kept chunks (in
+            ranked order), the joined chunk text, and what was cut
+        """
+        fixed = self._message_tokens(system_prompt) + self._message_tokens(query)
+        available = max(self.budget - fixed, 0)
+        if fixed > self.budget:
+            logger.warning(f"[PACK] System prompt + query alone use {fixed} tokens (budget {self.budget})")
+
+        history_cap = int(available * self.history_share) if chunks else available
+        history_tokens = [self._message_tokens(getattr(m, "content", "")) for m in history]
+        reserved_history = min(sum(history_tokens), history_cap)
+
+        kept_chunks, chunk_tokens, truncated, dropped = self._pack_chunks(
+            chunks, available - reserved_history, formatter, context_header
+        )
+
+        # History gets its share plus whatever the chunks left unused
+        history_budget = available - chunk_tokens
+        kept_history, used = [], 0
+        for message, tokens in zip(reversed(history), reversed(history_tokens)):
+            if used + tokens > history_budget:
+                break
+            kept_history.insert(0, message)
+            used += tokens
+        dropped_turns = len(history) - len(kept_history)
+
+        context = CHUNK_SEPARATOR.join(formatter(c) for c in kept_chunks)
+        packed = PackedContext(
+            history=kept_history,
+            chunks=kept_chunks,
+            context=context,
+            prompt_tokens=fixed + chunk_tokens + used,
+            budget=self.budget,
+            dropped_chunks=dropped,
+            truncated_chunks=truncated,
+            dropped_turns=dropped_turns,
+        )
+        self._log(packed, len(chunks))
+        return packed
+
+    def _pack_chunks(self, chunks: Sequence[Dict], budget: int, formatter: Callable[[Dict], str],
+                     context_header: str):
+        """Greedy in ranked order; returns (kept, tokens used, truncated count, dropped)."""
+        if not chunks:
+            return [], 0, 0, []
+
+        used = self.counter.count(context_header) if context_header else 0
+        separator_tokens = self.counter.count(CHUNK_SEPARATOR)
+
+        kept, truncated, dropped = [], 0, []
+        for position, chunk in enumerate(chunks):
+            cost = self.counter.count(formatter(chunk)) + (separator_tokens if kept else 0)
+            room = budget - used
+            if cost <= room:
+                kept.append(chunk)
+                used += cost
+            elif room - separator_tokens >= self.min_chunk_tokens:
+                shortened = self._truncate(chunk, room - separator_tokens, formatter)
+                if shortened is not None:
+                    kept.append(shortened)
+                    used += self.counter.count(formatter(shortened)) + (separator_tokens if len(kept) > 1 else 0)
+                    truncated += 1
+                else:
+                    dropped.append(chunk)
+                # The budget is spent: every lower-ranked chunk is dropped
+                dropped.extend(chunks[position + 1:])
+                break
+            else:
+                dropped.append(chunk)
+
+        if not kept:
+            used = 0
+        return kept, used, truncated, dropped
+
+    def _truncate(self, chunk: Dict, max_tokens: int, formatter: Callable[[Dict], str]) -> Optional[Dict]:
+        """
+        Cut the chunk's text on a token boundary so the formatted chunk fits max_tokens.
+
+        Returns None if no text would be left.
+        """
+        overhead = self.counter.count(formatter({**chunk, "text": "…"}))
+        offsets = self.counter.offsets(chunk["text"])
+        keep = min(max(max_tokens - overhead, 0), len(offsets))
+        text = chunk["text"][:offsets[keep - 1][1]].rstrip() if keep else ""
+        if not text:
+            return None
+        return {**chunk, "text": text + " …", "truncated": True}
+
+    def _log(self, packed: PackedContext, num_chunks: int):
+        cuts = []
+        if packed.dropped_chunks:
+            dropped = ", ".join(
+                f"{c.get('source', '?')} ({round(c.get('score', 0), 4)})" for c in packed.dropped_chunks
+            )
+            cuts.append(f"dropped {len(packed.dropped_chunks)}/{num_chunks} chunks [{dropped}]")
+        if packed.truncated_chunks:
+            cuts.append(f"truncated {packed.truncated_chunks} chunk")
+        if packed.dropped_turns:
+            cuts.append(f"dropped {packed.dropped_turns} oldest history turns")
+
+        summary = f"{packed.prompt_tokens}/{packed.budget} prompt tokens"
+        if cuts:
+            logger.info(f"[PACK] {summary}; " + "; ".join(cuts))
+        else:
+            logger.debug(f"[PACK] {summary}; nothing cut")
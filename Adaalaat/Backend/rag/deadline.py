@@ -0,0 +1,79 @@
+"""
+Request Deadlines
+
+A Deadline is an absolute point in time by which a request must be
+answered. The orchestrator sets it in a context variable for the length
+of a request (deadline_scope), so the layers below (embedder, LLM
+client) can read it without threading it through every call. asyncio
+tasks and asyncio.to_thread copy the context, so the deadline follows
+the request into them; plain worker threads (micro-batcher, thread
+pools) do not see it, and their callers bound the wait instead.
+
+Each stage checks the remaining budget before it starts and raises
+DeadlineExceeded if it cannot finish in time, so the caller can serve a
+fast fallback immediately rather than after a timeout.
+"""
+
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+_current: contextvars.ContextVar = contextvars.ContextVar("request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a stage cannot finish within the request deadline."""
+
+    def __init__(self, stage: str, remaining: float = 0.0):
+        super().__init__(f"Deadline exceeded before {stage} ({max(remaining, 0.0):.2f}s left)")
+        self.stage = stage
+        self.remaining = remaining
+
+
+class Deadline:
+    """A monotonic-clock deadline."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str, min_seconds: float = 0.0):
+        """Raise DeadlineExceeded unless at least `min_seconds` are left for `stage`."""
+        remaining = self.remaining()
+        if remaining < max(min_seconds, 0.0) or remaining <= 0:
+            raise DeadlineExceeded(stage, remaining)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """The deadline of the request being served, if any."""
+    return _current.get()
+
+
+def remaining_time(cap: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds left before the current deadline (never negative), capped at
+    `cap`. Without a deadline, returns `cap` (None = no limit).
+    """
+    deadline = _current.get()
+    if deadline is None:
+        return cap
+    remaining = max(deadline.remaining(), 0.0)
+    return remaining if cap is None else min(remaining, cap)
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Make `deadline` the current deadline inside the block (None leaves it unset)."""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
@@ -3,15 +3,43 @@ Embedding Manager
 
 Uses the HuggingFace Inference API to generate embeddings remotely
 via the BAAI/bge-small-en-v1.5 model. No local model download needed.
+Setting `embedding.provider` to "local" in config.json runs the same
+model in-process instead (see embedding_providers.py).
+
+Bulk embedding (index builds) sends many texts per request and keeps a
+bounded number of requests in flight; 429/503 responses back off and
+shrink the batch instead of failing the build.
+
+Query embeddings are cached in the shared model (LRU + TTL in memory,
+optionally backed by a SQLite file) so repeated queries skip the API.
+Cache misses from concurrent requests are coalesced into one batched
+call by a micro-batcher (embedding.micro_batch in config.json).
+Waits and retries give up once the request deadline (deadline.py)
+would be missed. Every API call goes through the "embedding" resilience
+policy (retries, hedging, circuit breaker — see resilience.py).
 """
 
 import os
+import re
 import json
+import time
+import hashlib
+import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List
+
 import numpy as np
 from huggingface_hub import InferenceClient
 from dotenv import load_dotenv
 
+from rag.cache import LRUCache, SQLiteCache
+from rag.deadline import DeadlineExceeded, remaining_time
+from rag.resilience import get_policy, status_code
+from rag.embedding_providers import create_provider
+from rag.micro_batcher import MicroBatcher
+
 # --- Load .env from the Backend root folder ---
 # __file__ is Backend/rag/embedding_manager.py
 # parent_dir is Backend/rag
@@ -25,47 +53,104 @@ logger = logging.getLogger(__name__)
 
 _hf_client = None
 _model_name = None
+_batch_settings = {"batch_size": 32, "max_workers": 4, "max_retries": 5}
+_query_cache_settings = {}
+_embedding_config = None
 
+# HTTP statuses that mean "slow down" rather than "this input is bad"
+_THROTTLE_STATUSES = {429, 503}
 
-def _get_client():
-    """Get or create the singleton InferenceClient."""
-    global _hf_client, _model_name
-
-    if _hf_client is None:
-        # Now this will successfully pull the token loaded from your .env file
-        hf_token = os.environ.get("HUGGINGFACE_TOKEN", "") or os.environ.get("HF_TOKEN", "")
-        
-        if not hf_token:
-            raise ValueError(
-                "HUGGINGFACE_TOKEN or HF_TOKEN environment variable is required in your .env file. "
-                "Get your token from https://huggingface.co/settings/tokens"
-            )
+# Shared cool-down: after a throttle response every worker waits it out
+_cooldown_lock = threading.Lock()
+_cooldown_until = 0.0
 
-        _hf_client = InferenceClient(
-            provider="hf-inference",
-            api_key=hf_token,
-        )
+# Concurrent first requests must not build the config, client or shared model twice
+_init_lock = threading.RLock()
+
+
+def _reset_after_fork():
+    # A parent thread may have held these at fork(); the shared model's
+    # micro-batcher and caches reset themselves
+    global _init_lock, _cooldown_lock
+    _init_lock = threading.RLock()
+    _cooldown_lock = threading.Lock()
 
-        # Load model name from config
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _load_config():
+    """Read the "embedding" section of config.json (once)."""
+    global _model_name, _batch_settings, _query_cache_settings, _embedding_config
+
+    if _embedding_config is not None:
+        return
+
+    with _init_lock:
+        if _embedding_config is not None:
+            return
         config_path = os.path.join(backend_dir, "config.json")
         try:
             with open(config_path, "r") as f:
                 config = json.load(f)
-            _model_name = config.get("embedding", {}).get(
-                "model_name", "BAAI/bge-small-en-v1.5"
-            )
+            embedding_config = config.get("embedding", {})
+            _model_name = embedding_config.get("model_name", "BAAI/bge-small-en-v1.5")
+            _batch_settings = {
+                key: embedding_config.get(key, default)
+                for key, default in _batch_settings.items()
+            }
+            _query_cache_settings = embedding_config.get("query_cache", {})
         except FileNotFoundError:
+            embedding_config = {}
             _model_name = "BAAI/bge-small-en-v1.5"
+        _embedding_config = embedding_config
+
 
-        logger.info(f"HF Inference Client ready (embedding: {_model_name})")
+def _get_client():
+    """Get or create the singleton InferenceClient."""
+    global _hf_client
 
-    return _hf_client, _model_name
+    _load_config()
+    if _hf_client is not None:
+        return _hf_client, _model_name
+
+    with _init_lock:
+        if _hf_client is None:
+            # Now this will successfully pull the token loaded from your .env file
+            hf_token = os.environ.get("HUGGINGFACE_TOKEN", "") or os.environ.get("HF_TOKEN", "")
+
+            if not hf_token:
+                raise ValueError(
+                    "HUGGINGFACE_TOKEN or HF_TOKEN environment variable is required in your .env file. "
+                    "Get your token from https://huggingface.co/settings/tokens"
+                )
+
+            _hf_client = InferenceClient(
+                provider="hf-inference",
+                api_key=hf_token,
+            )
+
+            logger.info(f"HF Inference Client ready (embedding: {_model_name})")
+
+        return _hf_client, _model_name
+
+
+def _feature_extraction(client, texts, model: str):
+    """
+    One embedding API call through the "embedding" resilience policy.
+
+    The policy retries 5xx/timeouts (optionally hedging slow calls) and
+    trips the endpoint's circuit breaker; 429/503 throttling is left to
+    the shared cool-down in _embed_request.
+    """
+    policy = get_policy("embedding", retry_statuses=(408, 500, 502, 504), hedge=True)
+    return policy.call(lambda: client.feature_extraction(texts, model=model))
 
 
 def get_text_embedding(text: str) -> list:
     """Get embedding vector for a single text via HuggingFace Inference API."""
     client, model = _get_client()
-    result = client.feature_extraction(text, model=model)
+    result = _feature_extraction(client, text, model)
 
     # The API returns nested arrays — flatten to 1D
     embedding = np.array(result, dtype=np.float32)
@@ -75,33 +160,271 @@ def get_text_embedding(text: str) -> list:
     return embedding.tolist()
 
 
+def _pool_and_normalize(result, num_texts: int) -> np.ndarray:
+    """
+    Reduce a batched feature_extraction response to one unit vector per text.
+
+    The API returns either sentence embeddings (batch, dim) or token-level
+    arrays (batch, tokens, dim); token-level output is mean-pooled.
+    """
+    try:
+        embeddings = np.asarray(result, dtype=np.float32)
+    except ValueError:
+        # Token-level arrays of different lengths can't be stacked — pool each
+        embeddings = np.stack([
+            np.asarray(item, dtype=np.float32).reshape(-1, np.shape(item)[-1]).mean(axis=0)
+            for item in result
+        ])
+
+    if embeddings.ndim == 1:
+        embeddings = embeddings[np.newaxis, :]
+    if embeddings.ndim == 3:
+        embeddings = embeddings.mean(axis=1)
+    if embeddings.shape[0] != num_texts:
+        raise ValueError(
+            f"Embedding API returned {embeddings.shape[0]} vectors for {num_texts} texts"
+        )
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def _retry_after(error: Exception, attempt: int) -> float:
+    """Seconds to wait after a throttle response: Retry-After, else jittered backoff."""
+    response = getattr(error, "response", None)
+    header = getattr(response, "headers", {}).get("Retry-After") if response is not None else None
+    try:
+        return min(float(header), 60.0)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+
+
+def _wait_for_cooldown():
+    delay = _cooldown_until - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _start_cooldown(seconds: float):
+    global _cooldown_until
+    with _cooldown_lock:
+        _cooldown_until = max(_cooldown_until, time.monotonic() + seconds)
+
+
+def _embed_request(texts: List[str], attempt: int = 0) -> np.ndarray:
+    """
+    Embed one batch in a single API call.
+
+    On 429/503 the shared cool-down is extended, and from the second
+    throttle on, the batch is split in half so smaller requests can get
+    through an overloaded endpoint.
+    """
+    client, model = _get_client()
+    _wait_for_cooldown()
+
+    try:
+        result = _feature_extraction(client, texts, model)
+    except Exception as e:
+        if status_code(e) not in _THROTTLE_STATUSES or attempt >= _batch_settings["max_retries"]:
+            raise
+        delay = _retry_after(e, attempt)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            raise DeadlineExceeded("embedding retry", remaining) from e
+        logger.warning(
+            f"Embedding API throttled ({status_code(e)}) on batch of {len(texts)}, "
+            f"retrying in {delay:.1f}s"
+        )
+        _start_cooldown(delay)
+        if attempt >= 1 and len(texts) > 1:
+            mid = len(texts) // 2
+            return np.vstack([
+                _embed_request(texts[:mid], attempt + 1),
+                _embed_request(texts[mid:], attempt + 1),
+            ])
+        return _embed_request(texts, attempt + 1)
+
+    return _pool_and_normalize(result, len(texts))
+
+
+def embed_texts(texts: List[str], batch_size: int = None, max_workers: int = None) -> np.ndarray:
+    """
+    Embed many texts with batched API calls.
+
+    Args:
+        texts: The texts to embed
+        batch_size: Texts per request (defaults to config.json embedding.batch_size)
+        max_workers: Requests in flight at once (defaults to embedding.max_workers)
+
+    Returns:
+        np.ndarray of shape (len(texts), dim), L2-normalized, in input order
+    """
+    _get_client()
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+
+    batch_size = batch_size or _batch_settings["batch_size"]
+    max_workers = max_workers or _batch_settings["max_workers"]
+    batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+
+    if len(batches) == 1 or max_workers <= 1:
+        results = [_embed_request(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as pool:
+            results = list(pool.map(_embed_request, batches))
+
+    logger.info(f"Embedded {len(texts)} texts in {len(batches)} requests")
+    return np.vstack(results)
+
+
 def get_batch_embeddings(texts: list) -> list:
-    """Get embeddings for a batch of texts."""
-    embeddings = []
-    for text in texts:
-        emb = get_text_embedding(text)
-        embeddings.append(emb)
-    return embeddings
+    """Get embeddings for a batch of texts (batched API calls)."""
+    return embed_texts(texts).tolist()
 
 
 class HFInferenceEmbedding:
-    """Wrapper class that mimics the LlamaIndex embedding interface."""
+    """
+    Wrapper class that mimics the LlamaIndex embedding interface.
+
+    Embeddings come from `provider` (the HF Inference API unless
+    configured otherwise). Query embeddings are cached by (provider,
+    model, normalized text): an in-memory LRU with TTL, plus an optional
+    on-disk tier so hot queries survive restarts. Document embeddings
+    (index builds) bypass the cache.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        cache_size: int = 2048,
+        cache_ttl_seconds: float = 24 * 3600,
+        disk_cache_path: str = None,
+        provider=None,
+        micro_batch_window_ms: float = None,
+        micro_batch_max_size: int = 32,
+    ):
+        self.model_name = model_name
+        self.provider = provider or create_provider({}, model_name)
+        self._batcher = (
+            MicroBatcher(
+                self._embed_unique,
+                name="query_embedding",
+                window_ms=micro_batch_window_ms,
+                max_batch=micro_batch_max_size,
+            )
+            if micro_batch_window_ms is not None else None
+        )
+        self._cache = LRUCache(max_size=cache_size, ttl_seconds=cache_ttl_seconds)
+        self._disk_cache = (
+            SQLiteCache(disk_cache_path, ttl_seconds=cache_ttl_seconds)
+            if disk_cache_path else None
+        )
+
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        """Collapse whitespace and case so trivially different queries share an entry."""
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    def _cache_key(self, normalized: str) -> str:
+        return hashlib.sha256(
+            f"{self.provider.id}\n{self.model_name}\n{normalized}".encode("utf-8")
+        ).hexdigest()
+
+    def _lookup(self, key: str):
+        embedding = self._cache.get(key)
+        if embedding is None and self._disk_cache is not None:
+            blob = self._disk_cache.get(key)
+            if blob is not None:
+                embedding = np.frombuffer(blob, dtype=np.float32)
+                self._cache.set(key, embedding)
+        return embedding
+
+    def _store(self, key: str, embedding: np.ndarray):
+        self._cache.set(key, embedding)
+        if self._disk_cache is not None:
+            self._disk_cache.set(key, embedding.tobytes())
+
+    def _embed_unique(self, texts: List[str]) -> np.ndarray:
+        """Embed a (micro-)batch, sending each distinct text once."""
+        unique = list(dict.fromkeys(texts))
+        embeddings = self.provider.embed(unique)
+        row = {text: i for i, text in enumerate(unique)}
+        return embeddings[[row[text] for text in texts]]
+
+    def _embed_queries(self, texts: List[str]) -> np.ndarray:
+        """Embed cache misses, through the micro-batcher when it is enabled."""
+        if self._batcher is None:
+            return self.provider.embed(texts)
+        futures = [self._batcher.submit(text) for text in texts]
+        try:
+            # The batcher thread does not see the request deadline; bound the wait instead
+            return np.stack([future.result(timeout=remaining_time()) for future in futures])
+        except FutureTimeoutError:
+            raise DeadlineExceeded("query embedding")
 
     def get_text_embedding(self, text: str) -> list:
-        return get_text_embedding(text)
+        return self.provider.embed([text])[0].tolist()
 
     def get_query_embedding(self, query: str) -> list:
-        return get_text_embedding(query)
+        return self.get_query_embedding_batch([query])[0]
+
+    def get_query_embedding_batch(self, queries: List[str]) -> list:
+        """Embed several queries, sending only the cache misses in one batch."""
+        keys = [self._cache_key(self.normalize_query(q)) for q in queries]
+        embeddings = [self._lookup(key) for key in keys]
+
+        missing = {}
+        for i, (query, embedding) in enumerate(zip(queries, embeddings)):
+            if embedding is None:
+                missing.setdefault(self.normalize_query(query), []).append(i)
+
+        if missing:
+            texts = list(missing)
+            for text, embedding in zip(texts, self._embed_queries(texts)):
+                embedding.setflags(write=False)
+                for i in missing[text]:
+                    embeddings[i] = embedding
+                self._store(keys[missing[text][0]], embedding)
+
+        return [embedding.tolist() for embedding in embeddings]
+
+    def get_text_embedding_batch(self, texts: List[str]) -> list:
+        return self.provider.embed(texts).tolist()
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters for the query cache tiers."""
+        return {
+            "memory": self._cache.stats(),
+            "disk": self._disk_cache.stats() if self._disk_cache else None,
+        }
 
 
 # ── Singleton accessor ──────────────────────────────────────────
 _shared_embed_model = None
 
 def get_shared_embedding_model():
-    """Get a singleton embedding model that uses HF Inference API."""
+    """Get a singleton embedding model backed by the configured provider."""
     global _shared_embed_model
-    if _shared_embed_model is None:
-        _get_client()
-        _shared_embed_model = HFInferenceEmbedding()
-        logger.info("Shared HF Inference embedding model ready")
-    return _shared_embed_model
\ No newline at end of file
+    if _shared_embed_model is not None:
+        return _shared_embed_model
+
+    with _init_lock:
+        if _shared_embed_model is None:
+            _load_config()
+            provider = create_provider(_embedding_config, _model_name)
+            disk_path = _query_cache_settings.get("disk_path")
+            micro_batch = _embedding_config.get("micro_batch", {})
+            _shared_embed_model = HFInferenceEmbedding(
+                model_name=_model_name,
+                cache_size=_query_cache_settings.get("max_size", 2048),
+                cache_ttl_seconds=_query_cache_settings.get("ttl_seconds", 24 * 3600),
+                disk_cache_path=os.path.join(backend_dir, disk_path) if disk_path else None,
+                provider=provider,
+                micro_batch_window_ms=(
+                    micro_batch.get("window_ms", 5) if micro_batch.get("enabled", True) else None
+                ),
+                micro_batch_max_size=micro_batch.get("max_batch", 32),
+            )
+            logger.info(f"Shared embedding model ready (provider: {provider.id})")
+        return _shared_embed_model
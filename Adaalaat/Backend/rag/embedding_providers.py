@@ -0,0 +1,122 @@
+"""
+Embedding Providers
+
+Backends that turn texts into L2-normalized embedding vectors, selected
+by `embedding.provider` in config.json:
+
+    "hf_inference"  HuggingFace Inference API (default) — batched remote
+                    calls with retry/backoff, see embedding_manager.embed_texts
+    "local"         SentenceTransformer on this machine's CPU — no network
+                    round trip, a few ms per query once the model is loaded
+
+Local backend options (config.json → embedding.local):
+    device        "cpu" (default) or e.g. "cuda"
+    num_threads   torch intra-op threads; null keeps torch's default
+    batch_size    texts per encode() batch
+    backend       "torch" (default), "onnx" or "openvino"
+    model_file    optional ONNX/OpenVINO file inside the model repo, e.g.
+                  "onnx/model_qint8_avx512_vnni.onnx" for a quantized model
+
+Both produce vectors for the same model, but not bit-identical ones, so
+the provider id is part of the index key and of the query-cache key —
+switching providers re-embeds the corpus instead of mixing spaces.
+"""
+
+import logging
+import threading
+from typing import Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER = "hf_inference"
+
+
+def provider_id(embedding_config: Dict) -> str:
+    """Stable identifier of the configured backend, e.g. 'local:onnx:onnx/model_qint8.onnx'."""
+    provider = embedding_config.get("provider", DEFAULT_PROVIDER)
+    if provider != "local":
+        return provider
+    local = embedding_config.get("local", {})
+    parts = ["local", local.get("backend", "torch")]
+    if local.get("model_file"):
+        parts.append(local["model_file"])
+    return ":".join(parts)
+
+
+class HFInferenceProvider:
+    """Remote embeddings through the HuggingFace Inference API."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.id = "hf_inference"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        from rag.embedding_manager import embed_texts
+
+        return embed_texts(texts)
+
+
+class LocalSentenceTransformerProvider:
+    """In-process SentenceTransformer encoder (CPU by default)."""
+
+    def __init__(self, model_name: str, device: str = "cpu", num_threads: int = None,
+                 batch_size: int = 64, backend: str = "torch", model_file: str = None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            raise ImportError(
+                "embedding.provider is 'local' but sentence-transformers is not installed. "
+                "Run: pip install sentence-transformers (plus optimum[onnxruntime] for the onnx backend)"
+            ) from e
+
+        if num_threads:
+            import torch
+
+            torch.set_num_threads(num_threads)
+
+        # backend/model_kwargs need sentence-transformers >= 3.2; plain torch works with any version
+        options = {}
+        if backend != "torch":
+            options["backend"] = backend
+        if model_file:
+            options["model_kwargs"] = {"file_name": model_file}
+        self.model_name = model_name
+        self.id = provider_id({"provider": "local", "local": {"backend": backend, "model_file": model_file}})
+        self.batch_size = batch_size
+        self._model = SentenceTransformer(model_name, device=device, **options)
+        # Concurrent encode() calls would oversubscribe torch's thread pool
+        self._lock = threading.Lock()
+        logger.info(f"Local embedding model ready: {model_name} ({self.id}, device={device})")
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        with self._lock:
+            embeddings = self._model.encode(
+                texts,
+                batch_size=self.batch_size,
+                normalize_embeddings=True,
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return embeddings.astype(np.float32, copy=False)
+
+
+def create_provider(embedding_config: Dict, model_name: str):
+    """Instantiate the provider selected in config.json's "embedding" section."""
+    provider = embedding_config.get("provider", DEFAULT_PROVIDER)
+    if provider == "hf_inference":
+        return HFInferenceProvider(model_name)
+    if provider == "local":
+        local = embedding_config.get("local", {})
+        return LocalSentenceTransformerProvider(
+            model_name,
+            device=local.get("device", "cpu"),
+            num_threads=local.get("num_threads"),
+            batch_size=local.get("batch_size", 64),
+            backend=local.get("backend", "torch"),
+            model_file=local.get("model_file"),
+        )
+    raise ValueError(f"Unknown embedding provider: {provider!r} (expected 'hf_inference' or 'local')")
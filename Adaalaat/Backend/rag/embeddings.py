@@ -6,7 +6,7 @@ Now wired directly to embedding_manager.py to use HuggingFace Inference API.
 """
 
 # Import the actual working functions from your embedding_manager
-from rag.embedding_manager import get_text_embedding, get_batch_embeddings
+from rag.embedding_manager import get_batch_embeddings, get_shared_embedding_model
 
 def embed_query(text: str) -> list:
     """
@@ -18,8 +18,8 @@ def embed_query(text: str) -> list:
     Returns:
         list[float]: A dense vector
     """
-    # Call the manager function that uses your .env token
-    return get_text_embedding(text)
+    # Goes through the shared model so repeated queries hit its cache
+    return get_shared_embedding_model().get_query_embedding(text)
 
 
 def embed_documents(texts: list) -> list:
@@ -1,20 +1,56 @@
 """
 HuggingFace Inference API — Custom LLM Wrapper for LlamaIndex
+
+Calls the OpenAI-compatible chat completions endpoint of the HF router
+(`base_url`) over pooled keep-alive HTTP connections:
+
+    chat   one httpx.Client shared by the whole process
+    achat  one httpx.AsyncClient per event loop (an async client cannot
+           be used from a loop other than the one it was created on), so
+           it never blocks the loop and concurrent requests overlap
+
+Connection limits and timeouts are configurable; pointing `base_url` at
+a local server runs the wrapper against a stand-in. stream_chat /
+astream_chat yield the answer token by token.
+
+Calls go through the "llm" resilience policy (resilience.py: retries,
+optional hedging, circuit breaker). Once it gives up, the error is
+raised; callers decide on the fallback. Timeouts are shortened to the
+request deadline (deadline.py), and a call that cannot finish in time
+raises DeadlineExceeded.
+
+With a `response_cache` (llm_cache.py), a prompt identical to an
+earlier one is answered from the cache instead of the API; errors are
+never cached.
 """
 
 import os
+import json
+import time
+import asyncio
 import logging
-from typing import Any, Optional, Sequence
+import threading
+import weakref
+from typing import Any, Dict, Optional, Sequence
+
+import httpx
 from dotenv import load_dotenv
 
 from llama_index.core.llms.llm import LLM
 from llama_index.core.llms import (
     ChatMessage,
     ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
     CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
     LLMMetadata,
 )
-from huggingface_hub import InferenceClient
+
+from rag.deadline import DeadlineExceeded, current_deadline, remaining_time
+from rag.llm_cache import response_cache_key
+from rag.resilience import get_policy
 
 # --- Load .env from the Backend root folder ---
 backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -24,6 +60,59 @@ load_dotenv(dotenv_path)
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_BASE_URL = "https://router.huggingface.co/v1"
+
+# ── Shared HTTP clients ─────────────────────────────────────────
+_sync_clients: Dict[tuple, httpx.Client] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[tuple, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # Pooled sockets belong to the parent: a forked child opens its own connections
+    global _sync_clients, _async_clients, _clients_lock
+    _sync_clients = {}
+    _async_clients = weakref.WeakKeyDictionary()
+    _clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _client_options(settings: tuple) -> Dict[str, Any]:
+    base_url, timeout, connect_timeout, max_connections, max_keepalive, keepalive_expiry = settings
+    return {
+        "base_url": base_url,
+        "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+    }
+
+
+def _get_sync_client(settings: tuple) -> httpx.Client:
+    """Process-wide pooled client for these settings."""
+    with _clients_lock:
+        client = _sync_clients.get(settings)
+        if client is None:
+            client = _sync_clients[settings] = httpx.Client(**_client_options(settings))
+        return client
+
+
+def _get_async_client(settings: tuple) -> httpx.AsyncClient:
+    """Pooled async client for these settings on the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(settings)
+        if client is None:
+            client = clients[settings] = httpx.AsyncClient(**_client_options(settings))
+        return client
+
 
 class HFInferenceLLM(LLM):
     """LlamaIndex-compatible LLM that calls the HuggingFace Inference API."""
@@ -35,7 +124,15 @@ class HFInferenceLLM(LLM):
     hf_token: str = ""
     max_tokens: int = 1024
     temperature: float = 0.3
-    _client: Optional[Any] = None
+    context_window: int = 4096
+    base_url: str = DEFAULT_BASE_URL
+    timeout_seconds: float = 60.0
+    connect_timeout_seconds: float = 10.0
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry_seconds: float = 30.0
+    # rag.llm_cache.LLMResponseCache — None disables response caching
+    response_cache: Optional[Any] = None
 
     class Config:
         arbitrary_types_allowed = True
@@ -59,14 +156,13 @@ class HFInferenceLLM(LLM):
         if not self.hf_token:
             raise ValueError("HUGGINGFACE_TOKEN or HF_TOKEN is required in your .env file for HFInferenceLLM")
 
-        self._client = InferenceClient(api_key=self.hf_token)
-        logger.info(f"HFInferenceLLM initialized: {self.api_model}")
+        logger.info(f"HFInferenceLLM initialized: {self.api_model} via {self.base_url}")
 
     @property
     def metadata(self) -> LLMMetadata:
         return LLMMetadata(
             model_name=self.model_name,
-            context_window=4096,
+            context_window=self.context_window,
             num_output=self.max_tokens,
             is_chat_model=True,
         )
@@ -77,30 +173,118 @@ class HFInferenceLLM(LLM):
             for msg in messages
         ]
 
+    @property
+    def _http_settings(self) -> tuple:
+        return (
+            self.base_url.rstrip("/"),
+            self.timeout_seconds,
+            self.connect_timeout_seconds,
+            self.max_connections,
+            self.max_keepalive_connections,
+            self.keepalive_expiry_seconds,
+        )
+
+    def _request_body(self, messages: Sequence[ChatMessage]) -> dict:
+        # No max_tokens / temperature so the HF Router doesn't reject the request
+        return {"model": self.api_model, "messages": self._convert_messages(messages)}
+
+    @property
+    def _headers(self) -> dict:
+        return {"Authorization": f"Bearer {self.hf_token}"}
+
+    def _to_response(self, response: httpx.Response) -> ChatResponse:
+        response.raise_for_status()
+        data = response.json()
+        content = data["choices"][0]["message"]["content"]
+        return ChatResponse(message=ChatMessage(role="assistant", content=content), raw=data)
+
+    # ── Response Cache ──────────────────────────────────────────
+    # Pass bypass_cache=True to chat/achat/stream_chat/astream_chat to
+    # skip the lookup and the store for one call.
+
+    def _cache_lookup(self, messages: Sequence[ChatMessage], kwargs: dict):
+        """(key, cached response) — key is None when caching is off or bypassed."""
+        if self.response_cache is None or kwargs.get("bypass_cache"):
+            return None, None
+        body = self._request_body(messages)
+        params = {k: v for k, v in body.items() if k not in ("model", "messages")}
+        params.update(temperature=self.temperature, max_tokens=self.max_tokens)
+        key = response_cache_key(self.api_model, body["messages"], params)
+
+        content = self.response_cache.get(key)
+        if content is None:
+            return key, None
+        return key, ChatResponse(
+            message=ChatMessage(role="assistant", content=content),
+            delta=content,
+            additional_kwargs={"cached": True},
+        )
+
+    def _cache_store(self, key: Optional[str], content: str, started: float, raw: Optional[dict] = None):
+        if key is None or not content:
+            return
+        tokens = ((raw or {}).get("usage") or {}).get("total_tokens", 0)
+        self.response_cache.set(key, content, (time.perf_counter() - started) * 1000, tokens)
+
+    def _request_timeout(self) -> httpx.Timeout:
+        """Configured timeouts, shortened to what is left of the request deadline."""
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check("LLM call")
+        return httpx.Timeout(
+            remaining_time(self.timeout_seconds), connect=remaining_time(self.connect_timeout_seconds)
+        )
+
+    def _raise_failure(self, e: Exception):
+        """Log and re-raise a failed call; a timeout caused by the request deadline becomes DeadlineExceeded."""
+        deadline = current_deadline()
+        if isinstance(e, httpx.TimeoutException) and deadline is not None and deadline.expired:
+            raise DeadlineExceeded("LLM call") from e
+        if not isinstance(e, DeadlineExceeded):
+            logger.error(f"HF Inference chat failed: {e}")
+        raise e
+
     def chat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponse:
-        hf_messages = self._convert_messages(messages)
+        key, cached = self._cache_lookup(messages, kwargs)
+        if cached is not None:
+            return cached
+
+        client = _get_sync_client(self._http_settings)
+
+        def call() -> ChatResponse:
+            return self._to_response(client.post(
+                "/chat/completions", json=self._request_body(messages), headers=self._headers,
+                timeout=self._request_timeout(),
+            ))
 
+        started = time.perf_counter()
         try:
-            # We remove max_tokens and temperature here so the HF Router doesn't reject it
-            completion = self._client.chat.completions.create(
-                model=self.api_model,
-                messages=hf_messages
-            )
-
-            content = completion.choices[0].message.content
-            return ChatResponse(
-                message=ChatMessage(role="assistant", content=content),
-            )
+            result = get_policy("llm").call(call)
         except Exception as e:
-            logger.error(f"HF Inference chat failed: {e}")
-            return ChatResponse(
-                message=ChatMessage(
-                    role="assistant",
-                    content=f"I encountered an error processing your request: {str(e)}",
-                ),
-            )
+            self._raise_failure(e)
+        self._cache_store(key, result.message.content, started, result.raw)
+        return result
+
     async def achat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponse:
-        return self.chat(messages, **kwargs)
+        key, cached = self._cache_lookup(messages, kwargs)
+        if cached is not None:
+            return cached
+
+        client = _get_async_client(self._http_settings)
+
+        async def call() -> ChatResponse:
+            return self._to_response(await client.post(
+                "/chat/completions", json=self._request_body(messages), headers=self._headers,
+                timeout=self._request_timeout(),
+            ))
+
+        started = time.perf_counter()
+        try:
+            result = await get_policy("llm").acall(call)
+        except Exception as e:
+            self._raise_failure(e)
+        self._cache_store(key, result.message.content, started, result.raw)
+        return result
 
     def complete(self, prompt: str, **kwargs) -> CompletionResponse:
         messages = [ChatMessage(role="user", content=prompt)]
@@ -108,16 +292,133 @@ class HFInferenceLLM(LLM):
         return CompletionResponse(text=chat_resp.message.content)
 
     async def acomplete(self, prompt: str, **kwargs) -> CompletionResponse:
-        return self.complete(prompt, **kwargs)
+        messages = [ChatMessage(role="user", content=prompt)]
+        chat_resp = await self.achat(messages, **kwargs)
+        return CompletionResponse(text=chat_resp.message.content)
+
+    # ── Streaming ───────────────────────────────────────────────
+    # The chat-completions API streams Server-Sent Events ("data: {json}"
+    # lines, ending with "data: [DONE]"). Each yielded ChatResponse
+    # carries the new text in `delta` and the text so far in `message`.
+    # Opening the stream is retried like chat() (never hedged); a failure
+    # once tokens are flowing is raised. Only a stream that reached [DONE]
+    # is cached, so a dropped connection never caches a cut-off answer.
+
+    @staticmethod
+    def _is_done(line: str) -> bool:
+        return line.startswith("data:") and line[len("data:"):].strip() == "[DONE]"
+
+    def _to_delta(self, line: str) -> Optional[str]:
+        """Text delta of one SSE line (None for keep-alives, [DONE] and empty deltas)."""
+        if not line.startswith("data:"):
+            return None
+        payload = line[len("data:"):].strip()
+        if not payload or payload == "[DONE]":
+            return None
+        choices = json.loads(payload).get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or None
+
+    def _stream_request(self, client, messages: Sequence[ChatMessage]):
+        return client.build_request(
+            "POST", "/chat/completions", json={**self._request_body(messages), "stream": True},
+            headers=self._headers, timeout=self._request_timeout(),
+        )
+
+    def stream_chat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponseGen:
+        key, cached = self._cache_lookup(messages, kwargs)
+
+        def open_stream() -> httpx.Response:
+            client = _get_sync_client(self._http_settings)
+            response = client.send(self._stream_request(client, messages), stream=True)
+            if response.is_error:
+                response.read()
+                response.close()
+                response.raise_for_status()
+            return response
+
+        def gen() -> ChatResponseGen:
+            if cached is not None:
+                yield cached
+                return
+            content, finished = "", False
+            started = time.perf_counter()
+            try:
+                response = get_policy("llm").call(open_stream, hedge=False)
+                try:
+                    for line in response.iter_lines():
+                        if self._is_done(line):
+                            finished = True
+                            break
+                        delta = self._to_delta(line)
+                        if delta:
+                            content += delta
+                            yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+                finally:
+                    response.close()
+            except Exception as e:
+                self._raise_failure(e)
+            if finished:
+                self._cache_store(key, content, started)
+            else:
+                logger.warning("HF Inference stream ended without [DONE]; answer not cached")
+
+        return gen()
+
+    def stream_complete(self, prompt: str, **kwargs) -> CompletionResponseGen:
+        def gen() -> CompletionResponseGen:
+            for chunk in self.stream_chat([ChatMessage(role="user", content=prompt)], **kwargs):
+                yield CompletionResponse(
+                    text=chunk.message.content, delta=chunk.delta, additional_kwargs=chunk.additional_kwargs
+                )
+
+        return gen()
+
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs) -> ChatResponseAsyncGen:
+        key, cached = self._cache_lookup(messages, kwargs)
+
+        async def open_stream() -> httpx.Response:
+            client = _get_async_client(self._http_settings)
+            response = await client.send(self._stream_request(client, messages), stream=True)
+            if response.is_error:
+                await response.aread()
+                await response.aclose()
+                response.raise_for_status()
+            return response
 
-    def stream_chat(self, messages, **kwargs):
-        raise NotImplementedError("Streaming not implemented for HF Inference API")
+        async def gen() -> ChatResponseAsyncGen:
+            if cached is not None:
+                yield cached
+                return
+            content, finished = "", False
+            started = time.perf_counter()
+            try:
+                response = await get_policy("llm").acall(open_stream, hedge=False)
+                try:
+                    async for line in response.aiter_lines():
+                        if self._is_done(line):
+                            finished = True
+                            break
+                        delta = self._to_delta(line)
+                        if delta:
+                            content += delta
+                            yield ChatResponse(message=ChatMessage(role="assistant", content=content), delta=delta)
+                finally:
+                    await response.aclose()
+            except Exception as e:
+                self._raise_failure(e)
+            if finished:
+                self._cache_store(key, content, started)
+            else:
+                logger.warning("HF Inference stream ended without [DONE]; answer not cached")
 
-    def stream_complete(self, prompt, **kwargs):
-        raise NotImplementedError("Streaming not implemented for HF Inference API")
+        return gen()
 
-    async def astream_chat(self, messages, **kwargs):
-        raise NotImplementedError("Async streaming not implemented for HF Inference API")
+    async def astream_complete(self, prompt: str, **kwargs) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            stream = await self.astream_chat([ChatMessage(role="user", content=prompt)], **kwargs)
+            async for chunk in stream:
+                yield CompletionResponse(
+                    text=chunk.message.content, delta=chunk.delta, additional_kwargs=chunk.additional_kwargs
+                )
 
-    async def astream_complete(self, prompt, **kwargs):
-        raise NotImplementedError("Async streaming not implemented for HF Inference API")
\ No newline at end of file
+        return gen()
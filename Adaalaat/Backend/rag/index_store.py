@@ -0,0 +1,320 @@
+"""
+Index Store
+
+Persists the local retriever's chunk embeddings on disk so worker
+processes reuse them instead of re-parsing and re-embedding the corpus
+on every start, and so adding or changing one document only embeds
+that document.
+
+On-disk layout (one directory per index):
+    embeddings.npy   float32 matrix of shape (capacity, dim); the first
+                     `num_rows` rows are in use, the rest is headroom so
+                     new documents are appended in place
+    chunks.jsonl     one chunk per line (text, page, char_start, doc_id, title)
+    manifest.json    index key, per-document metadata and row ranges
+
+A row is live when it falls inside a current document's row range.
+Removing or changing a document just drops its range (a tombstone);
+once dead rows pass a threshold, compact() rewrites both files without
+them.
+
+The key covers the embedding model and provider, chunker version and chunking
+parameters — if any of them changes, the whole index is rebuilt. The matrix is opened with
+np.load(mmap_mode="r"), so every gunicorn worker maps the same file and
+shares its pages through the OS cache.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows — no advisory file locks
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT_VERSION = 2
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".build.lock"
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file's contents without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_index_key(model_name: str, chunker: str, chunk_size: int, chunk_overlap: int,
+                    provider: str = "hf_inference") -> Dict:
+    """Build the key that decides whether a stored index can be reused at all."""
+    return {
+        "format_version": INDEX_FORMAT_VERSION,
+        "model_name": model_name,
+        "provider": provider,
+        "chunker": chunker,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+    }
+
+
+@contextmanager
+def build_lock(index_dir: str):
+    """
+    Hold an exclusive lock on the index directory.
+
+    Workers that start together serialize here: the first one updates
+    the index, the rest block until it is written and then load it.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+
+    with open(os.path.join(index_dir, LOCK_FILE), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class IndexStore:
+    """
+    Incrementally maintained embedding index for a corpus of documents.
+
+    Changes (add_document / remove_document / compact) touch the data
+    files immediately but only become visible to readers once commit()
+    writes the manifest. Call them while holding build_lock().
+    """
+
+    def __init__(self, index_dir: str, key: Dict):
+        self.index_dir = index_dir
+        self.key = key
+        os.makedirs(index_dir, exist_ok=True)
+
+        self.manifest = self._read_manifest()
+        if self.manifest is None or self.manifest.get("key") != key:
+            if self.manifest is not None:
+                logger.info("Stored index is stale (key changed) — rebuilding")
+            self.manifest = {
+                "key": key,
+                "version": 0,
+                "num_rows": 0,
+                "capacity": 0,
+                "dim": None,
+                "chunks_bytes": 0,
+                "documents": {},
+            }
+        self._dirty = False
+
+    # ── Paths / manifest ────────────────────────────────────────
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.index_dir, name)
+
+    def _read_manifest(self) -> Optional[Dict]:
+        try:
+            with open(self._path(MANIFEST_FILE), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @property
+    def documents(self) -> Dict[str, Dict]:
+        return self.manifest["documents"]
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+    @property
+    def num_rows(self) -> int:
+        return self.manifest["num_rows"]
+
+    @property
+    def num_live_rows(self) -> int:
+        return sum(doc["row_count"] for doc in self.documents.values())
+
+    # ── Mutations ───────────────────────────────────────────────
+
+    def update_document_meta(self, doc_id: str, **meta):
+        """Refresh metadata (e.g. mtime) of an unchanged document."""
+        self.documents[doc_id].update(meta)
+        self._dirty = True
+
+    def remove_document(self, doc_id: str):
+        """Tombstone a document's rows; they stay on disk until compact()."""
+        if self.documents.pop(doc_id, None) is not None:
+            self._dirty = True
+
+    def add_document(self, doc_id: str, meta: Dict, chunks: List[Dict], embeddings: np.ndarray):
+        """
+        Append a document's chunks and embeddings after the last used row.
+
+        An existing entry for `doc_id` is tombstoned first.
+        """
+        self.remove_document(doc_id)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        start = self.num_rows
+
+        if len(chunks):
+            self._append_embeddings(embeddings)
+            self._append_chunks([{**chunk, "doc_id": doc_id} for chunk in chunks])
+
+        self.documents[doc_id] = {**meta, "row_start": start, "row_count": len(chunks)}
+        self.manifest["num_rows"] = start + len(chunks)
+        self._dirty = True
+
+    def _append_embeddings(self, embeddings: np.ndarray):
+        dim = embeddings.shape[1]
+        if self.manifest["dim"] not in (None, dim):
+            raise ValueError(f"Embedding dim changed from {self.manifest['dim']} to {dim}")
+
+        needed = self.num_rows + embeddings.shape[0]
+        if needed > self.manifest["capacity"]:
+            self._grow(max(needed, 2 * self.manifest["capacity"], 1024), dim)
+
+        matrix = np.lib.format.open_memmap(self._path(EMBEDDINGS_FILE), mode="r+")
+        matrix[self.num_rows:needed] = embeddings
+        matrix.flush()
+        del matrix
+        self.manifest["dim"] = dim
+
+    def _grow(self, capacity: int, dim: int):
+        """Re-allocate the matrix file with more headroom (amortized doubling)."""
+        tmp_path = self._path(EMBEDDINGS_FILE + ".tmp")
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(capacity, dim))
+        if self.num_rows:
+            current = np.load(self._path(EMBEDDINGS_FILE), mmap_mode="r")
+            grown[:self.num_rows] = current[:self.num_rows]
+            del current
+        grown.flush()
+        del grown
+        os.replace(tmp_path, self._path(EMBEDDINGS_FILE))
+        self.manifest["capacity"] = capacity
+        logger.info(f"Index capacity grown to {capacity} rows")
+
+    def _append_chunks(self, chunks: List[Dict]):
+        path = self._path(CHUNKS_FILE)
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        with open(path, mode) as f:
+            # Drop anything a crashed writer appended after the last commit
+            f.truncate(self.manifest["chunks_bytes"])
+            f.seek(self.manifest["chunks_bytes"])
+            for chunk in chunks:
+                f.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+            self.manifest["chunks_bytes"] = f.tell()
+
+    def needs_compaction(self, threshold: float) -> bool:
+        """True when the share of dead rows exceeds `threshold`."""
+        if not self.num_rows:
+            return False
+        return 1 - self.num_live_rows / self.num_rows > threshold
+
+    def compact(self):
+        """Rewrite the matrix and chunk file keeping only live rows, in document order."""
+        chunks, embeddings, _ = self.load()
+        docs = sorted(self.documents.items(), key=lambda item: item[1]["row_start"])
+        live_rows = self.num_live_rows
+        dim = self.manifest["dim"]
+
+        emb_tmp = self._path(EMBEDDINGS_FILE + ".tmp")
+        chunks_tmp = self._path(CHUNKS_FILE + ".tmp")
+        compacted = np.lib.format.open_memmap(
+            emb_tmp, mode="w+", dtype=np.float32, shape=(max(live_rows, 1), dim)
+        )
+
+        row = 0
+        with open(chunks_tmp, "wb") as f:
+            for _, doc in docs:
+                start, count = doc["row_start"], doc["row_count"]
+                compacted[row:row + count] = embeddings[start:start + count]
+                for chunk in chunks[start:start + count]:
+                    f.write((json.dumps(chunk, ensure_ascii=False) + "\n").encode("utf-8"))
+                doc["row_start"] = row
+                row += count
+            chunks_bytes = f.tell()
+
+        compacted.flush()
+        del compacted, embeddings
+
+        # Row ranges in the old manifest don't match the compacted files —
+        # if we crash before commit(), the index must be rebuilt, not misread.
+        if os.path.exists(self._path(MANIFEST_FILE)):
+            os.remove(self._path(MANIFEST_FILE))
+        os.replace(emb_tmp, self._path(EMBEDDINGS_FILE))
+        os.replace(chunks_tmp, self._path(CHUNKS_FILE))
+
+        dropped = self.num_rows - live_rows
+        self.manifest.update({
+            "num_rows": live_rows,
+            "capacity": max(live_rows, 1),
+            "chunks_bytes": chunks_bytes,
+        })
+        self._dirty = True
+        logger.info(f"Compacted index: dropped {dropped} dead rows, {live_rows} remain")
+
+    def commit(self) -> bool:
+        """Publish pending changes by writing the manifest. Returns True if anything changed."""
+        if not self._dirty:
+            return False
+        self.manifest["version"] += 1
+        self.manifest["updated_at"] = time.time()
+        _write_json(self._path(MANIFEST_FILE), self.manifest)
+        self._dirty = False
+        logger.info(
+            f"Index v{self.version} committed: {len(self.documents)} documents, "
+            f"{self.num_live_rows}/{self.num_rows} live rows"
+        )
+        return True
+
+    # ── Reading ─────────────────────────────────────────────────
+
+    def load(self) -> Tuple[List[Dict], np.ndarray, np.ndarray]:
+        """
+        Open the committed index.
+
+        Returns:
+            (chunks, embeddings, alive) — embeddings is a read-only
+            memory map of the used rows; alive is a bool mask of live rows.
+        """
+        num_rows = self.num_rows
+        dim = self.manifest["dim"] or 0
+        if not num_rows:
+            return [], np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=bool)
+
+        embeddings = np.load(self._path(EMBEDDINGS_FILE), mmap_mode="r")[:num_rows]
+
+        chunks = []
+        with open(self._path(CHUNKS_FILE), "rb") as f:
+            for line in f.read(self.manifest["chunks_bytes"]).splitlines():
+                chunks.append(json.loads(line))
+        if len(chunks) != num_rows:
+            raise ValueError(f"Index is corrupt: {len(chunks)} chunks for {num_rows} rows")
+
+        alive = np.zeros(num_rows, dtype=bool)
+        for doc in self.documents.values():
+            alive[doc["row_start"]:doc["row_start"] + doc["row_count"]] = True
+
+        return chunks, embeddings, alive
+
+
+def _write_json(path: str, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
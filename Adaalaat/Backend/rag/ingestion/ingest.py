@@ -16,34 +16,33 @@ TODO: Implement the full ingestion pipeline.
 import argparse
 from rag.ingestion.loaders import load_documents
 from rag.embeddings import embed_documents
+from rag.chunking import iter_chunks
+from rag.tokenization import get_token_counter
 from database.qdrant_client import get_qdrant_client
-from config import Config
+from config import Config, load_json_config
 
 
 # ── Chunking config ─────────────────────────────────────────────
-CHUNK_SIZE = 512       # Characters per chunk
-CHUNK_OVERLAP = 50     # Overlap between chunks
+CHUNK_SIZE = 480       # Embedding-model tokens per chunk (BGE window is 512)
+CHUNK_OVERLAP = 48     # Overlapping tokens (whole sentences) between chunks
 
 
 def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
     """
-    Split text into overlapping chunks.
+    Split text into sentence-aligned, token-bounded chunks.
 
     Args:
         text: Full document text
-        chunk_size: Maximum characters per chunk
-        overlap: Number of overlapping characters between chunks
+        chunk_size: Maximum tokens per chunk
+        overlap: Tokens of trailing sentences repeated in the next chunk
 
-    Returns:
-        list[str]: Text chunks
+    Yields:
+        str: Text chunks, lazily
     """
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start = end - overlap
-    return chunks
+    model_name = load_json_config().get("embedding", {}).get("model_name", "BAAI/bge-small-en-v1.5")
+    counter = get_token_counter(model_name)
+    for chunk in iter_chunks([{"text": text, "page": 1}], counter, chunk_size, overlap):
+        yield chunk["text"]
 
 
 def ingest(source_dir, collection_name=None):
@@ -5,10 +5,8 @@ Loads legal documents from various file formats into a standard structure.
 
 Supported formats:
     - .txt  (plain text)
-    - .pdf  (via PyPDF2 or pdfplumber)
+    - .pdf  (via pypdf, see rag/pdf_extractor.py)
     - .html (stripped of tags)
-
-TODO: Implement PDF loading (add PyPDF2 or pdfplumber to requirements.txt).
 """
 
 import os
@@ -79,19 +77,14 @@ def load_pdf(filepath, title):
     """
     Load a PDF file.
 
-    TODO: Implement with PyPDF2 or pdfplumber:
-        pip install PyPDF2
-        # or
-        pip install pdfplumber
+    Pages are extracted in parallel and cached per page by the same
+    engine the local retriever uses (rag/pdf_extractor.py).
     """
-    # Placeholder — requires PyPDF2 or pdfplumber
-    # import PyPDF2
-    # reader = PyPDF2.PdfReader(filepath)
-    # text = "\n".join(page.extract_text() or "" for page in reader.pages)
-    # return {"text": text, "source": filepath, "title": title}
-
-    print(f"PDF loading not implemented yet: {filepath}")
-    return None
+    from rag.pdf_extractor import extract_pages
+
+    pages = [page for page in extract_pages(filepath) if page["text"].strip()]
+    text = "\n".join(page["text"] for page in pages)
+    return {"text": text, "source": filepath, "title": title, "pages": pages}
 
 
 def load_html(filepath, title):
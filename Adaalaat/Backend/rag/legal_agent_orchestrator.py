@@ -15,24 +15,76 @@ Architecture:
 
 Pipeline:
     1. Decider classifies the query → LEGAL_RAG / GENERAL
-    2. RAG search retrieves from the local PDF embeddings
+    2. RAG search retrieves from the local PDF embeddings (started on the
+       raw query while the decider runs, re-run if the rewrite differs)
     3. If RAG yields no results, the LLM responds from its own knowledge
        with a disclaimer (LLM fallback)
     4. Synthesizer (Llama-3.1-8B) merges context into a legal advisory
+
+Every prompt is packed to fit the LLM's context window (see
+context_packer.py): the lowest-ranked chunks and the oldest history
+turns are cut first.
+
+Finished answers are kept in a semantic cache (answer_cache.py), so a
+paraphrase of a recent question with the same chat history skips both
+LLM calls. A local router (query_router.py) classifies confident,
+history-free queries in-process, skipping the decider LLM call.
+
+stream_async() runs the same pipeline and streams the final answer
+token by token (used by the /api/advisory/stream SSE endpoint).
+
+Both take an optional request deadline (deadline.py): a stage that can
+no longer finish in time raises DeadlineExceeded, so the caller can
+serve its fast fallback instead.
+
+One orchestrator serves every request of the process, concurrently.
+Everything a request produces along the way (decision, retrieved
+chunks, cited sources) lives in its own RequestContext, never on the
+orchestrator; see stress_orchestrator.py.
 """
 
 import os
 import json
+import asyncio
 import logging
-from typing import List, Optional
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
 from llama_index.core.llms import ChatMessage
 
-from rag.local_pdf_retriever import search as pdf_search
+from rag.local_pdf_retriever import (
+    search_batch as pdf_search_batch,
+    merge_results,
+    select_diverse,
+    get_index_version,
+)
+from rag.answer_cache import SemanticAnswerCache
+from rag.query_router import QueryRouter
+from rag.context_packer import ContextPacker, PackedContext
+from rag.tokenization import get_token_counter
+from rag.metrics import get_counter
+from rag.deadline import Deadline, current_deadline, deadline_scope
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class RequestContext:
+    """State of one request as it moves through the pipeline."""
+    query: str
+    history: List[ChatMessage]
+    query_embedding: Optional[np.ndarray] = None
+    decision: str = ""
+    search_query: str = ""
+    sources: List[Dict] = field(default_factory=list)
+    served_by: str = ""
+
+    def result(self, answer: str) -> Dict:
+        return {"answer": answer, "sources": list(self.sources), "served_by": self.served_by}
+
+
 class LegalAgentOrchestrator:
     """
     Legal advisory pipeline using Llama-3.1-8B via HuggingFace Inference API.
@@ -46,6 +98,46 @@ class LegalAgentOrchestrator:
 
         self.llm = llm
 
+        # Token budgeting with the LLM's own tokenizer (provider suffixes like ":novita" stripped)
+        packing = self.config.get("rag_agent", {}).get("context_packing", {})
+        tokenizer_name = getattr(llm, "api_model", llm.metadata.model_name).split(":")[0]
+        self.packer = ContextPacker(
+            get_token_counter(tokenizer_name),
+            context_window=llm.metadata.context_window,
+            max_output_tokens=llm.metadata.num_output,
+            safety_margin=packing.get("safety_margin", 64),
+            history_share=packing.get("history_share", 0.3),
+            min_chunk_tokens=packing.get("min_chunk_tokens", 64),
+        )
+
+        cache_config = self.config.get("rag_agent", {}).get("answer_cache", {})
+        self.answer_cache = (
+            SemanticAnswerCache(
+                threshold=cache_config.get("threshold", 0.92),
+                max_size=cache_config.get("max_size", 512),
+                ttl_seconds=cache_config.get("ttl_seconds", 3600),
+            )
+            if cache_config.get("enabled", True) else None
+        )
+
+        router_config = self.config.get("rag_agent", {}).get("router", {})
+        self.router = (
+            QueryRouter(
+                embed_fn=_embed_query_batch,
+                min_confidence=router_config.get("min_confidence", 0.06),
+                keyword_weight=router_config.get("keyword_weight", 0.03),
+                top_n=router_config.get("top_n", 3),
+                exemplar_retry_seconds=router_config.get("exemplar_retry_seconds", 60.0),
+            )
+            if router_config.get("enabled", True) else None
+        )
+
+        self.speculation = self.config.get("rag_agent", {}).get("speculative_retrieval", {})
+        self.stage_budgets = {
+            "decider": 1.5, "retrieval": 0.5, "synthesis": 3.0,
+            **self.config.get("rag_agent", {}).get("deadline", {}).get("min_stage_seconds", {}),
+        }
+
         # Pre-load the PDF embeddings on init
         logger.info("Pre-loading legal document embeddings...")
         try:
@@ -94,36 +186,136 @@ CRITICAL RULES:
 5. Strongly recommend consulting a qualified lawyer for verified legal advice.
 6. Be empathetic but factual."""
 
-        self.last_search_sources = []
-
     # ── Direct Tool Calls ───────────────────────────────────────
 
-    def _search_legal_database(self, query: str) -> str:
-        """Search the local PDF using in-memory cosine similarity."""
-        logger.info(f"[RAG] Searching local PDF for: '{query}'")
-        self.last_search_sources = []
+    def _search_legal_database(self, queries: List[str], stop: Optional[threading.Event] = None) -> List[Dict]:
+        """
+        Search the local PDF using in-memory cosine similarity.
+
+        All phrasings of the question (e.g. the decider's rewrite and the
+        original query) are scored in one batch and merged by best score.
+        The `mmr_candidates` best chunks are then narrowed to `chunk_top_k`
+        by maximal marginal relevance, dropping near-duplicates and merging
+        neighbouring chunks from the same page.
+
+        Args:
+            queries: Phrasings of the question to search
+            stop: Set when the results are no longer wanted (a discarded
+                speculative search). Checked between stages, so the search
+                gives up before it starts or before MMR; the embedding call
+                and index scan already under way still run to completion.
+
+        Returns:
+            The selected chunks (empty if nothing relevant was found or
+            the search was stopped)
+        """
+        queries = list(dict.fromkeys(q for q in queries if q))
+
+        def stopped() -> bool:
+            if stop is None or not stop.is_set():
+                return False
+            _speculation_cancelled.inc()
+            logger.info(f"[RAG] Search for {queries} no longer needed, stopped early")
+            return True
+
+        if stopped():
+            return []
+        logger.info(f"[RAG] Searching local PDF for: {queries}")
 
         try:
-            chunk_top_k = self.config.get("rag_agent", {}).get("chunk_top_k", 8)
-            results = pdf_search(query, top_k=chunk_top_k)
+            rag_config = self.config.get("rag_agent", {})
+            chunk_top_k = rag_config.get("chunk_top_k", 8)
+            num_candidates = max(rag_config.get("mmr_candidates", 20), chunk_top_k)
+            candidates = merge_results(pdf_search_batch(queries, top_k=num_candidates), num_candidates)
+            if stopped():
+                return []
+            results = select_diverse(
+                candidates,
+                chunk_top_k,
+                lambda_mult=rag_config.get("mmr_lambda", 0.7),
+                duplicate_threshold=rag_config.get("mmr_duplicate_threshold", 0.95),
+            )
+
+            logger.info(
+                f"[RAG] Found {len(results)} relevant passages "
+                f"(MMR over {len(candidates)} candidates, "
+                f"{sum(len(r['text']) for r in results)} chars of context)"
+            )
+            return results
 
-            if not results:
-                return ""
+        except Exception as e:
+            logger.error(f"[RAG] Local PDF search failed: {e}")
+            return []
 
-            formatted_chunks = []
-            for r in results:
-                formatted_chunks.append(f"[Source: {r['source']}]\n{r['text']}")
-                self.last_search_sources.append({
-                    "source": r["source"],
-                    "relevance_score": r["score"],
-                })
+    def _build_messages(self, system_prompt: str, history: List[ChatMessage], query: str,
+                        chunks: Optional[List[Dict]] = None) -> Tuple[List[ChatMessage], PackedContext]:
+        """
+        Assemble a prompt that fits the context window.
 
-            logger.info(f"[RAG] Found {len(results)} relevant chunks")
-            return "\n\n---\n\n".join(formatted_chunks)
+        Retrieved chunks, if any, are appended to the system prompt under
+        "Relevant Legal Context"; chunks and history turns that do not fit
+        are left out (see ContextPacker).
+        """
+        context_header = "\n\nRelevant Legal Context:\n" if chunks else ""
+        packed = self.packer.pack(
+            system_prompt, query, history=history, chunks=chunks or [], context_header=context_header,
+        )
+        if packed.chunks:
+            system_prompt = f"{system_prompt}{context_header}{packed.context}"
+        messages = [
+            ChatMessage(role="system", content=system_prompt),
+            *packed.history,
+            ChatMessage(role="user", content=query),
+        ]
+        return messages, packed
+
+    async def _embed_query(self, query: str) -> Optional[np.ndarray]:
+        """
+        Normalized query embedding for the answer cache and router.
 
+        None if neither is enabled or embedding fails. The shared model
+        caches it, so retrieval does not embed the query again.
+        """
+        if self.answer_cache is None and self.router is None:
+            return None
+        try:
+            embedding = np.asarray((await asyncio.to_thread(_embed_query_batch, [query]))[0], dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            return embedding / norm if norm else None
         except Exception as e:
-            logger.error(f"[RAG] Local PDF search failed: {e}")
-            return ""
+            logger.warning(f"Query embedding failed, skipping answer cache and router: {e}")
+            return None
+
+    async def _decide(self, query: str, normalized_history: List[ChatMessage]):
+        """
+        Ask the decider LLM for LEGAL_RAG / GENERAL and a standalone search query.
+
+        Returns:
+            (decision, search_query) — LEGAL_RAG on the raw query if the reply cannot be parsed
+        """
+        decider_messages, _ = self._build_messages(self.decider_prompt, normalized_history, query)
+
+        try:
+            decision_response = await self.llm.achat(messages=decider_messages)
+            raw_content = decision_response.message.content.strip()
+            logger.info(f"[DECIDER] Raw response: {raw_content[:200]}")
+
+            # Extract JSON from the response (handle markdown code blocks)
+            if "```" in raw_content:
+                raw_content = raw_content.split("```")[1]
+                if raw_content.startswith("json"):
+                    raw_content = raw_content[4:]
+                raw_content = raw_content.strip()
+
+            decision_json = json.loads(raw_content)
+            decision = decision_json.get("decision", "GENERAL").upper()
+            search_query = decision_json.get("search_query") or query
+            logger.info(f"[DECIDER] Decision: {decision}, Search: {search_query}")
+        except Exception as e:
+            logger.warning(f"[DECIDER] Failed to parse, defaulting to LEGAL_RAG: {e}")
+            decision, search_query = "LEGAL_RAG", query
+
+        return decision, search_query
 
     def _normalize_chat_history(self, history: list) -> List[ChatMessage]:
         """Normalize chat history into LlamaIndex ChatMessage format."""
@@ -137,93 +329,254 @@ CRITICAL RULES:
                 messages.append(ChatMessage(role=role, content=content))
         return messages
 
+    async def _rewrite_matches(self, query: str, search_query: str,
+                               query_embedding: Optional[np.ndarray]) -> bool:
+        """
+        Whether retrieval on the raw query can stand in for the decider's rewrite.
+
+        True when the rewrite is the query itself or their embeddings'
+        cosine similarity reaches `speculative_retrieval.reuse_threshold`.
+        """
+        if search_query.strip().lower() == query.strip().lower():
+            return True
+        try:
+            embeddings = [query_embedding] if query_embedding is not None else []
+            texts = [search_query] if embeddings else [query, search_query]
+            embeddings += await asyncio.to_thread(_embed_query_batch, texts)
+            a, b = (np.asarray(e, dtype=np.float32) for e in embeddings)
+            similarity = float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b) or 1.0))
+        except Exception as e:
+            logger.warning(f"[RAG] Could not compare rewrite to query, re-running retrieval: {e}")
+            return False
+
+        threshold = self.speculation.get("reuse_threshold", 0.9)
+        logger.info(f"[RAG] Rewrite similarity {similarity:.3f} (reuse threshold {threshold})")
+        return similarity >= threshold
+
+    def _check_deadline(self, stage: str):
+        """Raise DeadlineExceeded if less than the stage's minimum budget is left."""
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(stage, self.stage_budgets.get(stage, 0.0))
+
+    def _has_budget_for(self, *stages: str) -> bool:
+        deadline = current_deadline()
+        return deadline is None or deadline.remaining() >= sum(self.stage_budgets.get(s, 0.0) for s in stages)
+
     # ── Main Pipeline ───────────────────────────────────────────
 
     async def run_async(
         self,
         query: str,
         history: Optional[list] = None,
+        deadline: Optional[Deadline] = None,
     ):
         """
         Execute the legal reasoning pipeline.
 
         Steps:
-            1. Decider classifies the query (LLM call)
+            0. Semantic answer cache — a close paraphrase with the same
+               history returns the stored answer
+            1. Router / decider classifies the query (LLM call only when
+               the local router is not confident)
             2. Direct tool calls to retrieve context
             3. If RAG returns results → Synthesizer merges them into advisory
             4. If RAG returns nothing → LLM fallback from general knowledge
+
+        With a `deadline`, each stage first checks that its minimum budget
+        (rag_agent.deadline.min_stage_seconds) is left, and the embedder
+        and LLM shorten their timeouts to it.
+
+        Returns:
+            {"answer", "sources", "served_by"} — served_by is "answer_cache",
+            "rag", "llm_fallback" or "general"
+
+        Raises:
+            DeadlineExceeded: the deadline would be missed; serve a fast fallback
+            CircuitOpenError / API errors: the final LLM call failed after retries
         """
         logger.info(f"\n--- New Legal Query: '{query}' ---")
-        history = history or []
-        normalized_history = self._normalize_chat_history(history)
+        ctx = RequestContext(query, self._normalize_chat_history(history or []))
 
-        # ── 1. Decider Phase ────────────────────────────────────
-        decider_messages = [
-            ChatMessage(role="system", content=self.decider_prompt),
-            *normalized_history,
-            ChatMessage(role="user", content=query),
-        ]
+        with deadline_scope(deadline):
+            # ── 0. Semantic Answer Cache ────────────────────────
+            ctx.query_embedding = await self._embed_query(query)
+            cached = self._cached_answer(ctx)
+            if cached is not None:
+                return cached
 
-        try:
-            decision_response = await self.llm.achat(messages=decider_messages)
-            raw_content = decision_response.message.content.strip()
-            logger.info(f"[DECIDER] Raw response: {raw_content[:200]}")
+            messages = await self._prepare_synthesis(ctx)
+            final_response = await self.llm.achat(messages=messages)
+            logger.info("[SYNTH] Advisory generated ✓")
 
-            # Extract JSON from the response (handle markdown code blocks)
-            if "```" in raw_content:
-                raw_content = raw_content.split("```")[1]
-                if raw_content.startswith("json"):
-                    raw_content = raw_content[4:]
-                raw_content = raw_content.strip()
+        result = ctx.result(final_response.message.content)
+        self._cache_answer(ctx, result)
+        return result
 
-            decision_json = json.loads(raw_content)
-            decision = decision_json.get("decision", "GENERAL").upper()
-            search_query = decision_json.get("search_query", query)
-            logger.info(f"[DECIDER] Decision: {decision}, Search: {search_query}")
-        except Exception as e:
-            logger.warning(f"[DECIDER] Failed to parse, defaulting to LEGAL_RAG: {e}")
-            decision, search_query = "LEGAL_RAG", query
+    async def stream_async(self, query: str, history: Optional[list] = None,
+                           deadline: Optional[Deadline] = None):
+        """
+        Same pipeline as run_async, streaming the final answer.
 
-        self.last_search_sources = []
+        The deadline covers everything before the first token; once
+        generation starts it is no longer enforced.
+
+        Yields (event, data) pairs:
+            ("sources", [...])   the cited chunks, once retrieval is done
+            ("token", "...")     answer text as the LLM generates it
+            ("done", {...})      the complete result, as returned by run_async
+        """
+        logger.info(f"\n--- New Legal Query (streaming): '{query}' ---")
+        ctx = RequestContext(query, self._normalize_chat_history(history or []))
+
+        # Kept within one step of the generator: each step may run in its own task context
+        with deadline_scope(deadline):
+            ctx.query_embedding = await self._embed_query(query)
+            cached = self._cached_answer(ctx)
+            if cached is None:
+                messages = await self._prepare_synthesis(ctx)
+
+        if cached is not None:
+            yield "sources", cached["sources"]
+            yield "token", cached["answer"]
+            yield "done", cached
+            return
+
+        yield "sources", list(ctx.sources)
+
+        answer = ""
+        async for chunk in await self.llm.astream_chat(messages=messages):
+            if chunk.delta:
+                answer += chunk.delta
+                yield "token", chunk.delta
+        logger.info("[SYNTH] Advisory streamed ✓")
+
+        result = ctx.result(answer)
+        self._cache_answer(ctx, result)
+        yield "done", result
+
+    def _cached_answer(self, ctx: RequestContext) -> Optional[Dict]:
+        if ctx.query_embedding is None or self.answer_cache is None:
+            return None
+        cached = self.answer_cache.lookup(ctx.query_embedding, ctx.history, get_index_version())
+        if cached is None:
+            return None
+        ctx.sources, ctx.served_by = list(cached["sources"]), "answer_cache"
+        return ctx.result(cached["answer"])
+
+    def _cache_answer(self, ctx: RequestContext, result: Dict):
+        if ctx.query_embedding is None or self.answer_cache is None:
+            return
+        self.answer_cache.store(
+            ctx.query,
+            ctx.query_embedding,
+            {"answer": result["answer"], "sources": list(result["sources"])},
+            ctx.history,
+            get_index_version(),
+        )
+
+    async def _prepare_synthesis(self, ctx: RequestContext) -> List[ChatMessage]:
+        """
+        Decider → retrieval → the messages for the final LLM call.
+
+        When the decider LLM is consulted, retrieval on the raw query runs
+        concurrently with it. The speculative results are used if the
+        decider's rewrite means the same thing, replaced by a search on
+        the rewrite if not, and discarded for GENERAL queries. A discarded
+        search is told to stop, but its worker thread cannot be interrupted
+        mid-stage (see _search_legal_database).
+
+        Fills in ctx.decision, ctx.search_query, ctx.sources (the chunks
+        that made it into the prompt) and ctx.served_by ("rag",
+        "llm_fallback" or "general").
+
+        Returns:
+            The messages for the final LLM call
+        """
+        query, normalized_history = ctx.query, ctx.history
+        # ── 1. Decider Phase ────────────────────────────────────
+        route = None
+        if self.router is not None:
+            if ctx.query_embedding is not None and not self.router.exemplars_ready:
+                # One embedding call on first use; off the event loop, which serves every request
+                await asyncio.to_thread(self.router.ensure_exemplars)
+            route = self.router.route(query, ctx.query_embedding, normalized_history)
+        speculative, stop_speculation = None, threading.Event()
+
+        def discard_speculation():
+            # cancel() only stops waiting; the worker thread exits at its next stop check
+            stop_speculation.set()
+            if speculative is not None:
+                speculative.cancel()
+
+        if route is not None and route.fast_path:
+            decision, search_query = route.decision, query
+        elif not self._has_budget_for("decider", "synthesis"):
+            # Not enough time for two LLM calls: search the raw query
+            logger.info("[DEADLINE] Skipping the decider LLM call, searching the raw query")
+            decision, search_query = "LEGAL_RAG", query
+        else:
+            # Retrieve on the raw query while the decider LLM runs
+            if self.speculation.get("enabled", True):
+                speculative = asyncio.create_task(
+                    asyncio.to_thread(self._search_legal_database, [query], stop_speculation)
+                )
+            try:
+                decision, search_query = await self._decide(query, normalized_history)
+            except BaseException:
+                discard_speculation()
+                raise
+        ctx.decision, ctx.search_query = decision, search_query
 
         # ── 2. Direct Tool Calls ────────────────────────────────
         if decision == "GENERAL":
-            messages = [
-                ChatMessage(role="system", content=self.synthesizer_prompt),
-                *normalized_history,
-                ChatMessage(role="user", content=query),
-            ]
-            final_response = await self.llm.achat(messages=messages)
-            return {"answer": final_response.message.content, "sources": []}
+            discard_speculation()
+            self._check_deadline("synthesis")
+            messages, _ = self._build_messages(self.synthesizer_prompt, normalized_history, query)
+            ctx.served_by = "general"
+            return messages
 
         # ── 3. RAG Search ───────────────────────────────────────
-        rag_result = self._search_legal_database(search_query)
+        if speculative is None:
+            self._check_deadline("retrieval")
+        if speculative is not None and await self._rewrite_matches(query, search_query, ctx.query_embedding):
+            rag_results = await speculative
+            _speculation_reused.inc()
+            logger.info("[RAG] Reusing speculative retrieval on the original query")
+        else:
+            if speculative is not None:
+                discard_speculation()
+                _speculation_rerun.inc()
+            rag_results = await asyncio.to_thread(self._search_legal_database, [search_query, query])
 
         # ── 4. Synthesis / LLM Fallback ─────────────────────────
-        if rag_result:
-            # RAG returned context → synthesize with it
-            synthesis_messages = [
-                ChatMessage(
-                    role="system",
-                    content=f"{self.synthesizer_prompt}\n\nRelevant Legal Context:\n{rag_result}",
-                ),
-                *normalized_history,
-                ChatMessage(role="user", content=query),
+        self._check_deadline("synthesis")
+        if rag_results:
+            # RAG returned context → synthesize with it (only the chunks that fit are cited)
+            synthesis_messages, packed = self._build_messages(
+                self.synthesizer_prompt, normalized_history, query, chunks=rag_results
+            )
+            ctx.sources = [
+                {"source": r["source"], "relevance_score": r["score"]} for r in packed.chunks
             ]
             logger.info("[SYNTH] Generating final advisory with RAG context...")
         else:
             # No RAG results → fall back to LLM general knowledge
-            synthesis_messages = [
-                ChatMessage(role="system", content=self.llm_fallback_prompt),
-                *normalized_history,
-                ChatMessage(role="user", content=query),
-            ]
+            synthesis_messages, _ = self._build_messages(self.llm_fallback_prompt, normalized_history, query)
             logger.info("[FALLBACK] No RAG results — using LLM general knowledge...")
 
-        final_response = await self.llm.achat(messages=synthesis_messages)
-        logger.info("[SYNTH] Advisory generated ✓")
+        ctx.served_by = "rag" if rag_results else "llm_fallback"
+        return synthesis_messages
 
-        return {
-            "answer": final_response.message.content,
-            "sources": self.last_search_sources,
-        }
+
+_speculation_reused = get_counter("retrieval.speculative.reused")
+_speculation_rerun = get_counter("retrieval.speculative.rerun")
+# Discarded speculative searches that stopped before finishing all their work
+_speculation_cancelled = get_counter("retrieval.speculative.cancelled")
+
+
+def _embed_query_batch(queries: List[str]) -> list:
+    """Query embeddings from the shared (cached, micro-batched) embedding model."""
+    from rag.embedding_manager import get_shared_embedding_model
+
+    return get_shared_embedding_model().get_query_embedding_batch(queries)
@@ -0,0 +1,109 @@
+"""
+LLM Response Cache
+
+Content-addressed cache of chat completions. The key is a hash of the
+model, the normalized message list (role + whitespace-collapsed
+content) and the sampling parameters, so an identical prompt (the same
+decider query, or the same synthesis query over the same retrieved
+chunks) is answered without another API call.
+
+Storage is pluggable:
+
+    memory  in-process LRUCache (per worker)
+    sqlite  SQLiteCache file shared by every worker on the host
+
+Both bound their size and expire entries after `ttl_seconds`. Each entry
+remembers how long the original call took and how many tokens it used,
+so hits are reported as saved latency and saved tokens on /api/metrics.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Optional, Sequence
+
+from rag.cache import LRUCache, SQLiteCache
+from rag.metrics import get_counter
+
+logger = logging.getLogger(__name__)
+
+
+def response_cache_key(model: str, messages: Sequence[Dict], params: Optional[Dict] = None) -> str:
+    """Hash of the model, the normalized messages and the sampling parameters."""
+    normalized = [
+        (str(m.get("role", "")), " ".join(str(m.get("content") or "").split()))
+        for m in messages
+    ]
+    payload = json.dumps(
+        {"model": model, "messages": normalized, "params": params or {}},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Chat completion cache over an LRUCache or SQLiteCache."""
+
+    def __init__(self, backend: str = "memory", max_size: int = 1024, ttl_seconds: float = 3600,
+                 disk_path: str = None):
+        """
+        Args:
+            backend: "memory" (per process) or "sqlite" (shared on-disk file)
+            max_size: Entries kept before the least recently used are evicted
+            ttl_seconds: Entry lifetime
+            disk_path: SQLite file (backend "sqlite" only)
+        """
+        if backend == "sqlite":
+            if not disk_path:
+                raise ValueError("llm.response_cache.disk_path is required for the sqlite backend")
+            self._store = SQLiteCache(disk_path, ttl_seconds=ttl_seconds, max_entries=max_size)
+        elif backend == "memory":
+            self._store = LRUCache(max_size=max_size, ttl_seconds=ttl_seconds)
+        else:
+            raise ValueError(f"Unknown LLM response cache backend: {backend}")
+        self.backend = backend
+
+        self._hits = get_counter("llm_cache.hits")
+        self._misses = get_counter("llm_cache.misses")
+        self._saved_latency = get_counter("llm_cache.saved_latency_ms")
+        self._saved_tokens = get_counter("llm_cache.saved_tokens")
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached completion text for `key`, or None."""
+        value = self._store.get(key)
+        if value is None:
+            self._misses.inc()
+            return None
+        entry = json.loads(value)
+        self._hits.inc()
+        self._saved_latency.inc(entry.get("latency_ms", 0))
+        self._saved_tokens.inc(entry.get("tokens", 0))
+        logger.debug(f"[LLM CACHE] Hit — saved {entry.get('latency_ms', 0):.0f} ms")
+        return entry["content"]
+
+    def set(self, key: str, content: str, latency_ms: float = 0.0, tokens: int = 0):
+        """Store a completion with the cost of producing it."""
+        value = json.dumps({"content": content, "latency_ms": round(latency_ms, 1), "tokens": tokens})
+        self._store.set(key, value.encode("utf-8") if self.backend == "sqlite" else value)
+
+    def stats(self) -> Dict:
+        return {"backend": self.backend, **self._store.stats()}
+
+
+def build_response_cache(settings: Dict, base_dir: str) -> Optional[LLMResponseCache]:
+    """
+    Create the cache from config.json `llm.response_cache` (None when disabled).
+
+    A relative disk_path is resolved against `base_dir`.
+    """
+    if not settings.get("enabled", False):
+        return None
+    disk_path = settings.get("disk_path")
+    return LLMResponseCache(
+        backend=settings.get("backend", "memory"),
+        max_size=settings.get("max_size", 1024),
+        ttl_seconds=settings.get("ttl_seconds", 3600),
+        disk_path=os.path.join(base_dir, disk_path) if disk_path else None,
+    )
@@ -1,61 +1,97 @@
 """
 Local PDF Retriever
 
-Loads a legal PDF at startup, chunks it, embeds all chunks in-memory
-using HuggingFace embeddings, then performs cosine similarity search
-at query time — no external vector store needed.
+Indexes the legal corpus (every PDF/TXT/HTML/MD file under data/) at
+startup, chunks it, embeds all chunks using HuggingFace embeddings,
+then performs cosine similarity search at query time — no external
+vector store needed.
+
+The chunk embeddings are persisted under data/index/ (see index_store.py)
+and memory-mapped on later starts. A manifest of file hashes means that
+adding, changing or removing one document only re-embeds that document;
+changing the embedding model or chunking parameters rebuilds everything.
+
+Retrieval is hybrid: a BM25 inverted index (bm25.py) over the same
+chunks is fused with the dense ranking by reciprocal-rank fusion, so
+exact statute references ("Section 106") are not lost to embedding
+similarity. If the embedding endpoint fails or is slower than
+`hybrid.dense_timeout_seconds`, search falls back to BM25 alone.
 
 This replaces Qdrant for simpler deployment.
 """
 
 import os
+import time
 import logging
+import threading
 import numpy as np
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Iterable, Iterator, List, Dict, Optional
+
+from config import load_json_config
+from rag import index_store
+from rag.chunking import CHUNKER_VERSION, iter_chunks
+from rag.tokenization import get_token_counter
+from rag.ann_index import build_ann_index
+from rag.bm25 import build_bm25_index, reciprocal_rank_fusion
+from rag.embedding_providers import provider_id
+from rag.mmr import mmr_select, merge_adjacent_chunks
 
 logger = logging.getLogger(__name__)
 
 # ── Singleton cache ─────────────────────────────────────────────
 _cached_chunks: Optional[List[Dict]] = None
 _cached_embeddings: Optional[np.ndarray] = None
+_cached_alive: Optional[np.ndarray] = None  # False for rows tombstoned in the index store
+_ann_index = None  # ExactIndex or IVFFlatIndex over _cached_embeddings
+_bm25_index = None  # BM25Index over _cached_chunks (None when hybrid search is off)
+_hybrid_settings: Dict = {}
+_index_version: Optional[int] = None
 
+# One (re)load at a time in this process; index_store.build_lock covers other processes
+_load_lock = threading.Lock()
 
-def _load_pdf(pdf_path: str) -> str:
-    """Extract all text from a PDF file using pypdf."""
-    from pypdf import PdfReader
+# Query embedding runs here so search can stop waiting on a slow endpoint
+_embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
 
-    reader = PdfReader(pdf_path)
-    pages = []
-    for i, page in enumerate(reader.pages):
-        text = page.extract_text() or ""
-        if text.strip():
-            pages.append({"text": text, "page": i + 1})
+
+def _reset_after_fork():
+    # The pool's threads, and a lock a parent thread may have held, stay behind in the parent
+    global _embed_executor, _load_lock
+    _embed_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="query-embed")
+    _load_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CORPUS_DIR = os.path.join(BACKEND_DIR, "data")
+DEFAULT_INDEX_DIR = os.path.join(BACKEND_DIR, "data", "index")
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".html")
+
+
+def _load_pdf(pdf_path: str) -> List[Dict]:
+    """Extract all text from a PDF file (parallel, page-cached — see pdf_extractor.py)."""
+    from rag.pdf_extractor import extract_pages
+
+    pages = [page for page in extract_pages(pdf_path) if page["text"].strip()]
     logger.info(f"Loaded {len(pages)} pages from {os.path.basename(pdf_path)}")
     return pages
 
 
-def _chunk_pages(pages: List[Dict], chunk_size: int = 512, overlap: int = 50) -> List[Dict]:
-    """
-    Split page texts into overlapping chunks.
-
-    Each chunk retains its page number for source attribution.
-    """
-    chunks = []
-    for page in pages:
-        text = page["text"]
-        page_num = page["page"]
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            chunk_text = text[start:end].strip()
-            if chunk_text:
-                chunks.append({
-                    "text": chunk_text,
-                    "page": page_num,
-                    "char_start": start,
-                })
-            start = end - overlap
-    logger.info(f"Created {len(chunks)} chunks (size={chunk_size}, overlap={overlap})")
+def _chunk_pages(pages: Iterable[Dict], chunk_size: int = 480, overlap: int = 48,
+                 model_name: str = "BAAI/bge-small-en-v1.5") -> List[Dict]:
+    """
+    Split page texts into sentence-aligned, token-bounded chunks.
+
+    chunk_size and overlap are in tokens of the embedding model's
+    tokenizer (see chunking.py). Each chunk retains its page number for
+    source attribution.
+    """
+    counter = get_token_counter(model_name)
+    chunks = list(iter_chunks(pages, counter, max_tokens=chunk_size, overlap_tokens=overlap))
+    logger.info(f"Created {len(chunks)} chunks (max_tokens={chunk_size}, overlap={overlap})")
     return chunks
 
 
@@ -71,16 +107,8 @@ def _compute_embeddings(chunks: List[Dict]) -> np.ndarray:
     logger.info("Embedding chunks...")
 
     texts = [c["text"] for c in chunks]
+    embeddings = np.array(embed_model.get_text_embedding_batch(texts), dtype=np.float32)
 
-    # Embed in batches to avoid OOM
-    batch_size = 32
-    all_embeddings = []
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i : i + batch_size]
-        batch_embeddings = [embed_model.get_text_embedding(t) for t in batch]
-        all_embeddings.extend(batch_embeddings)
-
-    embeddings = np.array(all_embeddings, dtype=np.float32)
     # Normalize for cosine similarity
     norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
     norms[norms == 0] = 1  # Avoid division by zero
@@ -90,78 +118,394 @@ def _compute_embeddings(chunks: List[Dict]) -> np.ndarray:
     return embeddings
 
 
-def _ensure_loaded(pdf_path: str = None):
-    """Load and cache the PDF chunks + embeddings on first call."""
-    global _cached_chunks, _cached_embeddings
+def _iter_document_pages(path: str) -> Iterator[Dict]:
+    """Stream a document's text as pages ({"text", "page"}); non-PDFs are one page."""
+    if path.lower().endswith(".pdf"):
+        from rag.pdf_extractor import extract_pages
 
-    if _cached_chunks is not None and _cached_embeddings is not None:
+        yield from extract_pages(path)
         return
 
-    if pdf_path is None:
-        pdf_path = os.path.join(
-            os.path.dirname(__file__), "..", "data", "legal_document.pdf"
-        )
+    from rag.ingestion.loaders import load_html, load_text
+
+    title = os.path.splitext(os.path.basename(path))[0]
+    loader = load_html if path.lower().endswith(".html") else load_text
+    yield {"text": loader(path, title)["text"], "page": 1}
+
+
+def _document_title(doc_id: str) -> str:
+    """'statutes/legal_document.pdf' → 'Legal Document'."""
+    stem = os.path.splitext(os.path.basename(doc_id))[0]
+    return stem.replace("_", " ").replace("-", " ").strip().title()
+
+
+def _scan_corpus(corpus_path: str, index_dir: str) -> Dict[str, str]:
+    """Map doc_id (path relative to the corpus root) → absolute path for every supported file."""
+    if os.path.isfile(corpus_path):
+        return {os.path.basename(corpus_path): os.path.abspath(corpus_path)}
+
+    files = {}
+    index_dir = os.path.abspath(index_dir)
+    for root, dirs, names in os.walk(corpus_path):
+        # Never index our own index/cache files
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != index_dir]
+        for name in names:
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                path = os.path.abspath(os.path.join(root, name))
+                doc_id = os.path.relpath(path, corpus_path).replace(os.sep, "/")
+                files[doc_id] = path
+    return files
+
+
+def _index_settings() -> Dict:
+    """Read the embedding model/provider, chunking, corpus and index locations from config.json."""
+    config = load_json_config()
+    rag_config = config.get("rag_agent", {})
+    return {
+        "model_name": config.get("embedding", {}).get("model_name", "BAAI/bge-small-en-v1.5"),
+        "provider": provider_id(config.get("embedding", {})),
+        "chunk_size": rag_config.get("chunk_size", 480),
+        "chunk_overlap": rag_config.get("chunk_overlap", 48),
+        "corpus_dir": os.path.join(BACKEND_DIR, rag_config.get("corpus_dir", DEFAULT_CORPUS_DIR)),
+        "index_dir": os.path.join(BACKEND_DIR, rag_config.get("index_dir", DEFAULT_INDEX_DIR)),
+        "compaction_threshold": rag_config.get("compaction_threshold", 0.25),
+        "ann": rag_config.get("ann", {}),
+        "hybrid": rag_config.get("hybrid", {}),
+    }
+
+
+def _sync_documents(store: "index_store.IndexStore", files: Dict[str, str], settings: Dict):
+    """
+    Bring the stored index in line with the files on disk.
+
+    Unchanged files (same size + mtime, or same hash) are skipped; new
+    and changed files are chunked and embedded together in one batched
+    pass; files that disappeared are tombstoned.
+    """
+    for doc_id in list(store.documents):
+        if doc_id not in files:
+            logger.info(f"Removing deleted document from index: {doc_id}")
+            store.remove_document(doc_id)
+
+    pending = []
+    for doc_id, path in sorted(files.items()):
+        stat = os.stat(path)
+        meta = {"size": stat.st_size, "mtime": stat.st_mtime}
+        existing = store.documents.get(doc_id)
+        if existing and existing["size"] == meta["size"] and existing["mtime"] == meta["mtime"]:
+            continue
+
+        sha256 = index_store.file_sha256(path)
+        if existing and existing["sha256"] == sha256:
+            store.update_document_meta(doc_id, **meta)
+            continue
+
+        logger.info(f"{'Re-indexing changed' if existing else 'Indexing new'} document: {doc_id}")
+        title = _document_title(doc_id)
+        page_numbers = []
+
+        def _pages():
+            for page in _iter_document_pages(path):
+                page_numbers.append(page["page"])
+                yield page
+
+        chunks = [
+            {**chunk, "title": title}
+            for chunk in iter_chunks(
+                _pages(),
+                get_token_counter(settings["model_name"]),
+                max_tokens=settings["chunk_size"],
+                overlap_tokens=settings["chunk_overlap"],
+            )
+        ]
+        meta.update({
+            "sha256": sha256,
+            "title": title,
+            "doc_type": os.path.splitext(path)[1].lstrip(".").lower(),
+            "num_pages": len(page_numbers),
+            "indexed_at": time.time(),
+        })
+        pending.append((doc_id, meta, chunks))
+
+    if not pending:
+        return
+
+    all_chunks = [chunk for _, _, chunks in pending for chunk in chunks]
+    embeddings = _compute_embeddings(all_chunks) if all_chunks else None
 
-    if not os.path.exists(pdf_path):
+    offset = 0
+    for doc_id, meta, chunks in pending:
+        store.add_document(doc_id, meta, chunks, embeddings[offset:offset + len(chunks)] if chunks else [])
+        offset += len(chunks)
+
+
+def _sync_and_load(corpus_path: str = None):
+    """Sync the stored index with the corpus, then (re)load it into this process."""
+    global _cached_chunks, _cached_embeddings, _cached_alive, _ann_index, _bm25_index, _hybrid_settings
+    global _index_version
+
+    settings = _index_settings()
+    corpus_path = corpus_path or settings["corpus_dir"]
+    files = _scan_corpus(corpus_path, settings["index_dir"]) if os.path.exists(corpus_path) else {}
+    if not files:
         raise FileNotFoundError(
-            f"Legal document not found at {pdf_path}. "
-            "Place your PDF at Backend/data/legal_document.pdf"
+            f"No legal documents found at {corpus_path}. "
+            "Place your PDFs (or .txt/.html files) in Backend/data/"
         )
 
-    logger.info(f"Loading legal document from: {pdf_path}")
-    pages = _load_pdf(pdf_path)
-    _cached_chunks = _chunk_pages(pages)
-    _cached_embeddings = _compute_embeddings(_cached_chunks)
-    logger.info("Legal document indexed in memory ✓")
+    key = index_store.build_index_key(
+        model_name=settings["model_name"],
+        chunker=CHUNKER_VERSION,
+        chunk_size=settings["chunk_size"],
+        chunk_overlap=settings["chunk_overlap"],
+        provider=settings["provider"],
+    )
+
+    with index_store.build_lock(settings["index_dir"]):
+        store = index_store.IndexStore(settings["index_dir"], key)
+        _sync_documents(store, files, settings)
+        if store.needs_compaction(settings["compaction_threshold"]):
+            store.compact()
+        store.commit()
+
+        chunks, embeddings, alive = store.load()
+        version_key = {**key, "version": store.version}
+        ann_index = build_ann_index(settings["ann"], embeddings, settings["index_dir"], version_key, alive)
+        bm25_index = None
+        if settings["hybrid"].get("enabled", True):
+            bm25_index = build_bm25_index(settings["hybrid"], chunks, alive, settings["index_dir"], version_key)
+
+    _cached_chunks, _cached_embeddings, _cached_alive, _ann_index = chunks, embeddings, alive, ann_index
+    _bm25_index, _hybrid_settings = bm25_index, settings["hybrid"]
+    _index_version = store.version
+    logger.info(
+        f"Legal corpus index v{store.version} ready ✓ "
+        f"({len(store.documents)} documents, {int(alive.sum())} chunks)"
+    )
 
 
-def search(query: str, top_k: int = 5, pdf_path: str = None) -> List[Dict]:
+def _ensure_loaded(corpus_path: str = None):
     """
-    Perform cosine similarity search against the in-memory PDF embeddings.
+    Load and cache the corpus chunks + embeddings on first call.
 
     Args:
-        query: The search query text
-        top_k: Number of top results to return
-        pdf_path: Optional override path to the PDF
+        corpus_path: Optional override — a directory of documents or a single file
+    """
+    if _cached_chunks is not None and _cached_embeddings is not None:
+        return
+    with _load_lock:
+        if _cached_chunks is None or _cached_embeddings is None:
+            _sync_and_load(corpus_path)
 
-    Returns:
-        List of dicts with keys: text, page, score
+
+def refresh_index(corpus_path: str = None) -> int:
     """
-    _ensure_loaded(pdf_path)
+    Re-scan the corpus and pick up added, changed or removed documents.
+
+    Only the affected documents are re-embedded. Searches keep using the
+    previous index until the new one is loaded. Returns the new index version.
+    """
+    with _load_lock:
+        _sync_and_load(corpus_path)
+        return _index_version
+
+
+def is_loaded() -> bool:
+    """Whether the corpus index is loaded in this process."""
+    return _cached_chunks is not None and _cached_embeddings is not None
+
 
+def get_index_version() -> Optional[int]:
+    """Version of the loaded index; it changes whenever the corpus index is rebuilt or updated."""
+    return _index_version
+
+
+def _embed_queries(queries: List[str]) -> np.ndarray:
+    """Embed queries together and L2-normalize them; returns (num_queries, dim)."""
     from rag.embedding_manager import get_shared_embedding_model
 
     embed_model = get_shared_embedding_model()
-
-    # Embed the query
-    query_embedding = np.array(
-        embed_model.get_text_embedding(query), dtype=np.float32
+    query_embeddings = np.array(
+        embed_model.get_query_embedding_batch(queries), dtype=np.float32
     )
-    query_norm = np.linalg.norm(query_embedding)
-    if query_norm > 0:
-        query_embedding = query_embedding / query_norm
+    norms = np.linalg.norm(query_embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return query_embeddings / norms
 
-    # Cosine similarity (embeddings are already normalized)
-    similarities = _cached_embeddings @ query_embedding
 
-    # Get top-k indices
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+def _await_embeddings(future, timeout: Optional[float]) -> Optional[np.ndarray]:
+    """
+    Wait up to `timeout` seconds for a submitted _embed_queries call.
 
+    Returns None if the embedding call fails or times out (the call keeps
+    running in the background and still fills the query cache).
+    """
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeoutError:
+        logger.warning(f"Query embedding exceeded {timeout}s — using lexical search only")
+    except Exception as e:
+        logger.warning(f"Query embedding failed ({e}) — using lexical search only")
+    return None
+
+
+def _shape_results(indices: np.ndarray, scores: np.ndarray,
+                   fusion_scores: Optional[np.ndarray] = None) -> List[Dict]:
+    """Build result dicts for one query's (index, score) pairs, in the given order."""
     results = []
-    for idx in top_indices:
-        score = float(similarities[idx])
-        if score > 0.0:  # Only include positive matches
-            results.append({
-                "text": _cached_chunks[idx]["text"],
-                "page": _cached_chunks[idx]["page"],
-                "score": round(score, 4),
-                "source": f"Legal Document - Page {_cached_chunks[idx]['page']}",
-            })
+    for i, (idx, score) in enumerate(zip(indices.tolist(), scores.tolist())):
+        chunk = _cached_chunks[idx]
+        result = {
+            "text": chunk["text"],
+            "page": chunk["page"],
+            "score": round(score, 4),
+            "source": f"{chunk['title']} - Page {chunk['page']}",
+            "doc_id": chunk["doc_id"],
+            "chunk_id": idx,
+        }
+        if fusion_scores is not None:
+            result["fusion_score"] = round(float(fusion_scores[i]), 6)
+        results.append(result)
+    return results
+
+
+def _fuse(dense_row: np.ndarray, lexical_row: np.ndarray, lexical_scores: np.ndarray,
+          query_embedding: np.ndarray, top_k: int, rrf_k: int) -> List[Dict]:
+    """RRF-fuse one query's dense and BM25 rankings; `score` stays the cosine similarity."""
+    ids, fused = reciprocal_rank_fusion(
+        [dense_row, lexical_row[lexical_scores > 0]], top_k, rrf_k=rrf_k
+    )
+    cosine = np.asarray(_cached_embeddings[ids] @ query_embedding)
+    return _shape_results(ids, cosine, fused)
+
+
+def _lexical_results(lexical_row: np.ndarray, lexical_scores: np.ndarray, top_k: int) -> List[Dict]:
+    """BM25-only results; `score` is BM25 scaled so the best match is 1.0."""
+    matched = lexical_scores[:top_k] > 0
+    ids, scores = lexical_row[:top_k][matched], lexical_scores[:top_k][matched]
+    return _shape_results(ids, scores / scores[0] if len(scores) else scores)
+
+
+def search_batch(queries: List[str], top_k: int = 5, corpus_path: str = None) -> List[List[Dict]]:
+    """
+    Score several queries against the in-memory PDF embeddings at once.
+
+    The queries are embedded together and scored in one call to the
+    configured index: a single matrix multiply against the (already
+    normalized) chunk embeddings for "exact", or a probe of the nearest
+    IVF lists for "ivf". With hybrid search on, the top `candidates` of
+    the dense and BM25 rankings are merged by reciprocal-rank fusion.
+
+    Args:
+        queries: The search query texts
+        top_k: Number of top results to return per query
+        corpus_path: Optional override path to the corpus (directory or file)
+
+    Returns:
+        One result list per query (same order), each a list of dicts
+        with keys: text, page, score, source, doc_id, chunk_id (plus
+        fusion_score when dense and lexical rankings were fused)
+    """
+    if not queries:
+        return []
+
+    _ensure_loaded(corpus_path)
+
+    if _bm25_index is None:
+        query_embeddings = _embed_queries(queries)
+        top_indices, top_scores = _ann_index.search(query_embeddings, top_k)
+        positive = top_scores > 0.0  # Only include positive matches (drops IVF padding)
+        return [
+            _shape_results(top_indices[row][positive[row]], top_scores[row][positive[row]])
+            for row in range(len(queries))
+        ]
+
+    candidates = max(_hybrid_settings.get("candidates", 50), top_k)
+
+    # BM25 scoring overlaps with the embedding request
+    embedding_future = _embed_executor.submit(_embed_queries, queries)
+    lexical_indices, lexical_scores = _bm25_index.search(queries, candidates)
+    query_embeddings = _await_embeddings(embedding_future, _hybrid_settings.get("dense_timeout_seconds", 3.0))
+
+    if query_embeddings is None:
+        return [
+            _lexical_results(lexical_indices[row], lexical_scores[row], top_k)
+            for row in range(len(queries))
+        ]
+
+    dense_indices, dense_scores = _ann_index.search(query_embeddings, candidates)
+    dense_indices = np.where(dense_scores > 0.0, dense_indices, -1)
+    return [
+        _fuse(dense_indices[row], lexical_indices[row], lexical_scores[row],
+              query_embeddings[row], top_k, _hybrid_settings.get("rrf_k", 60))
+        for row in range(len(queries))
+    ]
+
+
+def search(query: str, top_k: int = 5, corpus_path: str = None) -> List[Dict]:
+    """
+    Perform cosine similarity search against the in-memory PDF embeddings.
+
+    Args:
+        query: The search query text
+        top_k: Number of top results to return
+        corpus_path: Optional override path to the corpus (directory or file)
 
+    Returns:
+        List of dicts with keys: text, page, score, source, doc_id, chunk_id
+    """
+    results = search_batch([query], top_k=top_k, corpus_path=corpus_path)[0]
     logger.info(f"Query: '{query[:50]}...' → {len(results)} results (top score: {results[0]['score'] if results else 0})")
     return results
 
 
+def merge_results(result_lists: List[List[Dict]], top_k: int) -> List[Dict]:
+    """
+    Merge per-query results into one list, keeping each chunk's best score.
+
+    Used when several phrasings of the same question are searched together.
+    Hybrid results are ranked by their fusion score, dense-only ones by score.
+    """
+    def rank(r):
+        return r.get("fusion_score", r["score"])
+
+    best = {}
+    for results in result_lists:
+        for r in results:
+            current = best.get(r["chunk_id"])
+            if current is None or rank(r) > rank(current):
+                best[r["chunk_id"]] = r
+    return sorted(best.values(), key=rank, reverse=True)[:top_k]
+
+
+def select_diverse(results: List[Dict], top_k: int, lambda_mult: float = 0.7,
+                   duplicate_threshold: float = 0.95, merge_adjacent: bool = True) -> List[Dict]:
+    """
+    Pick a diverse, non-redundant top_k from ranked search results (see mmr.py).
+
+    Similarity between candidates comes from the loaded chunk embeddings,
+    so no extra embedding calls are made. Hybrid results are weighed by
+    their fusion score (min-max scaled to 0..1, the range of the cosine
+    scores), so lexical hits kept by the fusion are not dropped again
+    for a weak cosine. Consecutive picked chunks from the same page are
+    merged into one passage.
+    """
+    if len(results) <= 1:
+        return results[:top_k]
+
+    chunk_ids = np.array([r["chunk_id"] for r in results])
+    embeddings = np.asarray(_cached_embeddings[chunk_ids], dtype=np.float32)
+    if all("fusion_score" in r for r in results):
+        fused = np.array([r["fusion_score"] for r in results], dtype=np.float32)
+        spread = fused.max() - fused.min()
+        relevance = (fused - fused.min()) / spread if spread > 0 else np.ones_like(fused)
+    else:
+        relevance = np.array([r["score"] for r in results], dtype=np.float32)
+
+    picked = [results[i] for i in mmr_select(relevance, embeddings, top_k, lambda_mult, duplicate_threshold)]
+    return merge_adjacent_chunks(picked) if merge_adjacent else picked
+
+
 def get_formatted_context(query: str, top_k: int = 2) -> str:
     """
     Convenience function: search and return formatted text context.
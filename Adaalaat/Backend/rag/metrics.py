@@ -0,0 +1,128 @@
+"""
+Metrics
+
+Process-local, thread-safe instruments for the RAG pipeline:
+
+    Histogram  fixed-bucket distribution (batch sizes, latencies, ...)
+    Counter    monotonically increasing totals (hits, misses, ...)
+
+Instruments are registered by name on first use (get_histogram /
+get_counter) and reported together by snapshot(), which the
+/api/metrics endpoint returns. Each gunicorn worker keeps its own
+numbers.
+"""
+
+import os
+import bisect
+import threading
+from typing import Dict, Sequence
+
+# Default buckets for millisecond latencies
+LATENCY_MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+class Histogram:
+    """Counts observations per upper bucket bound (plus an overflow bucket)."""
+
+    def __init__(self, name: str, buckets: Sequence[float]):
+        self.name = name
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+            self._max = max(self._max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (max for the overflow bucket)."""
+        with self._lock:
+            if not self._count:
+                return 0.0
+            target = q * self._count
+            seen = 0
+            for bound, count in zip(self.buckets + (self._max,), self._counts):
+                seen += count
+                if seen >= target:
+                    return min(bound, self._max)
+            return self._max
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            count, total, maximum = self._count, self._sum, self._max
+            buckets = {f"le_{bound:g}": c for bound, c in zip(self.buckets, self._counts)}
+            buckets["le_inf"] = self._counts[-1]
+        return {
+            "count": count,
+            "mean": round(total / count, 3) if count else 0.0,
+            "max": round(maximum, 3),
+            "p50": round(self.quantile(0.5), 3),
+            "p95": round(self.quantile(0.95), 3),
+            "buckets": buckets,
+        }
+
+
+class Counter:
+    """A thread-safe running total."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> float:
+        return self._value
+
+
+def get_histogram(name: str, buckets: Sequence[float] = LATENCY_MS_BUCKETS) -> Histogram:
+    """Get or register the histogram called `name`."""
+    with _registry_lock:
+        instrument = _registry.get(name)
+        if instrument is None:
+            instrument = _registry[name] = Histogram(name, buckets)
+        return instrument
+
+
+def get_counter(name: str) -> Counter:
+    """Get or register the counter called `name`."""
+    with _registry_lock:
+        instrument = _registry.get(name)
+        if instrument is None:
+            instrument = _registry[name] = Counter(name)
+        return instrument
+
+
+def snapshot() -> Dict:
+    """Current values of every registered instrument, by name."""
+    with _registry_lock:
+        instruments = dict(_registry)
+    return {name: instrument.snapshot() for name, instrument in sorted(instruments.items())}
+
+
+def _reset_after_fork():
+    # Locks held by a parent thread at fork() would never be released in the child
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    for instrument in _registry.values():
+        instrument._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,113 @@
+"""
+Micro-Batcher
+
+Coalesces single-item calls from concurrent requests into batched calls.
+
+Callers submit() an item and get a Future. A background thread takes
+the first waiting item, keeps collecting for up to `window_ms` (or
+until `max_batch` items are queued), runs the batch function once, and
+resolves every caller's future with its own result — or with the
+batch's exception. Batches run one at a time, so while one call is in
+flight the next batch fills up: batch size grows with load.
+
+Used by the shared embedding model so simultaneous /api/advisory/query
+requests share one embedding call.
+
+The worker thread is started on the first submit() in each process: a
+forked child (gunicorn --preload) gets a fresh queue and its own thread.
+"""
+
+import os
+import time
+import queue
+import weakref
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+from rag.metrics import get_histogram
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class MicroBatcher:
+    """Runs `batch_fn(items) -> results` on coalesced items from many threads."""
+
+    def __init__(self, batch_fn: Callable[[List], Sequence], name: str,
+                 window_ms: float = 5.0, max_batch: int = 32):
+        self.batch_fn = batch_fn
+        self.name = name
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._batch_sizes = get_histogram(f"{name}.batch_size", BATCH_SIZE_BUCKETS)
+        self._queue_delay = get_histogram(f"{name}.queue_delay_ms")
+        self._reset()
+        _batchers.add(self)
+
+    def _reset(self):
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        """Queue one item; the future resolves to its result."""
+        if self._worker is None:
+            with self._start_lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, args=(self._queue,),
+                                                    name=f"{self.name}-batcher", daemon=True)
+                    self._worker.start()
+        future = Future()
+        self._queue.put((item, future, time.monotonic()))
+        return future
+
+    def _collect(self, pending: "queue.Queue") -> List:
+        """Block for the first item, then gather more until the window closes or the batch is full."""
+        batch = [pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending: "queue.Queue"):
+        while True:
+            batch = self._collect(pending)
+            started = time.monotonic()
+            for _, _, submitted in batch:
+                self._queue_delay.observe((started - submitted) * 1000)
+            self._batch_sizes.observe(len(batch))
+
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise ValueError(f"{self.name}: {len(results)} results for {len(items)} items")
+            except Exception as e:
+                logger.warning(f"{self.name}: batch of {len(batch)} failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+
+# The worker thread does not survive fork(); children start their own on first use
+_batchers: "weakref.WeakSet[MicroBatcher]" = weakref.WeakSet()
+
+
+def _reset_after_fork():
+    for batcher in list(_batchers):
+        batcher._reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,119 @@
+"""
+Maximal Marginal Relevance
+
+Picks a diverse subset of retrieved chunks before they go into a
+prompt. Each step takes the candidate maximizing
+
+    lambda * relevance - (1 - lambda) * max similarity to anything already picked
+
+using the chunks' normalized embeddings, so near-duplicates (boilerplate
+repeated on neighbouring pages, the overlapping tails of consecutive
+chunks) lose out to chunks that add new information. Candidates that are
+almost identical to a picked chunk are dropped outright.
+
+Picked chunks that are consecutive on the same page are then merged
+into one passage with the overlap between them removed.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+
+def mmr_select(relevance: np.ndarray, embeddings: np.ndarray, k: int,
+               lambda_mult: float = 0.7, duplicate_threshold: float = 0.95) -> List[int]:
+    """
+    Args:
+        relevance: (n,) relevance of each candidate to the query (cosine,
+            or the scaled fusion score for hybrid results)
+        embeddings: (n, dim) normalized candidate embeddings
+        k: Number of candidates to pick
+        lambda_mult: 1.0 = pure relevance, 0.0 = pure diversity
+        duplicate_threshold: Never pick a candidate at least this similar
+            to one already picked
+
+    Returns:
+        Positions of the picked candidates, in pick order
+    """
+    n = len(relevance)
+    if n == 0 or k <= 0:
+        return []
+
+    similarity = embeddings @ embeddings.T
+    max_similarity = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    picked = []
+
+    for _ in range(min(k, n)):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        picked.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+        available &= max_similarity < duplicate_threshold
+
+    return picked
+
+
+def _overlap_length(previous: str, following: str, min_overlap: int = 8) -> int:
+    """Length of the longest suffix of `previous` that `following` starts with (0 if shorter than min_overlap)."""
+    head = following[:min_overlap]
+    if len(head) < min_overlap:
+        return 0
+    # Scan forward from the earliest position an overlap could start, so the longest one wins
+    start = previous.find(head, max(0, len(previous) - len(following)))
+    while start != -1:
+        if following.startswith(previous[start:]):
+            return len(previous) - start
+        start = previous.find(head, start + 1)
+    return 0
+
+
+def merge_adjacent_chunks(results: List[Dict]) -> List[Dict]:
+    """
+    Merge results whose chunks are consecutive (chunk_id n, n+1) on the same page.
+
+    The merged passage keeps the first chunk's id, the best score and
+    the position of the best-ranked part; `chunk_ids` lists its parts.
+    """
+    if not results:
+        return []
+
+    rank = {r["chunk_id"]: i for i, r in enumerate(results)}
+    ordered = sorted(results, key=lambda r: r["chunk_id"])
+
+    runs = [[ordered[0]]]
+    for r in ordered[1:]:
+        last = runs[-1][-1]
+        consecutive = (
+            r["chunk_id"] == last["chunk_id"] + 1
+            and r.get("doc_id") == last.get("doc_id")
+            and r["page"] == last["page"]
+        )
+        if consecutive:
+            runs[-1].append(r)
+        else:
+            runs.append([r])
+
+    merged = []
+    for run in runs:
+        if len(run) == 1:
+            merged.append(run[0])
+            continue
+        text = run[0]["text"]
+        for r in run[1:]:
+            rest = r["text"][_overlap_length(text, r["text"]):].strip()
+            if rest:
+                text += " " + rest
+        best = max(run, key=lambda r: r["score"])
+        merged.append({
+            **best,
+            "text": text,
+            "chunk_id": run[0]["chunk_id"],
+            "chunk_ids": [r["chunk_id"] for r in run],
+        })
+
+    return sorted(merged, key=lambda r: min(rank[c] for c in r.get("chunk_ids", [r["chunk_id"]])))
@@ -0,0 +1,158 @@
+"""
+PDF Text Extraction
+
+Extracts page text with pypdf, spread across a process pool in
+page-range shards. Pages are yielded back in page order as soon as
+their shard finishes, so callers can start chunking before the whole
+document is done.
+
+Each page's extracted text is cached (SQLite, see rag/cache.py) under a
+hash of the page's content stream and fonts, so unchanged pages — in a
+re-issued gazette or an unchanged file after an index rebuild — are
+never extracted twice.
+
+Used by the local retriever and by rag/ingestion/loaders.load_pdf.
+"""
+
+import os
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from config import load_json_config
+from rag.cache import SQLiteCache
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_page_cache: Optional[SQLiteCache] = None
+
+
+def _settings() -> Dict:
+    settings = load_json_config().get("rag_agent", {}).get("pdf_extraction", {})
+    return {
+        "max_workers": settings.get("max_workers") or os.cpu_count() or 1,
+        "shard_size": settings.get("shard_size", 16),
+        "page_cache": settings.get("page_cache", "data/cache/pdf_pages.sqlite"),
+    }
+
+
+def _get_page_cache(path: Optional[str]) -> Optional[SQLiteCache]:
+    global _page_cache
+    if not path:
+        return None
+    if _page_cache is None:
+        _page_cache = SQLiteCache(os.path.join(BACKEND_DIR, path))
+    return _page_cache
+
+
+def _font_fingerprint(font) -> bytes:
+    """The parts of a font dict that change extracted text: name, type, encoding, ToUnicode map."""
+    font = font.get_object()
+    parts = [str(font.get(key, "")) for key in ("/BaseFont", "/Subtype")]
+    encoding = font.get("/Encoding")
+    if encoding is not None:
+        encoding = encoding.get_object()
+        parts.append(str(encoding if not hasattr(encoding, "items") else sorted(
+            (str(k), str(v.get_object())) for k, v in encoding.items()
+        )))
+    fingerprint = "|".join(parts).encode("utf-8")
+    to_unicode = font.get("/ToUnicode")
+    if to_unicode is not None:
+        fingerprint += to_unicode.get_object().get_data()
+    return fingerprint
+
+
+def _page_hash(page) -> str:
+    """Hash what extract_text depends on: the content stream and the fonts it uses."""
+    import pypdf
+
+    digest = hashlib.sha256(f"pypdf-{pypdf.__version__}".encode())
+    contents = page.get_contents()
+    if contents is not None:
+        digest.update(contents.get_data())
+    fonts = page.get("/Resources", {}).get("/Font", {})
+    for name in sorted(fonts):
+        digest.update(str(name).encode("utf-8"))
+        digest.update(_font_fingerprint(fonts[name]))
+    return digest.hexdigest()
+
+
+def _extract_shard(pdf_path: str, page_indices: List[int]) -> List[str]:
+    """Worker: extract the text of the given (0-based) pages."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(pdf_path)
+    return [reader.pages[i].extract_text() or "" for i in page_indices]
+
+
+def extract_pages(pdf_path: str, max_workers: int = None, shard_size: int = None,
+                  use_cache: bool = True) -> Iterator[Dict]:
+    """
+    Yield {"text", "page"} for every page (1-based page numbers), in order.
+
+    Args:
+        pdf_path: Path to the PDF
+        max_workers: Extraction processes (defaults to config / CPU count)
+        shard_size: Pages per task sent to a worker
+        use_cache: Look up and store page text in the page cache
+    """
+    from pypdf import PdfReader
+
+    settings = _settings()
+    max_workers = max_workers or settings["max_workers"]
+    shard_size = shard_size or settings["shard_size"]
+    cache = _get_page_cache(settings["page_cache"]) if use_cache else None
+
+    reader = PdfReader(pdf_path)
+    num_pages = len(reader.pages)
+
+    hashes = [_page_hash(page) for page in reader.pages] if cache else [None] * num_pages
+    texts: Dict[int, str] = {}
+    if cache:
+        for i, page_hash in enumerate(hashes):
+            cached = cache.get(page_hash)
+            if cached is not None:
+                texts[i] = cached.decode("utf-8")
+
+    missing = [i for i in range(num_pages) if i not in texts]
+    shards = [missing[i:i + shard_size] for i in range(0, len(missing), shard_size)]
+    logger.info(
+        f"Extracting {len(missing)}/{num_pages} pages from {os.path.basename(pdf_path)} "
+        f"({num_pages - len(missing)} cached, {len(shards)} shards)"
+    )
+
+    def _store(indices, shard_texts):
+        for i, text in zip(indices, shard_texts):
+            texts[i] = text
+            if cache:
+                cache.set(hashes[i], text.encode("utf-8"))
+
+    # A pool costs more than it saves on a handful of pages
+    if len(shards) <= 1 or max_workers <= 1:
+        shard_of = {}
+        pool = None
+    else:
+        # spawn, not fork: the server process runs background threads
+        pool = ProcessPoolExecutor(
+            max_workers=min(max_workers, len(shards)),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        futures = [pool.submit(_extract_shard, pdf_path, shard) for shard in shards]
+        shard_of = {i: (shard, future) for shard, future in zip(shards, futures) for i in shard}
+
+    try:
+        for i in range(num_pages):
+            if i not in texts:
+                if i in shard_of:
+                    shard, future = shard_of[i]
+                    _store(shard, future.result())
+                else:
+                    _store([i], [reader.pages[i].extract_text() or ""])
+            yield {"text": texts.pop(i), "page": i + 1}
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
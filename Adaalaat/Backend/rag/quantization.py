@@ -0,0 +1,178 @@
+"""
+Quantized Embedding Storage
+
+Compact copies of the chunk embedding matrix for the first search pass:
+
+    float16  half precision, 2x smaller
+    int8     symmetric per-vector quantization, 4x smaller:
+             row ≈ scale[row] * codes[row], codes in [-127, 127]
+
+QuantizedExactIndex scores every chunk against the compact matrix, then
+rescores only the best `rescore_candidates` with the float32 rows from
+the memory-mapped embeddings.npy — so the float32 pages that stay hot
+are just the ones rescoring touches, and the ranking of the final top k
+is exact.
+
+NumPy has no BLAS kernels for float16/int8, so the first pass converts
+the compact matrix to float32 one cache-sized block at a time; memory
+traffic to RAM stays at the compact size. int8 is the better choice in
+practice: its blocks convert fast enough to match float32 latency,
+while NumPy's float16 → float32 conversion is slow and makes search
+several times slower (float16 only buys memory).
+
+The compact matrix is persisted next to the index (quantized_<dtype>.npy)
+and memory-mapped, so gunicorn workers share one copy.
+"""
+
+import os
+import json
+import logging
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from rag.ann_index import top_k_indices
+
+logger = logging.getLogger(__name__)
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+
+class QuantizedMatrix:
+    """A float16 or int8 (+ per-row scale) copy of a normalized embedding matrix."""
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None):
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def storage(self) -> str:
+        return "int8" if self.codes.dtype == np.int8 else "float16"
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @classmethod
+    def quantize(cls, embeddings: np.ndarray, storage: str, block: int = 65536) -> "QuantizedMatrix":
+        """Quantize row blocks of `embeddings` (which may be a memory map)."""
+        if storage == "float16":
+            return cls(np.asarray(embeddings, dtype=np.float16))
+        if storage != "int8":
+            raise ValueError(f"Unknown embedding storage: {storage!r} (expected one of {STORAGE_TYPES})")
+
+        num_rows = embeddings.shape[0]
+        codes = np.empty(embeddings.shape, dtype=np.int8)
+        scales = np.empty(num_rows, dtype=np.float32)
+        for start in range(0, num_rows, block):
+            rows = np.asarray(embeddings[start:start + block], dtype=np.float32)
+            row_scales = np.abs(rows).max(axis=1) / 127.0
+            row_scales[row_scales == 0] = 1.0
+            codes[start:start + block] = np.rint(rows / row_scales[:, np.newaxis])
+            scales[start:start + block] = row_scales
+        return cls(codes, scales)
+
+    def scores(self, queries: np.ndarray, block: int = 512) -> np.ndarray:
+        """Approximate inner products, (num_queries, num_rows) float32."""
+        scores = np.empty((queries.shape[0], self.codes.shape[0]), dtype=np.float32)
+        for start in range(0, self.codes.shape[0], block):
+            rows = self.codes[start:start + block].astype(np.float32)
+            scores[:, start:start + block] = queries @ rows.T
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def save(self, index_dir: str, key: Dict):
+        """Write the codes (memory-mappable .npy), then the scales and key."""
+        codes_path, meta_path = _paths(index_dir, self.storage)
+        tmp_path = codes_path + ".tmp.npy"
+        np.save(tmp_path, self.codes)
+        os.replace(tmp_path, codes_path)
+
+        tmp_path = meta_path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            scales=self.scales if self.scales is not None else np.zeros(0, dtype=np.float32),
+            key=np.array(json.dumps(key, sort_keys=True)),
+        )
+        os.replace(tmp_path, meta_path)
+
+    @classmethod
+    def load(cls, index_dir: str, storage: str, key: Dict) -> Optional["QuantizedMatrix"]:
+        """Memory-map a stored matrix, or None if it is missing or built for another key."""
+        codes_path, meta_path = _paths(index_dir, storage)
+        try:
+            with np.load(meta_path, allow_pickle=False) as meta:
+                if str(meta["key"]) != json.dumps(key, sort_keys=True):
+                    return None
+                scales = meta["scales"] if storage == "int8" else None
+            return cls(np.load(codes_path, mmap_mode="r"), scales)
+        except (FileNotFoundError, KeyError, ValueError):
+            return None
+
+
+class QuantizedExactIndex:
+    """Brute-force search over a QuantizedMatrix with float32 rescoring of the top candidates."""
+
+    def __init__(self, embeddings: np.ndarray, matrix: QuantizedMatrix,
+                 alive: Optional[np.ndarray] = None, rescore_candidates: int = 64):
+        self.embeddings = embeddings
+        self.matrix = matrix
+        self.dead = None if alive is None or alive.all() else ~alive
+        self.rescore_candidates = rescore_candidates
+
+    def search(self, queries: np.ndarray, k: int,
+               rescore_candidates: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Args:
+            queries: (num_queries, dim) normalized query embeddings
+            k: Results per query
+            rescore_candidates: Override how many first-pass hits are rescored
+                (0 returns the approximate ranking as is)
+
+        Returns:
+            (indices, scores), both of shape (num_queries, k)
+        """
+        approx = self.matrix.scores(queries)
+        if self.dead is not None:
+            approx[:, self.dead] = -np.inf
+
+        num_candidates = self.rescore_candidates if rescore_candidates is None else rescore_candidates
+        if num_candidates <= 0:
+            indices = top_k_indices(approx, k)
+            return indices, np.take_along_axis(approx, indices, axis=1)
+
+        candidates = top_k_indices(approx, max(k, num_candidates))
+        # One sorted gather from the float32 memory map for all queries
+        rows, inverse = np.unique(candidates, return_inverse=True)
+        exact_rows = np.asarray(self.embeddings[rows])
+        exact = np.einsum(
+            "qcd,qd->qc", exact_rows[inverse.reshape(candidates.shape)], queries
+        )
+        exact[np.take_along_axis(approx, candidates, axis=1) == -np.inf] = -np.inf
+
+        best = top_k_indices(exact, k)
+        return np.take_along_axis(candidates, best, axis=1), np.take_along_axis(exact, best, axis=1)
+
+
+def build_quantized_index(settings: Dict, embeddings: np.ndarray, index_dir: str, key: Dict,
+                          alive: Optional[np.ndarray] = None) -> QuantizedExactIndex:
+    """Reuse the stored compact matrix for this index version, or quantize and save it."""
+    storage = settings.get("storage", "float32")
+    matrix = QuantizedMatrix.load(index_dir, storage, key)
+    if matrix is None:
+        matrix = QuantizedMatrix.quantize(embeddings, storage)
+        matrix.save(index_dir, key)
+        matrix = QuantizedMatrix.load(index_dir, storage, key)
+        logger.info(
+            f"Quantized {embeddings.shape[0]} embeddings to {storage} "
+            f"({embeddings.nbytes / 1e6:.1f} MB → {matrix.nbytes / 1e6:.1f} MB)"
+        )
+    return QuantizedExactIndex(
+        embeddings, matrix, alive, rescore_candidates=settings.get("rescore_candidates", 64)
+    )
+
+
+def _paths(index_dir: str, storage: str) -> Tuple[str, str]:
+    base = os.path.join(index_dir, f"quantized_{storage}")
+    return base + ".npy", base + ".meta.npz"
@@ -0,0 +1,214 @@
+"""
+Query Router
+
+In-process LEGAL_RAG / GENERAL classification, so most queries skip the
+decider LLM call.
+
+Two signals are combined:
+    exemplars  cosine similarity of the query embedding to labelled
+               example queries; the margin is the mean of the top-n
+               legal similarities minus the mean of the top-n general ones
+    keywords   whole-word hits from utils.helpers.DOMAIN_KEYWORDS (plus
+               a few generic legal terms), each adding `keyword_weight`
+
+    score = margin + keyword_weight * min(hits, 3)
+
+The sign of the score is the decision and its magnitude the confidence.
+Only a confident decision on a query without chat history takes the fast
+path. Follow-up questions still need the decider to rewrite them into a
+standalone search query. Every decision is logged with its signals so
+the thresholds can be tuned from production logs.
+
+The exemplars are embedded once, by ensure_exemplars(), which blocks
+and belongs on a worker thread. route() never embeds: until the
+exemplars are available it scores on keywords only and defers to the
+decider. A failed attempt is not retried for `exemplar_retry_seconds`.
+"""
+
+import re
+import time
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+from rag.metrics import get_counter, get_histogram
+from utils.helpers import DOMAIN_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+CONFIDENCE_BUCKETS = (0.01, 0.02, 0.04, 0.06, 0.08, 0.1, 0.15, 0.2, 0.3, 0.5)
+
+LEGAL_EXEMPLARS = [
+    "My landlord wants to evict me without giving notice",
+    "Can my landlord keep my security deposit?",
+    "I was fired from my job without any reason",
+    "My employer has not paid my salary for three months",
+    "How do I file for divorce?",
+    "Who gets custody of the children after separation?",
+    "How much maintenance can my wife claim?",
+    "I bought a defective product and the seller refuses a refund",
+    "How do I file a consumer complaint?",
+    "Someone hacked my bank account and stole money",
+    "I was cheated in an online fraud",
+    "The police refused to register my FIR",
+    "How can I get bail after arrest?",
+    "My neighbour has encroached on my land",
+    "How do I transfer property to my son?",
+    "What is the procedure to register a sale deed?",
+    "The builder has delayed possession of my flat",
+    "The other party breached our contract, can I claim damages?",
+    "What does Section 106 of the Transfer of Property Act say?",
+    "Is a verbal agreement legally binding?",
+    "What are my rights if I am arrested?",
+    "How do I send a legal notice?",
+]
+
+GENERAL_EXEMPLARS = [
+    "Hello",
+    "Hi there",
+    "Good morning",
+    "Thank you",
+    "Thanks, that was helpful",
+    "Who are you?",
+    "What can you do?",
+    "How does this app work?",
+    "Are you a real lawyer?",
+    "What is your name?",
+    "Bye",
+    "Can you tell me a joke?",
+    "What is the weather today?",
+    "Help",
+]
+
+# Generic legal vocabulary not tied to one domain
+_GENERIC_LEGAL_TERMS = [
+    "law", "legal", "lawyer", "advocate", "court", "case", "section", "act",
+    "rights", "notice", "petition", "suit", "appeal", "judge", "police",
+]
+
+
+@dataclass
+class RouteDecision:
+    decision: str         # "LEGAL_RAG" or "GENERAL"
+    confidence: float
+    fast_path: bool       # True → use this decision, skip the LLM decider
+    margin: float = 0.0
+    keyword_hits: int = 0
+
+
+class QueryRouter:
+    """Exemplar + keyword classifier in front of the LLM decider."""
+
+    def __init__(self, embed_fn, min_confidence: float = 0.06, keyword_weight: float = 0.03,
+                 top_n: int = 3, exemplar_retry_seconds: float = 60.0):
+        """
+        Args:
+            embed_fn: Callable(list of texts) -> list of embeddings (query embeddings)
+            min_confidence: Smallest |score| that takes the fast path
+            keyword_weight: Score added per keyword hit (capped at 3 hits)
+            top_n: Exemplar similarities averaged per class
+            exemplar_retry_seconds: Wait after a failed exemplar embedding before trying again
+        """
+        self.embed_fn = embed_fn
+        self.min_confidence = min_confidence
+        self.keyword_weight = keyword_weight
+        self.top_n = top_n
+        self.exemplar_retry_seconds = exemplar_retry_seconds
+        self._legal: Optional[np.ndarray] = None
+        self._general: Optional[np.ndarray] = None
+        self._exemplar_lock = threading.Lock()
+        self._retry_at = 0.0
+
+        terms = sorted({kw for kws in DOMAIN_KEYWORDS.values() for kw in kws} | set(_GENERIC_LEGAL_TERMS))
+        # Word-initial match: "employ" counts "employer", but "rent" does not count "current"
+        self._keyword_re = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")", re.IGNORECASE)
+
+        self._fast = get_counter("router.fast_path")
+        self._deferred = get_counter("router.llm_decider")
+        self._confidence = get_histogram("router.confidence", CONFIDENCE_BUCKETS)
+
+    @property
+    def exemplars_ready(self) -> bool:
+        return self._legal is not None
+
+    def ensure_exemplars(self) -> bool:
+        """
+        Embed the exemplar queries if that has not been done yet (blocking).
+
+        Concurrent callers wait for one embedding call. After a failure,
+        calls return False without trying again for exemplar_retry_seconds.
+
+        Returns:
+            Whether the exemplars are available
+        """
+        if self._legal is not None:
+            return True
+        with self._exemplar_lock:
+            if self._legal is not None:
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            try:
+                embeddings = _normalize(np.asarray(
+                    self.embed_fn(LEGAL_EXEMPLARS + GENERAL_EXEMPLARS), dtype=np.float32
+                ))
+            except Exception as e:
+                self._retry_at = time.monotonic() + self.exemplar_retry_seconds
+                logger.warning(
+                    f"[ROUTER] Exemplar embedding failed, keywords only for "
+                    f"{self.exemplar_retry_seconds:.0f}s: {e}"
+                )
+                return False
+            self._general = embeddings[len(LEGAL_EXEMPLARS):]
+            self._legal = embeddings[:len(LEGAL_EXEMPLARS)]
+            return True
+
+    def _top_mean(self, similarities: np.ndarray) -> float:
+        n = min(self.top_n, similarities.shape[0])
+        return float(np.partition(similarities, -n)[-n:].mean())
+
+    def keyword_hits(self, query: str) -> int:
+        return len(self._keyword_re.findall(query))
+
+    def route(self, query: str, query_embedding: Optional[np.ndarray], history: Sequence = ()) -> RouteDecision:
+        """
+        Classify a query; fast_path is set only for confident, history-free queries.
+
+        Never blocks: without exemplars (see ensure_exemplars) only the
+        keywords are scored and the decider is consulted.
+        """
+        hits = self.keyword_hits(query)
+        margin = 0.0
+        legal, general = self._legal, self._general
+        if legal is None:
+            query_embedding = None
+        elif query_embedding is not None:
+            margin = self._top_mean(legal @ query_embedding) - self._top_mean(general @ query_embedding)
+
+        score = margin + self.keyword_weight * min(hits, 3)
+        decision = "LEGAL_RAG" if score > 0 else "GENERAL"
+        confidence = abs(score)
+        # Without an embedding a single keyword is not enough evidence either way
+        fast_path = (
+            not history
+            and query_embedding is not None
+            and confidence >= self.min_confidence
+        )
+
+        (self._fast if fast_path else self._deferred).inc()
+        self._confidence.observe(confidence)
+        logger.info(
+            f"[ROUTER] {decision} confidence={confidence:.3f} (margin={margin:.3f}, "
+            f"keywords={hits}, history={len(history)}) → "
+            f"{'fast path' if fast_path else 'LLM decider'}"
+        )
+        return RouteDecision(decision, confidence, fast_path, margin, hits)
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
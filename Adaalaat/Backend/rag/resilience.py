@@ -0,0 +1,403 @@
+"""
+Resilience
+
+Shared retry / hedging / circuit-breaking for calls to remote inference
+endpoints (the HF router for the LLM, the HF Inference API for
+embeddings). One ResiliencePolicy per endpoint, registered by name:
+
+    retries          transient failures (timeouts, connection errors and
+                     the statuses in `retry_statuses`) are retried with
+                     full-jitter exponential backoff, honouring
+                     Retry-After, and never past the request deadline
+    hedging          optionally, if the first attempt has not answered
+                     after the endpoint's observed p95 latency, a second
+                     identical request is sent and the first answer wins
+    circuit breaker  after `failure_threshold` consecutive failed attempts
+                     the endpoint is considered down: calls fail
+                     immediately with CircuitOpenError for
+                     `reset_timeout_seconds`, then one trial call decides
+                     whether it closes again
+
+Throttling (429) is retried; it and other client errors count neither
+as failures nor as successes for the breaker, so a throttled endpoint
+keeps its failure count. A call cancelled or cut short by the request
+deadline does not count either way. Settings per endpoint live in
+config.json `resilience.<name>`.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+import concurrent.futures
+from typing import Awaitable, Callable, Dict, Iterable, Optional
+
+import httpx
+
+from rag.deadline import DeadlineExceeded, remaining_time
+from rag.metrics import LATENCY_MS_BUCKETS, get_counter, get_histogram
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+_UNHEALTHY_STATUSES = (408, 500, 502, 503, 504)
+
+# Shared by every policy for hedged sync calls
+_hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an endpoint whose circuit breaker is open."""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"{endpoint} is unavailable (circuit open, retry in {retry_in:.1f}s)")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def status_code(error: Exception) -> Optional[int]:
+    """HTTP status of a failed request (httpx, requests or huggingface_hub errors)."""
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def _is_timeout_or_connection(error: Exception) -> bool:
+    if isinstance(error, DeadlineExceeded):
+        return False
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker (closed → open → half-open)."""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_seconds = reset_timeout_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._opened = get_counter(f"{name}.circuit.opened")
+        self._rejected = get_counter(f"{name}.circuit.rejected")
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout_seconds:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> bool:
+        """
+        Raise CircuitOpenError unless a call may go through now.
+
+        Returns:
+            True if the call is the half-open trial (release_trial() it if
+            it ends without telling anything about the endpoint)
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            waited = time.monotonic() - self._opened_at
+            if waited >= self.reset_timeout_seconds and not self._trial_in_flight:
+                self._trial_in_flight = True  # half-open: let one trial call through
+                return True
+            self._rejected.inc()
+            raise CircuitOpenError(self.name, max(self.reset_timeout_seconds - waited, 0.0))
+
+    def record_success(self):
+        with self._lock:
+            if self._opened_at is not None:
+                logger.info(f"[CIRCUIT] {self.name} closed again")
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Forget a call that told nothing about the endpoint; a half-open trial may be retried."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            reopen = self._trial_in_flight
+            self._trial_in_flight = False
+            if reopen or (self._opened_at is None and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self._opened.inc()
+                logger.warning(
+                    f"[CIRCUIT] {self.name} opened after {self._failures} consecutive failures; "
+                    f"failing fast for {self.reset_timeout_seconds:.1f}s"
+                )
+
+
+class ResiliencePolicy:
+    """Retry + optional hedging + circuit breaker for one endpoint."""
+
+    def __init__(self, name: str, max_retries: int = 3, backoff_base_seconds: float = 0.25,
+                 backoff_max_seconds: float = 8.0, retry_statuses: Iterable[int] = DEFAULT_RETRY_STATUSES,
+                 hedge: bool = False, hedge_quantile: float = 0.95, hedge_min_delay_ms: float = 200.0,
+                 hedge_min_samples: int = 20, failure_threshold: int = 5,
+                 reset_timeout_seconds: float = 30.0):
+        """
+        Args:
+            name: Endpoint name (metrics are reported under it)
+            max_retries: Retries after the first attempt
+            backoff_base_seconds / backoff_max_seconds: Full-jitter backoff bounds
+            retry_statuses: HTTP statuses worth retrying
+            hedge: Send a second request when the first is slower than usual
+            hedge_quantile: Latency quantile after which to hedge
+            hedge_min_delay_ms: Never hedge sooner than this
+            hedge_min_samples: Latencies observed before hedging starts
+            failure_threshold / reset_timeout_seconds: Circuit breaker settings
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.retry_statuses = frozenset(retry_statuses)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_timeout_seconds)
+
+        self._latency = get_histogram(f"{name}.latency_ms", LATENCY_MS_BUCKETS)
+        self._retries = get_counter(f"{name}.retries")
+        self._hedges = get_counter(f"{name}.hedges")
+        self._hedge_wins = get_counter(f"{name}.hedge_wins")
+
+    # ── Classification ──────────────────────────────────────────
+
+    def is_retryable(self, error: Exception) -> bool:
+        status = status_code(error)
+        if status is not None:
+            return status in self.retry_statuses
+        return _is_timeout_or_connection(error)
+
+    @staticmethod
+    def _is_unhealthy(error: Exception) -> bool:
+        status = status_code(error)
+        if status is not None:
+            return status in _UNHEALTHY_STATUSES
+        return _is_timeout_or_connection(error)
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max_seconds)
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging is off / not calibrated yet."""
+        if not self.hedge or self._latency.snapshot()["count"] < self.hedge_min_samples:
+            return None
+        return max(self._latency.quantile(self.hedge_quantile), self.hedge_min_delay_ms) / 1000
+
+    def _record(self, error: Optional[Exception], trial: bool):
+        if error is None:
+            self.breaker.record_success()
+        elif self._is_unhealthy(error) and remaining_time() != 0:
+            self.breaker.record_failure()
+        elif trial:
+            # Throttled, rejected or cut short by our own deadline: neither a
+            # failure nor a success, so let the next call be the trial
+            self.breaker.release_trial()
+
+    def _retry_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """Backoff before the next attempt, or None if the error should be raised."""
+        if attempt >= self.max_retries or not self.is_retryable(error):
+            return None
+        delay = self._backoff(attempt, error)
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            return None
+        self._retries.inc()
+        logger.warning(
+            f"[RETRY] {self.name} attempt {attempt + 1} failed ({status_code(error) or type(error).__name__}), "
+            f"retrying in {delay:.2f}s"
+        )
+        return delay
+
+    # ── Sync ────────────────────────────────────────────────────
+
+    def call(self, fn: Callable, hedge: bool = True):
+        """Run fn() with retries, hedging (unless hedge=False) and the circuit breaker."""
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            started = time.perf_counter()
+            try:
+                result = self._call_hedged(fn) if hedge else fn()
+            except Exception as e:
+                self._record(e, trial)
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (or interrupted): never leave a half-open trial in flight
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self._latency.observe((time.perf_counter() - started) * 1000)
+            self._record(None, trial)
+            return result
+
+    def _call_hedged(self, fn: Callable):
+        delay = self._hedge_delay()
+        if delay is None:
+            return fn()
+
+        # Copy the context so the request deadline reaches the worker threads
+        primary = _hedge_executor.submit(contextvars.copy_context().run, fn)
+        try:
+            return primary.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            if primary.done():
+                raise
+        self._hedges.inc()
+        hedged = _hedge_executor.submit(contextvars.copy_context().run, fn)
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self._hedge_wins.inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # ── Async ───────────────────────────────────────────────────
+
+    async def acall(self, fn: Callable[[], Awaitable], hedge: bool = True):
+        """Await fn() with retries, hedging (unless hedge=False) and the circuit breaker."""
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            started = time.perf_counter()
+            try:
+                result = await (self._acall_hedged(fn) if hedge else fn())
+            except Exception as e:
+                self._record(e, trial)
+                delay = self._retry_delay(attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            except BaseException:
+                # Cancelled (or interrupted): never leave a half-open trial in flight
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            self._latency.observe((time.perf_counter() - started) * 1000)
+            self._record(None, trial)
+            return result
+
+    async def _acall_hedged(self, fn: Callable[[], Awaitable]):
+        delay = self._hedge_delay()
+        if delay is None:
+            return await fn()
+
+        primary = asyncio.ensure_future(fn())
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+            self._hedges.inc()
+            hedged = asyncio.ensure_future(fn())
+            pending = {primary, hedged}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self._hedge_wins.inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+_policies: Dict[str, ResiliencePolicy] = {}
+_policies_lock = threading.Lock()
+_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.json")
+
+
+def _endpoint_settings(name: str) -> Dict:
+    try:
+        with open(_CONFIG_PATH, "r") as f:
+            return json.load(f).get("resilience", {}).get(name, {})
+    except Exception:
+        return {}
+
+
+def get_policy(name: str, **defaults) -> ResiliencePolicy:
+    """
+    Get or create the policy for endpoint `name`.
+
+    Settings come from config.json `resilience.<name>`; `defaults` fill
+    in what it leaves out.
+    """
+    with _policies_lock:
+        policy = _policies.get(name)
+        if policy is None:
+            settings = _endpoint_settings(name)
+            hedge = settings.get("hedge", {})
+            breaker = settings.get("circuit_breaker", {})
+            options = {**defaults}
+            options.update({
+                k: settings[k] for k in ("max_retries", "backoff_base_seconds", "backoff_max_seconds", "retry_statuses")
+                if k in settings
+            })
+            if hedge:
+                options.update(
+                    hedge=hedge.get("enabled", False),
+                    hedge_quantile=hedge.get("quantile", 0.95),
+                    hedge_min_delay_ms=hedge.get("min_delay_ms", 200.0),
+                    hedge_min_samples=hedge.get("min_samples", 20),
+                )
+            if breaker:
+                options.update(
+                    failure_threshold=breaker.get("failure_threshold", 5),
+                    reset_timeout_seconds=breaker.get("reset_timeout_seconds", 30.0),
+                )
+            policy = _policies[name] = ResiliencePolicy(name, **options)
+        return policy
+
+
+def _reset_after_fork():
+    # Fresh hedge threads and locks in a forked child; its breakers start closed
+    global _hedge_executor, _policies_lock
+    _hedge_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+    _policies_lock = threading.Lock()
+    _policies.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -7,7 +7,7 @@ the most relevant legal documents for a given query.
 Now wired to local_pdf_retriever.py (no Qdrant needed).
 """
 
-from rag.local_pdf_retriever import search as pdf_search
+from rag.local_pdf_retriever import search as pdf_search, search_batch, merge_results
 
 
 def retrieve_relevant_docs(query_vector, top_k=5):
@@ -33,11 +33,30 @@ def retrieve_relevant_docs(query_vector, top_k=5):
 
     results = pdf_search(query_text, top_k=top_k)
 
-    return [
-        {
-            "text": r.get("text", ""),
-            "metadata": {"source": r.get("source", ""), "page": r.get("page", 0)},
-            "score": r.get("score", 0.0),
-        }
-        for r in results
-    ]
+    return [_to_doc(r) for r in results]
+
+
+def retrieve_relevant_docs_multi(queries, top_k=5):
+    """
+    Retrieve the top-k documents for several phrasings of one request.
+
+    All queries are embedded and scored in a single batch; each chunk
+    keeps its best score across queries.
+
+    Args:
+        queries: list[str] — Query texts
+        top_k: Number of results to return
+
+    Returns:
+        list[dict]: Retrieved documents with text, metadata, and score
+    """
+    results = merge_results(search_batch(queries, top_k=top_k), top_k)
+    return [_to_doc(r) for r in results]
+
+
+def _to_doc(result):
+    return {
+        "text": result.get("text", ""),
+        "metadata": {"source": result.get("source", ""), "page": result.get("page", 0)},
+        "score": result.get("score", 0.0),
+    }
@@ -0,0 +1,78 @@
+"""
+Tokenization
+
+Token counting for chunking and prompt budgeting. Uses the model's own
+tokenizer (HuggingFace `tokenizers`) when it can be loaded, otherwise a
+word/punctuation estimate that errs on the side of over-counting so
+budgets computed with it stay safe.
+"""
+
+import os
+import re
+import logging
+import threading
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    global _counters_lock
+    _counters_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# Word pieces: runs of letters/digits, or single punctuation marks
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class TokenCounter:
+    """Counts tokens and reports their character offsets for one model."""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._tokenizer = None
+        try:
+            from tokenizers import Tokenizer
+
+            token = os.environ.get("HUGGINGFACE_TOKEN", "") or os.environ.get("HF_TOKEN", "") or None
+            self._tokenizer = Tokenizer.from_pretrained(model_name, token=token)
+            logger.info(f"Loaded tokenizer for {model_name}")
+        except Exception as e:
+            logger.warning(f"Tokenizer for {model_name} unavailable, estimating token counts: {e}")
+
+    @property
+    def is_exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def offsets(self, text: str) -> List[Tuple[int, int]]:
+        """Character (start, end) span of each token, without special tokens."""
+        if self._tokenizer is not None:
+            return self._tokenizer.encode(text, add_special_tokens=False).offsets
+        spans = []
+        for match in _WORD_RE.finditer(text):
+            start, end = match.span()
+            # Long words split into several word pieces — assume ~1 per 6 chars
+            while end - start > 6:
+                spans.append((start, start + 6))
+                start += 6
+            spans.append((start, end))
+        return spans
+
+    def count(self, text: str) -> int:
+        if self._tokenizer is not None:
+            return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+        return len(self.offsets(text))
+
+
+def get_token_counter(model_name: str) -> TokenCounter:
+    """Shared TokenCounter per model (loading a tokenizer is not free)."""
+    with _counters_lock:
+        counter = _counters.get(model_name)
+        if counter is None:
+            counter = _counters[model_name] = TokenCounter(model_name)
+        return counter
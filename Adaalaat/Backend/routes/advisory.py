@@ -1,4 +1,6 @@
-from flask import Blueprint, request, jsonify
+import json
+
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from services.advisory_service import AdvisoryService
 
 advisory_bp = Blueprint("advisory", __name__)
@@ -28,7 +30,8 @@ def submit_query():
             "analysis": "Based on your description...",
             "steps": ["Step 1...", "Step 2..."],
             "relevantStatutes": ["Section 106 TPA", ...],
-            "disclaimer": "This is AI-generated..."
+            "disclaimer": "This is AI-generated...",
+            "servedBy": "rag"  (or "llm_fallback", "general", "answer_cache", "keyword_fallback")
         }
         400: { "error": "..." }
     """
@@ -59,3 +62,51 @@ def submit_query():
         pass  # Non-critical — don't fail the response
 
     return jsonify(result), 200
+
+
+
+@advisory_bp.route("/stream", methods=["POST"])
+def stream_query():
+    """
+    Same as /query, streamed as Server-Sent Events.
+
+    Request body: as for /query
+
+    Events:
+        sources  [{"source": ..., "relevance_score": ...}, ...]
+        token    {"text": "..."} — answer text as it is generated
+        done     the full advisory (same fields as /query)
+        error    {"error": "..."}
+    """
+    data = request.get_json()
+
+    if not data or not data.get("query"):
+        return jsonify({"error": "Legal query text is required"}), 400
+
+    query_text = data["query"].strip()
+    if len(query_text) < 10:
+        return jsonify({"error": "Please provide a more detailed description of your situation"}), 400
+
+    user_id = data.get("userId")
+    history = data.get("history", [])
+    client_name = data.get("clientName", "Client User")
+
+    def events():
+        for event, payload in AdvisoryService.stream_query(query_text, user_id=user_id, history=history):
+            if event == "token":
+                payload = {"text": payload}
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+            if event == "done":
+                # Store the case for the Lawyer Dashboard
+                try:
+                    from routes.case_routes import store_case
+                    store_case(query_text, payload, client_name=client_name)
+                except Exception:
+                    pass  # Non-critical — don't fail the response
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
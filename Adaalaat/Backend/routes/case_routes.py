@@ -2,7 +2,8 @@
 Case Routes
 
 Stores client advisory queries + responses so lawyers can view them as briefs.
-Uses local JSON file storage (Backend/uploads/cases.json).
+Uses local JSON file storage (Backend/uploads/cases.json, or the CASES_FILE
+environment variable so test runs don't write into the tracked file).
 """
 
 import os
@@ -12,16 +13,18 @@ import logging
 from datetime import datetime
 from flask import Blueprint, request, jsonify
 
+from config import Config
+
 logger = logging.getLogger(__name__)
 
 cases_bp = Blueprint("cases", __name__)
 
 UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
-CASES_FILE = os.path.join(UPLOAD_DIR, "cases.json")
+CASES_FILE = Config.CASES_FILE or os.path.join(UPLOAD_DIR, "cases.json")
 
 
 def _ensure_dir():
-    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(os.path.dirname(os.path.abspath(CASES_FILE)), exist_ok=True)
 
 
 def _load_cases():
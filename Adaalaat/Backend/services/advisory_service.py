@@ -4,55 +4,97 @@ Orchestrates the Agentic RAG pipeline via LegalAgentOrchestrator.
 
 Uses HuggingFace Inference API for both LLM (Llama-3.1-8B) and
 embeddings (BAAI/bge-small-en-v1.5) — no local models needed.
+
+Each request gets a deadline (config.json advisory.deadline_seconds).
+If the pipeline cannot answer within it, or fails, the keyword-based
+fallback advisory is returned instead. Every response says which path
+served it in "servedBy".
 """
 
 import os
-import asyncio
+import json
 import logging
+import threading
+from rag.deadline import Deadline
 from rag.legal_agent_orchestrator import LegalAgentOrchestrator
+from rag.metrics import get_counter
+from utils.async_runner import get_async_runner
 from utils.helpers import classify_legal_domain
 
 logger = logging.getLogger(__name__)
 
+_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config.json")
+_advisory_config = None
+
+
+def _get_advisory_config() -> dict:
+    """config.json `advisory` section: pipeline ("rag" or "fallback") and deadline_seconds."""
+    global _advisory_config
+    if _advisory_config is None:
+        with open(_CONFIG_PATH, "r") as f:
+            _advisory_config = json.load(f).get("advisory", {})
+    return _advisory_config
+
 # ── Singleton orchestrator instance ─────────────────────────────
 _orchestrator = None
+_orchestrator_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # Built again in each forked worker (cheap once the index is loaded), so
+    # none of its locks or caches are shared with the parent
+    global _orchestrator, _orchestrator_lock
+    _orchestrator = None
+    _orchestrator_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def _get_orchestrator():
-    """Lazy-initialize the LegalAgentOrchestrator with HF Inference LLM."""
+    """Lazy-initialize the LegalAgentOrchestrator with HF Inference LLM (once per process)."""
     global _orchestrator
 
-    if _orchestrator is None:
-        config_path = os.path.join(os.path.dirname(__file__), "..", "config.json")
+    if _orchestrator is not None:
+        return _orchestrator
 
-        # Initialize HF Inference LLM (remote API — no local download)
-        try:
-            import json
-            from rag.hf_inference_llm import HFInferenceLLM
-
-            with open(config_path, "r") as f:
-                config = json.load(f)
-
-            llm_config = config.get("llm", {})
-            llm = HFInferenceLLM(
-                model_name=llm_config.get("model_name", "meta-llama/Llama-3.1-8B-Instruct"),
-                hf_token=os.environ.get("HUGGINGFACE_TOKEN", "") or os.environ.get("HF_TOKEN", ""),
-                max_tokens=llm_config.get("max_new_tokens", 1024),
-                temperature=llm_config.get("temperature", 0.3),
-            )
-            logger.info(f"LLM initialized: {llm.model_name}")
+    with _orchestrator_lock:
+        if _orchestrator is None:
+            config_path = _CONFIG_PATH
 
-        except Exception as e:
-            logger.error(f"Failed to initialize LLM: {e}")
-            raise
+            # Initialize HF Inference LLM (remote API — no local download)
+            try:
+                from rag.hf_inference_llm import HFInferenceLLM
+                from rag.llm_cache import build_response_cache
 
-        _orchestrator = LegalAgentOrchestrator(
-            config_path=config_path,
-            llm=llm,
-        )
-        logger.info("LegalAgentOrchestrator initialized")
+                with open(config_path, "r") as f:
+                    config = json.load(f)
+
+                llm_config = config.get("llm", {})
+                llm = HFInferenceLLM(
+                    model_name=llm_config.get("model_name", "meta-llama/Llama-3.1-8B-Instruct"),
+                    hf_token=os.environ.get("HUGGINGFACE_TOKEN", "") or os.environ.get("HF_TOKEN", ""),
+                    max_tokens=llm_config.get("max_new_tokens", 1024),
+                    temperature=llm_config.get("temperature", 0.3),
+                    context_window=llm_config.get("context_window", 4096),
+                    response_cache=build_response_cache(
+                        llm_config.get("response_cache", {}), os.path.dirname(os.path.abspath(config_path))
+                    ),
+                    **llm_config.get("http", {}),
+                )
+                logger.info(f"LLM initialized: {llm.model_name}")
+
+            except Exception as e:
+                logger.error(f"Failed to initialize LLM: {e}")
+                raise
+
+            _orchestrator = LegalAgentOrchestrator(
+                config_path=config_path,
+                llm=llm,
+            )
+            logger.info("LegalAgentOrchestrator initialized")
 
-    return _orchestrator
+        return _orchestrator
 
 
 class AdvisoryService:
@@ -69,49 +111,98 @@ class AdvisoryService:
                from general knowledge with disclaimer
             4. Synthesizer → generates final advisory (via Llama-3.1-8B)
 
+        If the pipeline is disabled (advisory.pipeline = "fallback"), fails,
+        or would miss the request deadline, the keyword-based fallback
+        advisory is returned right away.
+
         Args:
             query_text: The client's description of their legal situation
             user_id: Optional user ID for session tracking
             history: Optional list of previous chat messages
 
         Returns:
-            (result_dict, None) on success
-            (None, error_string) on failure
+            (result_dict, None) — result_dict["servedBy"] is "rag",
+            "llm_fallback", "general", "answer_cache" or "keyword_fallback"
+        """
+        settings = _get_advisory_config()
+        if settings.get("pipeline", "rag") != "rag":
+            return _fallback_result(query_text), None
+
+        deadline = Deadline(settings.get("deadline_seconds", 8.0))
+        try:
+            orchestrator = _get_orchestrator()
+            result = get_async_runner().run(
+                orchestrator.run_async(query=query_text, history=history or [], deadline=deadline),
+                timeout=max(deadline.remaining(), 0.0) + 1.0,
+            )
+            return _build_advisory_result(
+                query_text, result.get("answer", ""), result.get("sources", []), result.get("served_by", "rag")
+            ), None
+        except TimeoutError as e:
+            logger.warning(f"[DEADLINE] {e} — serving the keyword fallback")
+        except Exception as e:
+            logger.error(f"Advisory generation failed: {e}")
+
+        return _fallback_result(query_text), None
+
+    @staticmethod
+    def stream_query(query_text, user_id=None, history=None):
         """
-        # ── RAG pipeline skipped — using hardcoded responses ──
-        # To re-enable the full RAG/LLM pipeline, uncomment the block below
-        # and remove the early return.
-        #
-        # try:
-        #     orchestrator = _get_orchestrator()
-        #     loop = None
-        #     try:
-        #         loop = asyncio.get_running_loop()
-        #     except RuntimeError:
-        #         pass
-        #     if loop and loop.is_running():
-        #         import nest_asyncio
-        #         nest_asyncio.apply()
-        #     result = asyncio.run(
-        #         orchestrator.run_async(query=query_text, history=history or [])
-        #     )
-        #     answer = result.get("answer", "")
-        #     sources = result.get("sources", [])
-        #     area = classify_legal_domain(query_text)
-        #     steps = _extract_steps(answer)
-        #     relevant_statutes = [s["source"] for s in sources if s.get("source")]
-        #     return {
-        #         "area": area, "analysis": answer, "steps": steps,
-        #         "relevantStatutes": relevant_statutes, "sources": sources,
-        #         "disclaimer": "This is an AI-generated preliminary advisory...",
-        #     }, None
-        # except Exception as e:
-        #     logger.error(f"Advisory generation failed: {e}")
-
-        logger.info("Using hardcoded fallback response (RAG pipeline skipped)")
-        import time
-        time.sleep(5)
-        return _generate_fallback_response(query_text), None
+        Stream a legal query through the Agentic RAG pipeline.
+
+        Yields (event, data) pairs for Server-Sent Events:
+            ("sources", [...])  retrieved sources, before generation starts
+            ("token", "...")    answer text as the LLM generates it
+            ("done", {...})     the full advisory (same fields as process_query)
+            ("error", {...})    the pipeline failed; if nothing was streamed
+                                yet, "done" follows with the fallback advisory
+
+        The deadline applies up to the first token.
+        """
+        settings = _get_advisory_config()
+        if settings.get("pipeline", "rag") != "rag":
+            yield "done", _fallback_result(query_text)
+            return
+
+        streamed = False
+        try:
+            orchestrator = _get_orchestrator()
+            stream = orchestrator.stream_async(
+                query=query_text, history=history or [], deadline=Deadline(settings.get("deadline_seconds", 8.0))
+            )
+            for event, data in get_async_runner().iterate(stream):
+                if event == "done":
+                    data = _build_advisory_result(query_text, data["answer"], data["sources"], data["served_by"])
+                streamed = streamed or event == "token"
+                yield event, data
+        except Exception as e:
+            logger.error(f"Advisory streaming failed: {e}")
+            yield "error", {"error": str(e)}
+            if not streamed:
+                yield "done", _fallback_result(query_text)
+
+
+def _build_advisory_result(query_text: str, answer: str, sources: list, served_by: str) -> dict:
+    """Shape an orchestrator answer into the advisory response fields."""
+    get_counter(f"advisory.served_by.{served_by}").inc()
+    return {
+        "area": classify_legal_domain(query_text),
+        "analysis": answer,
+        "steps": _extract_steps(answer),
+        "relevantStatutes": [s["source"] for s in sources if s.get("source")],
+        "sources": sources,
+        "disclaimer": (
+            "This is an AI-generated preliminary advisory and does not constitute "
+            "legal advice. Please consult a qualified lawyer for professional guidance."
+        ),
+        "servedBy": served_by,
+    }
+
+
+def _fallback_result(query_text: str) -> dict:
+    """The keyword-based fallback advisory, tagged as such."""
+    get_counter("advisory.served_by.keyword_fallback").inc()
+    return {**_generate_fallback_response(query_text), "servedBy": "keyword_fallback"}
 
 
 def _extract_steps(answer: str) -> list:
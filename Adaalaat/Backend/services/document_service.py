@@ -4,8 +4,7 @@ Handles RAG-based document drafting, listing, and sending.
 """
 
 from database.supabase_client import get_supabase_client
-from rag.retriever import retrieve_relevant_docs
-from rag.embeddings import embed_query
+from rag.retriever import retrieve_relevant_docs_multi
 from rag.generator import generate_document_draft
 
 
@@ -17,8 +16,8 @@ class DocumentService:
         Generate a legal document draft using RAG.
 
         Pipeline:
-            1. Embed the context + document type into a query vector
-            2. Retrieve relevant document templates from Qdrant
+            1. Build search queries from the context + document type
+            2. Retrieve relevant templates/sections for all queries in one batch
             3. LLM generates a tailored draft
             4. Store draft metadata in Supabase
 
@@ -33,12 +32,11 @@ class DocumentService:
             (None, error_string) on failure
         """
         try:
-            # Step 1: Build a search query combining type and context
-            search_query = f"{document_type}: {context}"
-            query_vector = embed_query(search_query)
+            # Step 1: Build search queries combining type and context
+            search_queries = [f"{document_type}: {context}", context]
 
             # Step 2: Retrieve relevant templates/sections
-            retrieved_docs = retrieve_relevant_docs(query_vector, top_k=3)
+            retrieved_docs = retrieve_relevant_docs_multi(search_queries, top_k=3)
 
             # Step 3: Generate draft via LLM
             draft = generate_document_draft(
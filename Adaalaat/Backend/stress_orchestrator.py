@@ -0,0 +1,178 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+# Add the Backend directory to the Python path so we can import rag modules
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llama_index.core.llms import ChatMessage, ChatResponse
+
+from rag import local_pdf_retriever
+from rag.legal_agent_orchestrator import LegalAgentOrchestrator
+from utils.async_runner import AsyncRunner
+
+# The pipeline logs every request; only report the results
+logging.basicConfig(level=logging.WARNING, format="%(levelname)s: %(message)s")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+
+def _jitter(max_ms):
+    return random.uniform(0, max_ms) / 1000
+
+
+class StubLLM:
+    """
+    Offline stand-in for HFInferenceLLM with random latency.
+
+    The decider answers GENERAL for every fifth request and LEGAL_RAG
+    otherwise; the synthesizer echoes the question it was asked.
+    """
+
+    api_model = "stress-stub"
+    metadata = SimpleNamespace(model_name="stress-stub", context_window=8192, num_output=512)
+
+    def __init__(self, max_latency_ms):
+        self.max_latency_ms = max_latency_ms
+
+    def _reply(self, messages):
+        query = messages[-1].content
+        if messages[0].content.startswith("You are the routing agent"):
+            request_id = int(query.split()[1].rstrip(":"))
+            decision = "GENERAL" if request_id % 5 == 0 else "LEGAL_RAG"
+            return f'{{"decision": "{decision}", "search_query": "{query}"}}'
+        return f"Advisory for: {query}"
+
+    async def achat(self, messages, **kwargs):
+        await asyncio.sleep(_jitter(self.max_latency_ms))
+        return ChatResponse(message=ChatMessage(role="assistant", content=self._reply(messages)))
+
+    async def astream_chat(self, messages, **kwargs):
+        content = self._reply(messages)
+
+        async def gen():
+            for word in content.split(" "):
+                await asyncio.sleep(_jitter(self.max_latency_ms) / 10)
+                yield SimpleNamespace(delta=word + " ")
+
+        return gen()
+
+
+class StressOrchestrator(LegalAgentOrchestrator):
+    """The real pipeline over a fake index: each request's chunks are tagged with its id."""
+
+    def __init__(self, llm, max_latency_ms):
+        super().__init__(CONFIG_PATH, llm)
+        # Both need the embedding API; the pipeline state under test does not
+        self.answer_cache = None
+        self.router = None
+        self.max_latency_ms = max_latency_ms
+
+    def _search_legal_database(self, queries, stop=None):
+        time.sleep(_jitter(self.max_latency_ms))
+        request_id = queries[0].split()[1].rstrip(":")
+        return [
+            {"source": f"stress-{request_id}-{n}.pdf", "score": 1.0 - n / 10, "text": f"Passage {n} for {request_id}."}
+            for n in range(3)
+        ]
+
+    async def _rewrite_matches(self, query, search_query, query_embedding):
+        # Exercise both the reuse and the re-run path of speculative retrieval
+        return random.random() < 0.5
+
+
+def make_query(request_id):
+    return f"Request {request_id}: can my landlord evict me without notice?"
+
+
+def check_result(request_id, result):
+    """Error messages for a result that does not belong to `request_id` (empty if it does)."""
+    errors = []
+    if make_query(request_id) not in result["answer"]:
+        errors.append(f"answer {result['answer'][:60]!r}")
+    expected_general = request_id % 5 == 0
+    if result["served_by"] != ("general" if expected_general else "rag"):
+        errors.append(f"served_by {result['served_by']!r}")
+    foreign = [s["source"] for s in result["sources"] if not s["source"].startswith(f"stress-{request_id}-")]
+    if foreign:
+        errors.append(f"sources from other requests {foreign}")
+    if not expected_general and not result["sources"]:
+        errors.append("no sources")
+    return [f"request {request_id}: {e}" for e in errors]
+
+
+async def _collect_stream(orchestrator, query):
+    sources, result = None, None
+    async for event, data in orchestrator.stream_async(query):
+        if event == "sources":
+            sources = data
+        elif event == "done":
+            result = data
+    if sources != result["sources"]:
+        result = {**result, "answer": f"streamed sources {sources} != final {result['sources']}"}
+    return result
+
+
+def run_asyncio(orchestrator, requests):
+    """All requests as tasks on one event loop."""
+    async def main():
+        return await asyncio.gather(*(orchestrator.run_async(make_query(i)) for i in requests))
+    return asyncio.run(main())
+
+
+def run_threads(orchestrator, requests, concurrency, stream=False):
+    """Flask-style: worker threads submitting to the shared background loop."""
+    runner = AsyncRunner(max_concurrency=concurrency)
+
+    def handle(request_id):
+        if stream:
+            return runner.run(_collect_stream(orchestrator, make_query(request_id)))
+        return runner.run(orchestrator.run_async(make_query(request_id)))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(handle, requests))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that concurrent requests never see each other's results")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per mode")
+    parser.add_argument("--concurrency", type=int, default=64, help="Worker threads / runner slots")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Max random latency of each stub call")
+    parser.add_argument("--mode", choices=["asyncio", "threads", "stream", "all"], default="all")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    # Nothing to pre-load: retrieval is stubbed
+    local_pdf_retriever._ensure_loaded = lambda: None
+    orchestrator = StressOrchestrator(StubLLM(args.latency_ms), args.latency_ms)
+
+    modes = ["asyncio", "threads", "stream"] if args.mode == "all" else [args.mode]
+    failures = 0
+    for mode in modes:
+        request_ids = list(range(1, args.requests + 1))
+        start = time.perf_counter()
+        if mode == "asyncio":
+            results = run_asyncio(orchestrator, request_ids)
+        else:
+            results = run_threads(orchestrator, request_ids, args.concurrency, stream=mode == "stream")
+        elapsed = time.perf_counter() - start
+
+        errors = [e for i, r in zip(request_ids, results) for e in check_result(i, r)]
+        failures += len(errors)
+        for error in errors[:10]:
+            logger.error(f"[{mode}] {error}")
+        logger.info(
+            f"{mode:<8} {len(request_ids)} requests in {elapsed:.2f}s — "
+            f"{'OK' if not errors else f'{len(errors)} mismatches'}"
+        )
+
+    sys.exit(1 if failures else 0)
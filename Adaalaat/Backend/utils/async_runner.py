@@ -0,0 +1,172 @@
+"""
+Background event loop for running async code from sync Flask handlers.
+
+Each worker process keeps one event loop on a daemon thread. Handlers
+submit coroutines with run() (or async generators with iterate()) and
+block until the result is ready, so async HTTP clients, micro-batchers
+and caches bound to the loop live across requests instead of being
+rebuilt by asyncio.run() every time.
+
+A semaphore on the loop bounds how many submissions run at once; the
+rest wait their turn. The loop is started lazily and restarted after a
+fork (gunicorn preloading), since threads do not survive fork().
+"""
+
+import os
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRunner:
+    """A long-lived event loop thread that runs coroutines for sync callers."""
+
+    def __init__(self, max_concurrency: int = 16, timeout_seconds: float = 120.0):
+        """
+        Args:
+            max_concurrency: Submissions allowed to run on the loop at once
+            timeout_seconds: Default limit for run() and for each item of iterate()
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def serve():
+                    asyncio.set_event_loop(loop)
+                    self._semaphore = asyncio.Semaphore(self.max_concurrency)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=serve, name="async-runner", daemon=True).start()
+                ready.wait()
+                self._loop, self._pid = loop, os.getpid()
+                logger.info(f"[RUNNER] Event loop started (pid {self._pid}, max {self.max_concurrency} concurrent)")
+            return self._loop
+
+    async def _guarded(self, awaitable: Awaitable) -> Any:
+        async with self._semaphore:
+            return await awaitable
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the background loop and wait for its result.
+
+        Raises:
+            TimeoutError: if it takes longer than `timeout` (it is cancelled)
+        """
+        loop = self._ensure_loop()
+        if _running_loop() is loop:
+            raise RuntimeError("AsyncRunner.run() called from its own event loop; await the coroutine instead")
+
+        future = asyncio.run_coroutine_threadsafe(self._guarded(coro), loop)
+        try:
+            return future.result(timeout or self.timeout_seconds)
+        except concurrent.futures.TimeoutError:
+            if future.done():
+                raise  # a TimeoutError raised by the coroutine itself
+            future.cancel()
+            raise TimeoutError(f"Timed out after {timeout or self.timeout_seconds}s")
+
+    def iterate(self, agen: AsyncIterator, timeout: Optional[float] = None) -> Iterator:
+        """
+        Iterate an async generator from sync code, holding one concurrency
+        slot until it finishes. `timeout` applies to each item.
+        """
+        loop = self._ensure_loop()
+
+        async def guarded():
+            async with self._semaphore:
+                try:
+                    async for item in agen:
+                        yield item
+                finally:
+                    await agen.aclose()
+
+        stream = guarded()
+        limit = timeout or self.timeout_seconds
+
+        async def next_item():
+            # Timed on the loop, so a timed-out step is cancelled and finished before aclose()
+            step = asyncio.ensure_future(stream.__anext__())
+            done, _ = await asyncio.wait({step}, timeout=limit)
+            if not done:
+                step.cancel()
+                await asyncio.gather(step, return_exceptions=True)
+                raise TimeoutError(f"No stream event within {limit}s")
+            return step.result()
+
+        try:
+            while True:
+                future = asyncio.run_coroutine_threadsafe(next_item(), loop)
+                try:
+                    # The extra second only matters if the loop itself is stuck
+                    yield future.result(limit + 1.0)
+                except StopAsyncIteration:
+                    return
+                except concurrent.futures.TimeoutError:
+                    if future.done():
+                        raise
+                    future.cancel()
+                    raise TimeoutError(f"No stream event within {limit}s")
+        finally:
+            # Also runs when the consumer stops early (e.g. the client disconnected);
+            # a failure to close must not hide the error that ended the stream
+            try:
+                asyncio.run_coroutine_threadsafe(stream.aclose(), loop).result(limit)
+            except Exception as e:
+                logger.debug(f"[RUNNER] Closing stream failed: {e!r}")
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+_runner: Optional[AsyncRunner] = None
+_runner_lock = threading.Lock()
+
+
+def get_async_runner() -> AsyncRunner:
+    """This process's shared runner, configured from config.json `async_runner`."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            import json
+
+            config_path = os.path.join(os.path.dirname(__file__), "..", "config.json")
+            try:
+                with open(config_path, "r") as f:
+                    settings = json.load(f).get("async_runner", {})
+            except Exception:
+                settings = {}
+            _runner = AsyncRunner(
+                max_concurrency=settings.get("max_concurrency", 16),
+                timeout_seconds=settings.get("timeout_seconds", 120.0),
+            )
+        return _runner
+
+
+def _reset_after_fork():
+    # The loop is restarted on the next run(); only the locks need replacing
+    global _runner_lock
+    _runner_lock = threading.Lock()
+    if _runner is not None:
+        _runner._lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
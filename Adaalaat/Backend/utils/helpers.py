@@ -5,6 +5,39 @@ Shared utility functions for the Adaalat backend.
 import re
 from datetime import datetime
 
+# Keyword table per legal domain — used by classify_legal_domain and by the
+# local query router (rag/query_router.py)
+DOMAIN_KEYWORDS = {
+    "Tenancy & Property Law": [
+        "tenant", "landlord", "rent", "eviction", "lease", "property",
+        "housing", "accommodation", "premises",
+    ],
+    "Employment & Labour Law": [
+        "employ", "job", "fired", "termination", "salary", "workplace",
+        "harassment", "labour", "labor", "worker",
+    ],
+    "Family & Matrimonial Law": [
+        "divorce", "custody", "marriage", "alimony", "domestic",
+        "child", "spouse", "maintenance",
+    ],
+    "Consumer Protection": [
+        "consumer", "product", "refund", "defective", "warranty",
+        "complaint", "service", "seller",
+    ],
+    "Cyber Crime & IT Law": [
+        "cyber", "online", "fraud", "hacking", "phishing", "internet",
+        "digital", "data", "privacy", "identity theft",
+    ],
+    "Criminal Law": [
+        "criminal", "theft", "assault", "murder", "robbery", "cheating",
+        "forgery", "bail", "arrest", "fir",
+    ],
+    "Civil Law": [
+        "civil", "dispute", "agreement", "contract", "breach",
+        "damages", "compensation", "injunction",
+    ],
+}
+
 
 def classify_legal_domain(text):
     """
@@ -21,38 +54,7 @@ def classify_legal_domain(text):
     """
     text_lower = text.lower()
 
-    domain_keywords = {
-        "Tenancy & Property Law": [
-            "tenant", "landlord", "rent", "eviction", "lease", "property",
-            "housing", "accommodation", "premises",
-        ],
-        "Employment & Labour Law": [
-            "employ", "job", "fired", "termination", "salary", "workplace",
-            "harassment", "labour", "labor", "worker",
-        ],
-        "Family & Matrimonial Law": [
-            "divorce", "custody", "marriage", "alimony", "domestic",
-            "child", "spouse", "maintenance",
-        ],
-        "Consumer Protection": [
-            "consumer", "product", "refund", "defective", "warranty",
-            "complaint", "service", "seller",
-        ],
-        "Cyber Crime & IT Law": [
-            "cyber", "online", "fraud", "hacking", "phishing", "internet",
-            "digital", "data", "privacy", "identity theft",
-        ],
-        "Criminal Law": [
-            "criminal", "theft", "assault", "murder", "robbery", "cheating",
-            "forgery", "bail", "arrest", "fir",
-        ],
-        "Civil Law": [
-            "civil", "dispute", "agreement", "contract", "breach",
-            "damages", "compensation", "injunction",
-        ],
-    }
-
-    for domain, keywords in domain_keywords.items():
+    for domain, keywords in DOMAIN_KEYWORDS.items():
         if any(kw in text_lower for kw in keywords):
             return domain
 
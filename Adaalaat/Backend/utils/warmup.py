@@ -0,0 +1,212 @@
+"""
+Start-up warm-up and readiness.
+
+The heavy singletons (embedding client, corpus index, orchestrator and
+its LLM client, Supabase client) are otherwise built by the first
+request that needs them. With config.json `warmup.enabled`, create_app()
+builds them on a daemon thread right away and then sends one priming
+query through the whole pipeline, so the first real requests find warm
+caches and open connections.
+
+/api/ready reports each component's state and answers 503 until every
+`warmup.required` component is ready, so a load balancer only routes to
+warm workers. A failed step is retried `max_attempts` times; requests
+that arrive meanwhile still initialize what they need themselves.
+
+Under gunicorn --preload the master warms up before forking. The
+singletons drop their threads, locks and connections in each child
+(os.register_at_fork hooks in their modules). So a worker starts over
+from "pending" and warms every component again on its first readiness
+check, rather than reporting the parent's state.
+"""
+
+import os
+import copy
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from config import load_json_config
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COMPONENTS = ["embedding", "index", "orchestrator", "priming", "database"]
+DEFAULT_PRIMING_QUERY = "My landlord wants to evict me without notice. What are my rights?"
+
+
+# ── Warm-up steps ───────────────────────────────────────────────
+
+def _warm_embedding(settings: Dict):
+    from rag.embedding_manager import get_shared_embedding_model
+
+    # A real call opens the API client (or loads the local model)
+    get_shared_embedding_model().get_query_embedding_batch(["warm-up"])
+
+
+def _warm_index(settings: Dict):
+    from rag.local_pdf_retriever import _ensure_loaded
+
+    _ensure_loaded()
+
+
+def _warm_orchestrator(settings: Dict):
+    from services.advisory_service import _get_orchestrator
+
+    _get_orchestrator()
+
+
+def _warm_database(settings: Dict):
+    from database.supabase_client import get_supabase_client
+
+    get_supabase_client()
+
+
+def _warm_priming(settings: Dict):
+    from rag.deadline import Deadline
+    from services.advisory_service import _get_orchestrator
+    from utils.async_runner import get_async_runner
+
+    timeout = settings.get("priming_timeout_seconds", 30.0)
+    query = settings.get("priming_query", DEFAULT_PRIMING_QUERY)
+    get_async_runner().run(
+        _get_orchestrator().run_async(query=query, deadline=Deadline(timeout)),
+        timeout=timeout + 1.0,
+    )
+
+
+_STEPS: Dict[str, Callable[[Dict], None]] = {
+    "embedding": _warm_embedding,
+    "index": _warm_index,
+    "orchestrator": _warm_orchestrator,
+    "database": _warm_database,
+    "priming": _warm_priming,
+}
+
+
+class Warmup:
+    """Runs the warm-up steps in order on a background thread and tracks their state."""
+
+    def __init__(self, components: List[str], required: List[str], settings: Optional[Dict] = None,
+                 max_attempts: int = 3, retry_delay_seconds: float = 5.0):
+        """
+        Args:
+            components: Steps to run, in order (see _STEPS)
+            required: Components that must be ready before /api/ready reports ready
+            settings: config.json `warmup` section (priming query and timeout)
+            max_attempts: Tries per step before it is reported as failed
+            retry_delay_seconds: Pause between tries
+        """
+        unknown = [name for name in components if name not in _STEPS]
+        if unknown:
+            raise ValueError(f"Unknown warm-up components: {unknown}")
+
+        self.components = list(components)
+        self.required = [name for name in required if name in self.components]
+        self.settings = settings or {}
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_delay_seconds = retry_delay_seconds
+        self._status = {name: {"state": "pending"} for name in self.components}
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._pid is not None
+
+    def start(self):
+        """Start warming up in this process (no-op if already started here)."""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+        logger.info(f"[WARMUP] Started (pid {self._pid}): {', '.join(self.components)}")
+
+    def _set(self, name: str, **fields):
+        with self._lock:
+            self._status[name] = fields
+
+    def _after_fork(self):
+        # The parent's states describe the parent's objects, and its warm-up thread is gone
+        self._lock = threading.Lock()
+        self._status = {name: {"state": "pending"} for name in self.components}
+
+    def _run(self):
+        start = time.perf_counter()
+        for name in self.components:
+            self._warm(name)
+        logger.info(f"[WARMUP] Finished in {time.perf_counter() - start:.2f}s")
+
+    def _warm(self, name: str):
+        for attempt in range(1, self.max_attempts + 1):
+            self._set(name, state="warming", attempts=attempt)
+            step_start = time.perf_counter()
+            try:
+                _STEPS[name](self.settings)
+            except Exception as e:
+                last_try = attempt == self.max_attempts
+                self._set(name, state="failed" if last_try else "warming", attempts=attempt, error=str(e))
+                logger.warning(f"[WARMUP] {name} failed (attempt {attempt}/{self.max_attempts}): {e}")
+                if not last_try:
+                    time.sleep(self.retry_delay_seconds)
+                continue
+
+            seconds = round(time.perf_counter() - step_start, 3)
+            self._set(name, state="ready", attempts=attempt, seconds=seconds)
+            logger.info(f"[WARMUP] {name} ready in {seconds:.2f}s")
+            return
+
+    def readiness(self) -> Dict:
+        """
+        Per-component state ("pending", "warming", "ready", "failed").
+
+        Returns:
+            {"ready", "warmup", "components"} — ready is True once every
+            required component is ready, or always if warm-up is off
+        """
+        if self.started and self._pid != os.getpid():
+            self.start()  # forked after start-up (e.g. gunicorn --preload)
+
+        if not self.started:
+            return {"ready": True, "warmup": "off", "components": {}}
+
+        with self._lock:
+            components = copy.deepcopy(self._status)
+        settled = all(status["state"] in ("ready", "failed") for status in components.values())
+        return {
+            "ready": all(components[name]["state"] == "ready" for name in self.required),
+            "warmup": "done" if settled else "running",
+            "components": components,
+        }
+
+
+_warmup: Optional[Warmup] = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> Warmup:
+    """This process's warm-up tracker, configured from config.json `warmup`."""
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            settings = load_json_config().get("warmup", {})
+            _warmup = Warmup(
+                components=settings.get("components", DEFAULT_COMPONENTS),
+                required=settings.get("required", ["index", "orchestrator"]),
+                settings=settings,
+                max_attempts=settings.get("max_attempts", 3),
+                retry_delay_seconds=settings.get("retry_delay_seconds", 5.0),
+            )
+        return _warmup
+
+
+def _reset_after_fork():
+    global _warmup_lock
+    _warmup_lock = threading.Lock()
+    if _warmup is not None:
+        _warmup._after_fork()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)